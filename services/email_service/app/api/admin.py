@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from app.config.settings import settings
+from app.observability import profiler
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin")
+
+
+async def drain_service(app: FastAPI, timeout: float) -> Dict[str, Any]:
+    """Put the instance in drain mode: readiness fails, the consumer stops and status writes are flushed.
+
+    Safe to call more than once (e.g. from a preStop hook and again on shutdown).
+    """
+    app.state.draining = True
+    drained = True
+    consumer = getattr(app.state, "email_consumer", None)
+    if consumer is not None:
+        drained = await asyncio.to_thread(consumer.drain, timeout)
+        if not drained:
+            logger.warning("Consumer drain hit its %.0fs deadline; unfinished deliveries were requeued", timeout)
+
+    store = getattr(app.state, "status_store", None)
+    if store is not None:
+        try:
+            await asyncio.to_thread(store.flush)
+        except Exception as exc:
+            logger.error("Could not flush pending status writes: %s", exc)
+    return {"drained": drained, "consumer": consumer.health() if consumer is not None else None}
+
+
+@router.post("/drain")
+async def drain(request: Request, timeout: Optional[float] = None):
+    """Stop taking new work ahead of a shutdown (e.g. from a Kubernetes preStop hook)."""
+    return await drain_service(request.app, timeout if timeout is not None else settings.drain_timeout)
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(10.0, ge=1),
+    thread: Optional[str] = None,
+) -> str:
+    """Sample this process's stacks and return them collapsed, ready for flamegraph.pl or speedscope.
+
+    Pass ``thread=email-consumer`` to profile only the embedded consumer (its loop and I/O threads).
+    """
+    seconds = min(seconds, settings.profile_max_seconds)
+    try:
+        counts = await asyncio.to_thread(profiler.sample_stacks, seconds, interval_ms / 1000, thread)
+    except profiler.ProfilerBusy as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    return profiler.collapse(counts)
@@ -1,14 +1,110 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 from datetime import datetime
+from typing import Any, Dict, List, Optional
 from app.config.settings import settings
+from app.observability import health, metrics
 
 router = APIRouter()
 
+
+def _consumer_alive(request: Request) -> Optional[bool]:
+    """None when no consumer runs in this process."""
+    thread = getattr(request.app.state, "consumer_thread", None)
+    if thread is None:
+        return None
+    consumer = request.app.state.email_consumer
+    # A consumer that gave up reconnecting stays dead until the process restarts.
+    return thread.is_alive() or consumer.draining
+
+
+def _pool_saturation() -> Dict[str, Dict[str, Any]]:
+    pools: Dict[str, Dict[str, Any]] = {}
+    for source, stats in metrics.snapshot("smtp_pool").items():
+        pools[f"smtp:{source}"] = {
+            "in_use": stats["in_use"],
+            "max_size": stats["max_size"],
+            "saturation": round(stats["in_use"] / stats["max_size"], 3),
+        }
+    for source, stats in metrics.snapshot("status_store").items():
+        if stats.get("write_behind"):
+            pools[f"status_queue:{source}"] = {
+                "depth": stats["queue_depth"],
+                "max_pending": stats["max_pending"],
+                "saturation": round(stats["queue_depth"] / stats["max_pending"], 3),
+            }
+    return pools
+
+
 @router.get("/health")
-async def health_check():
-    return {
-        "status": "healthy",
-        "service": settings.service_name,
-        "timestamp": datetime.utcnow().isoformat(),
-        "version": "1.0.0"
-    }
\ No newline at end of file
+async def health_check(request: Request):
+    alive = _consumer_alive(request) is not False
+    return JSONResponse(
+        status_code=200 if alive else 503,
+        content={
+            "status": "healthy" if alive else "unhealthy",
+            "service": settings.service_name,
+            "timestamp": datetime.utcnow().isoformat(),
+            "version": "1.0.0"
+        },
+    )
+
+
+@router.get("/health/live")
+async def liveness(request: Request):
+    """Fails only when a restart would help: the embedded consumer thread has died."""
+    consumer_alive = _consumer_alive(request)
+    alive = consumer_alive is not False
+    return JSONResponse(
+        status_code=200 if alive else 503,
+        content={
+            "status": "alive" if alive else "dead",
+            "consumer_thread_alive": consumer_alive,
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+    )
+
+
+@router.get("/health/ready")
+async def readiness(request: Request):
+    """Whether this instance should receive work.
+
+    Not ready while draining, while the embedded consumer is disconnected or
+    when the status write-behind queue is close to blocking writers. Slow or
+    failing dependencies are reported (``degraded``) but do not fail
+    readiness: every replica shares them, so pulling all of them out of
+    rotation would not help.
+    """
+    consumer = getattr(request.app.state, "email_consumer", None)
+    draining = bool(getattr(request.app.state, "draining", False)) or (consumer is not None and consumer.draining)
+    consumer_health = consumer.health() if consumer is not None else None
+    pools = _pool_saturation()
+    dependencies = await health.check_dependencies()
+
+    reasons: List[str] = []
+    if draining:
+        reasons.append("draining")
+    if consumer_health is not None and not consumer_health["connected"]:
+        reasons.append("consumer_disconnected")
+    for name, pool in pools.items():
+        if name.startswith("status_queue:") and pool["saturation"] >= settings.ready_max_saturation:
+            reasons.append(f"{name}_saturated")
+
+    if reasons:
+        status = "not_ready"
+    elif not all(result["ok"] for result in dependencies.values()):
+        status = "degraded"
+    else:
+        status = "ready"
+    return JSONResponse(
+        status_code=503 if reasons else 200,
+        content={
+            "status": status,
+            "reasons": reasons,
+            "service": settings.service_name,
+            "timestamp": datetime.utcnow().isoformat(),
+            "consumer": consumer_health,
+            "pools": pools,
+            "dependencies": dependencies,
+        },
+    )
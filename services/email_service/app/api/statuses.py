@@ -0,0 +1,120 @@
+import asyncio
+import base64
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, FastAPI, HTTPException, Query, Request
+from pydantic import BaseModel
+
+from app.config.settings import settings
+from app.observability import health, metrics
+from app.services.status_cache import StatusReadCache
+from app.services.status_store import StatusRecord, StatusStore
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/statuses")
+_store_lock = threading.Lock()
+_cache = StatusReadCache()
+metrics.register_stats("status_read_cache", _cache.stats, source="http")
+
+
+class StatusLookupRequest(BaseModel):
+    request_ids: List[str]
+
+
+def shared_status_store(app: FastAPI) -> Optional[StatusStore]:
+    """The HTTP API's StatusStore; None while Postgres is unreachable (retried on the next call)."""
+    with _store_lock:
+        store = getattr(app.state, "status_store", None)
+        if store is None:
+            try:
+                store = StatusStore()
+            except Exception as exc:
+                logger.warning("Status store unavailable: %s", exc)
+                return None
+            app.state.status_store = store
+            metrics.register_stats("status_store", store.stats, source="http")
+            health.register_probe("status_db", store.ping)
+        return store
+
+
+async def _store(request: Request) -> StatusStore:
+    store = await asyncio.to_thread(shared_status_store, request.app)
+    if store is None:
+        raise HTTPException(status_code=503, detail="status store unavailable")
+    return store
+
+
+async def _lookup(store: StatusStore, request_ids: List[str]) -> Dict[str, StatusRecord]:
+    found: Dict[str, StatusRecord] = {}
+    missing = []
+    for request_id in request_ids:
+        cached = _cache.get(request_id)
+        if cached is not None:
+            found[request_id] = cached
+        else:
+            missing.append(request_id)
+    if missing:
+        loaded = await asyncio.to_thread(store.get_records, missing)
+        _cache.put_many(loaded.values())
+        found.update(loaded)
+    return found
+
+
+def _encode_cursor(record: StatusRecord) -> str:
+    raw = json.dumps([record["updated_at"].isoformat(), record["request_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        updated_at, request_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), str(request_id)
+    except (ValueError, TypeError) as exc:
+        raise HTTPException(status_code=400, detail="invalid cursor") from exc
+
+
+@router.get("")
+async def list_statuses(
+    request: Request,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1),
+) -> Dict[str, Any]:
+    """Newest first; pass ``next_cursor`` back as ``cursor`` for the next page."""
+    limit = min(limit, settings.status_page_max)
+    after = _decode_cursor(cursor) if cursor else None
+    store = await _store(request)
+    items = await asyncio.to_thread(store.list_records, status, since, until, after, limit)
+    return {
+        "items": items,
+        "next_cursor": _encode_cursor(items[-1]) if len(items) == limit else None,
+    }
+
+
+@router.post("/lookup")
+async def lookup_statuses(request: Request, body: StatusLookupRequest) -> Dict[str, Any]:
+    request_ids = list(dict.fromkeys(body.request_ids))
+    if len(request_ids) > settings.status_lookup_max_ids:
+        raise HTTPException(
+            status_code=400, detail=f"at most {settings.status_lookup_max_ids} request_ids per lookup"
+        )
+    found = await _lookup(await _store(request), request_ids)
+    return {
+        "statuses": found,
+        "missing": [request_id for request_id in request_ids if request_id not in found],
+    }
+
+
+@router.get("/{request_id}")
+async def get_status(request: Request, request_id: str) -> StatusRecord:
+    found = await _lookup(await _store(request), [request_id])
+    if request_id not in found:
+        raise HTTPException(status_code=404, detail="status not found")
+    return found[request_id]
@@ -1,20 +1,169 @@
 import httpx
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, Tuple
 import logging
+import threading
+import time
 
 from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+CacheKey = Tuple[str, str]
+
+
+class TemplateNotFoundError(LookupError):
+    pass
+
+
+class _CacheEntry:
+    __slots__ = ("template", "error", "fetched_at")
+
+    def __init__(self, template: Optional[Dict[str, Any]], error: Optional[Exception] = None) -> None:
+        self.template = template
+        self.error = error
+        self.fetched_at = time.monotonic()
+
 
 class TemplateClient:
+    """Resolves active templates by (slug, locale) through a local cache.
+
+    Entries are fresh for ``cache_ttl`` seconds, then served stale for up to
+    ``cache_stale_ttl`` more seconds while a background refresh runs. Missing
+    templates are remembered for ``cache_negative_ttl`` seconds. Concurrent
+    misses for the same key share a single upstream request.
+    """
+
     def __init__(self) -> None:
         self.base_url = settings.template_service_url.rstrip("/")
+        self.cache_size = max(1, settings.template_cache_size)
+        self.cache_ttl = settings.template_cache_ttl
+        self.cache_stale_ttl = settings.template_cache_stale_ttl
+        self.cache_negative_ttl = settings.template_cache_negative_ttl
+
+        self._http = httpx.Client(
+            timeout=5.0,
+            limits=httpx.Limits(
+                max_connections=settings.template_http_max_connections,
+                max_keepalive_connections=settings.template_http_max_connections,
+            ),
+        )
+        self._cache: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="template-refresh")
+
+        self._hits = 0
+        self._stale_hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._upstream_calls = 0
 
     def get_active_template(self, slug: str, locale: Optional[str]) -> Dict[str, Any]:
         if not slug:
             raise ValueError("template slug/code is required")
 
+        key = (slug, locale or "")
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry.fetched_at
+                if entry.error is not None:
+                    if age < self.cache_negative_ttl:
+                        self._negative_hits += 1
+                        self._cache.move_to_end(key)
+                        raise TemplateNotFoundError(str(entry.error))
+                elif age < self.cache_ttl:
+                    self._hits += 1
+                    self._cache.move_to_end(key)
+                    return dict(entry.template)
+                elif age < self.cache_ttl + self.cache_stale_ttl:
+                    self._stale_hits += 1
+                    self._cache.move_to_end(key)
+                    if key not in self._inflight:
+                        self._refresher.submit(self._refresh, key)
+                    return dict(entry.template)
+            self._misses += 1
+
+        return dict(self._load(key))
+
+    def invalidate(self, slug: Optional[str] = None, locale: Optional[str] = None) -> None:
+        with self._lock:
+            if slug is None:
+                self._cache.clear()
+            else:
+                self._cache.pop((slug, locale or ""), None)
+
+    def ping(self) -> None:
+        response = self._http.get(f"{self.base_url}/v1/health", timeout=settings.health_probe_timeout)
+        response.raise_for_status()
+
+    def close(self) -> None:
+        self._refresher.shutdown(wait=False)
+        self._http.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "max_size": self.cache_size,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "upstream_calls": self._upstream_calls,
+            }
+
+    def _refresh(self, key: CacheKey) -> None:
+        try:
+            self._load(key)
+        except Exception as exc:
+            logger.warning("Background refresh of template %s/%s failed: %s", key[0], key[1] or "-", exc)
+
+    def _load(self, key: CacheKey) -> Dict[str, Any]:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            template = self._fetch(*key)
+        except TemplateNotFoundError as exc:
+            self._store(key, _CacheEntry(None, exc))
+            future.set_exception(exc)
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            self._store(key, _CacheEntry(template))
+            future.set_result(template)
+            return template
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _store(self, key: CacheKey, entry: _CacheEntry) -> None:
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self._evictions += 1
+
+    def _fetch(self, slug: str, locale: str) -> Dict[str, Any]:
         params = {}
         if locale:
             params["locale"] = locale
@@ -22,16 +171,23 @@ class TemplateClient:
         url = f"{self.base_url}/v1/templates/{slug}/active"
         logger.debug("Fetching template from %s", url)
 
-        with httpx.Client(timeout=5.0) as client:
-            response = client.get(url, params=params)
-            response.raise_for_status()
+        with self._lock:
+            self._upstream_calls += 1
+        response = self._http.get(url, params=params)
+        if response.status_code == 404:
+            raise TemplateNotFoundError(f"template {slug} not found")
+        response.raise_for_status()
 
         payload = response.json()
         if not payload.get("success"):
+            error = payload.get("error") or payload.get("message") or "template service error"
+            if "not found" in str(error).lower():
+                raise TemplateNotFoundError(f"template {slug} not found: {error}")
             raise RuntimeError(payload.get("message") or "template service error")
 
         data = payload.get("data") or {}
         return {
             "subject": data.get("subject") or slug,
             "body": data.get("body") or "",
+            "version_id": data.get("id"),
         }
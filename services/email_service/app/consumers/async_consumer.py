@@ -0,0 +1,359 @@
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional, Set
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.channel import Channel
+
+from app.config.settings import settings
+from app.consumers.base_consumer import EmailConsumer
+from app.consumers.lanes import Lane, LaneScheduler, PendingDelivery
+from app.observability import metrics, tracing
+from app.services.publisher import ConfirmChannel, PublishError
+
+logger = logging.getLogger(__name__)
+
+# The delivery the current dispatch task is running, so _park can hand its slot back and forth.
+_current_delivery: contextvars.ContextVar[Optional[PendingDelivery]] = contextvars.ContextVar(
+    "current_delivery", default=None
+)
+
+
+class AsyncEmailConsumer(EmailConsumer):
+    """EmailConsumer driven by a single long-lived asyncio loop.
+
+    Each priority lane's queue is consumed with its own prefetch; buffered
+    deliveries wait in a LaneScheduler and at most ``max_in_flight`` of them
+    are processed concurrently, started in weighted fair order. Every
+    delivery is acked or nacked on its own once its pipeline run finishes.
+
+    While the SMTP circuit is open nothing new is started; deliveries stay
+    buffered (and the broker stops sending once the prefetch windows are
+    full) until trial sends find the relay healthy again. With an adaptive
+    SMTP limit, a channel-wide prefetch follows it down and back up.
+    """
+
+    def __init__(self, **dependencies: Any) -> None:
+        super().__init__(**dependencies)
+        self.prefetch = sum(lane.prefetch for lane in self.lanes)
+        self.max_in_flight = max(1, settings.consumer_concurrency)
+        self.scheduler = LaneScheduler(self.lanes)
+        metrics.register_stats("lanes", self.scheduler.stats, source="consumer")
+        self._work: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self._channel_prefetch = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.connection: Optional[AsyncioConnection] = None
+        self.channel: Optional[Channel] = None
+        self._confirms: Optional[ConfirmChannel] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._closed: Optional[asyncio.Future] = None
+        self._stopping = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def start_consuming(self) -> bool:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        # Template lookups and status writes are blocking calls; give them
+        # enough threads that they never throttle the in-flight limit.
+        self.loop.set_default_executor(
+            ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="email-consumer-io")
+        )
+        if self.spool_replayer is not None:
+            self.spool_replayer.start()
+        try:
+            return self.loop.run_until_complete(self._run())
+        finally:
+            self.loop.run_until_complete(self.loop.shutdown_default_executor())
+            self.loop.close()
+            self._stopped.set()
+
+    def stop(self) -> None:
+        if self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._request_stop)
+
+    def drain(self, timeout: float) -> bool:
+        """Stop taking deliveries, finish in-flight ones until ``timeout`` and nack the rest.
+
+        Deliveries still running at the deadline are cancelled and requeued;
+        buffered ones that never started are requeued straight away. Pending
+        status writes are flushed before the connection closes. Thread-safe
+        and blocking; returns False if anything had to be requeued.
+        """
+        self.draining = True
+        if self.loop is None or self.loop.is_closed() or not self.loop.is_running():
+            self._stop_spool()
+            self._flush_statuses()
+            tracing.shutdown()
+            return True
+        future = asyncio.run_coroutine_threadsafe(self._drain(timeout), self.loop)
+        try:
+            return future.result(timeout + settings.health_probe_timeout + 5)
+        except Exception as exc:
+            logger.error("Drain did not complete: %s", exc)
+            return False
+
+    async def _drain(self, timeout: float) -> bool:
+        channel = self.channel
+        if channel is not None and channel.is_open:
+            for consumer_tag in list(channel.consumer_tags):
+                await self._call(channel.basic_cancel, consumer_tag=consumer_tag)
+        # Buffered but never started: hand them back for another consumer.
+        for delivery in self.scheduler.clear():
+            self._settle(delivery.channel, delivery.delivery_tag, False, requeue=True)
+        logger.info("Draining %d in-flight deliveries (deadline %.0fs)", len(self._tasks), timeout)
+
+        pending: Set[asyncio.Task] = set()
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning("Requeued %d deliveries still running at the drain deadline", len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        await asyncio.to_thread(self._stop_spool)
+        await asyncio.to_thread(self._flush_statuses)
+        await asyncio.to_thread(tracing.shutdown)
+        self._request_stop()
+        return not pending
+
+    def _request_stop(self) -> None:
+        self._stopping = True
+        if self.connection and not (self.connection.is_closing or self.connection.is_closed):
+            self.connection.close()
+        elif self._closed and not self._closed.done():
+            self._closed.set_result(None)
+
+    async def _run(self) -> bool:
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        while not self._stopping:
+            if not await self._connect_with_retry():
+                return False
+            logger.info(
+                "Async email consumer started on %s (in-flight=%d)",
+                ", ".join(f"{lane.name}={lane.queue} (prefetch={lane.prefetch})" for lane in self.lanes),
+                self.max_in_flight,
+            )
+            watchers = [self.loop.create_task(self._watch_retry_depth())]
+            if self.email_sender.smtp_pool.limit is not None:
+                watchers.append(self.loop.create_task(self._follow_smtp_limit()))
+            await self._closed
+            for watcher in watchers:
+                watcher.cancel()
+            if not self._stopping:
+                logger.warning("RabbitMQ connection lost; reconnecting")
+
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        return True
+
+    async def _connect_with_retry(self) -> bool:
+        backoff = 1.0
+        for attempt in range(1, 6):
+            if self._stopping or self.draining:
+                return False
+            try:
+                await self._open()
+                return True
+            except Exception as exc:
+                logger.warning("RabbitMQ connection attempt %d failed: %s", attempt, exc)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10.0)
+        logger.error("Failed to connect to RabbitMQ after %d attempts", attempt)
+        return False
+
+    async def _open(self) -> None:
+        opened = self.loop.create_future()
+        self._closed = self.loop.create_future()
+
+        def on_open(connection: AsyncioConnection) -> None:
+            if not opened.done():
+                opened.set_result(connection)
+
+        def on_open_error(connection: AsyncioConnection, exc: Exception) -> None:
+            if not opened.done():
+                opened.set_exception(exc if isinstance(exc, Exception) else RuntimeError(str(exc)))
+
+        def on_close(connection: AsyncioConnection, exc: Exception) -> None:
+            self.channel = None
+            if not self._closed.done():
+                self._closed.set_result(exc)
+
+        self.connection = AsyncioConnection(
+            pika.URLParameters(settings.rabbitmq_url),
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            on_close_callback=on_close,
+            custom_ioloop=self.loop,
+        )
+        await opened
+
+        channel_opened = self.loop.create_future()
+        self.connection.channel(on_open_callback=channel_opened.set_result)
+        channel: Channel = await channel_opened
+        channel.add_on_close_callback(self._on_channel_closed)
+        await self.enable_confirms(channel)
+
+        await self._call(channel.queue_declare, queue=settings.failed_queue, durable=True)
+        for lane in self.lanes:
+            await self._call(
+                channel.queue_declare,
+                queue=lane.queue,
+                durable=True,
+                arguments={
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": settings.failed_queue,
+                },
+            )
+            for tier in lane.retry_policy.queues:
+                await self._call(channel.queue_declare, queue=tier.queue, durable=True, arguments=tier.arguments)
+            # Non-global QoS applies to the consumers started after it: one prefetch window per lane.
+            await self._call(channel.basic_qos, prefetch_count=lane.prefetch)
+            await self._call(
+                channel.basic_consume, queue=lane.queue, on_message_callback=partial(self._on_message, lane=lane)
+            )
+        self._channel_prefetch = 0
+        self.channel = channel
+
+    async def _watch_retry_depth(self) -> None:
+        while True:
+            await asyncio.sleep(settings.retry_depth_interval)
+            if self.channel is None or not self.channel.is_open:
+                continue
+            for lane in self.lanes:
+                for tier in lane.retry_policy.queues:
+                    frame = await self._call(self.channel.queue_declare, queue=tier.queue, passive=True)
+                    metrics.RETRY_QUEUE_DEPTH.labels(tier.queue).set(frame.method.message_count)
+
+    async def _follow_smtp_limit(self) -> None:
+        """Scale a channel-wide prefetch with the SMTP limit, so less mail piles up here while the relay is slow."""
+        limit = self.email_sender.smtp_pool.limit
+        while True:
+            # Global QoS caps the whole channel on top of the per-lane windows.
+            prefetch = max(1, round(self.prefetch * limit.value / limit.max_limit))
+            channel = self.channel
+            if channel is not None and channel.is_open and prefetch != self._channel_prefetch:
+                await self._call(channel.basic_qos, prefetch_count=prefetch, global_qos=True)
+                logger.debug("Channel prefetch now %d (SMTP limit %d)", prefetch, limit.value)
+                self._channel_prefetch = prefetch
+            await asyncio.sleep(1.0)
+
+    async def _call(self, method: Callable[..., Any], **kwargs: Any) -> Any:
+        done = self.loop.create_future()
+
+        def callback(frame: Any) -> None:
+            if not done.done():
+                done.set_result(frame)
+
+        method(callback=callback, **kwargs)
+        return await done
+
+    async def enable_confirms(self, channel: Channel) -> None:
+        """Put the consuming channel in confirm mode, so a delivery is only acked once its retry is queued."""
+        confirms = ConfirmChannel(channel)
+        channel.add_on_return_callback(confirms.on_return)
+        await self._call(channel.confirm_delivery, ack_nack_callback=confirms.on_confirm)
+        self._confirms = confirms
+
+    async def _publish(self, routing_key: str, body: bytes, properties: pika.BasicProperties) -> None:
+        confirms = self._confirms
+        if confirms is None or confirms.channel is not self.channel or not confirms.channel.is_open:
+            raise PublishError("channel is closed")
+        future = self.loop.create_future()
+        confirms.publish(routing_key, body, properties, future)
+        try:
+            await asyncio.wait_for(future, settings.publisher_confirm_timeout)
+        except asyncio.TimeoutError:
+            raise PublishError(f"not confirmed within {settings.publisher_confirm_timeout:.1f}s") from None
+
+    def _on_channel_closed(self, channel: Channel, reason: Exception) -> None:
+        logger.warning("RabbitMQ channel closed: %s", reason)
+        if self._confirms is not None and self._confirms.channel is channel:
+            self._confirms.fail_pending(f"channel closed before the broker confirmed: {reason}")
+        if self.connection and not (self.connection.is_closing or self.connection.is_closed):
+            self.connection.close()
+
+    def _on_message(self, channel: Channel, method, properties, body: bytes, lane: Optional[Lane] = None) -> None:
+        self.scheduler.push(PendingDelivery(lane or self.default_lane, channel, method.delivery_tag, body))
+        if self._pump_task is None or self._pump_task.done():
+            self._work = asyncio.Event()
+            self._pump_task = self.loop.create_task(self._pump())
+        self._work.set()
+
+    async def _pump(self) -> None:
+        """Start buffered deliveries in scheduler order as in-flight slots free up."""
+        breaker = self.email_sender.breaker
+        while True:
+            await self._work.wait()
+            if breaker is not None:
+                wait = breaker.acquire()
+                if wait > 0:
+                    await asyncio.sleep(min(wait, 1.0))
+                    continue
+            await self._slots.acquire()
+            delivery = self.scheduler.pop()
+            if not self.scheduler:
+                self._work.clear()
+            if delivery is None or delivery.channel.is_closed or delivery.channel.is_closing:
+                # Nothing left, or its channel died (the broker redelivers those).
+                self._slots.release()
+                continue
+            delivery.slot_held = True
+            task = self.loop.create_task(self._dispatch(delivery))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _park(self, delay: float) -> None:
+        delivery = _current_delivery.get()
+        if delivery is None or not delivery.slot_held:
+            await asyncio.sleep(delay)
+            return
+        # Give the in-flight slot to other domains while this one waits for a token.
+        self._slots.release()
+        delivery.slot_held = False
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            # Cancelled while waiting to get it back (drain deadline): then it is not ours to release.
+            await self._slots.acquire()
+            delivery.slot_held = True
+
+    async def _dispatch(self, delivery: PendingDelivery) -> None:
+        channel, delivery_tag = delivery.channel, delivery.delivery_tag
+        _current_delivery.set(delivery)
+        try:
+            if self.draining:
+                self._settle(channel, delivery_tag, False, requeue=True)
+                return
+            ok = await self.handle_delivery(delivery.body, delivery.lane)
+        except asyncio.CancelledError:
+            self._settle(channel, delivery_tag, False, requeue=True)
+            raise
+        finally:
+            # The pump acquired this delivery's slot; _park may have given it up.
+            if delivery.slot_held:
+                delivery.slot_held = False
+                self._slots.release()
+        self._settle(channel, delivery_tag, ok)
+
+    def _settle(self, channel: Channel, delivery_tag: int, ok: bool, requeue: bool = False) -> None:
+        if channel.is_closed or channel.is_closing:
+            # The broker will redeliver anything we could not settle.
+            logger.warning("Channel closed before delivery %s could be settled", delivery_tag)
+            return
+        with metrics.stage("ack"):
+            if ok:
+                channel.basic_ack(delivery_tag=delivery_tag)
+            else:
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
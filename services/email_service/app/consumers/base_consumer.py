@@ -1,8 +1,10 @@
 import asyncio
 import json
 import logging
+import threading
 import time
-from typing import Any, Dict
+from functools import partial
+from typing import Any, Dict, Hashable, List, Optional, Union
 
 import jinja2
 import pika
@@ -10,8 +12,19 @@ from pika.adapters.blocking_connection import BlockingChannel
 
 from app.clients.template_client import TemplateClient
 from app.config.settings import settings
+from app.consumers.campaign import CampaignRunner
+from app.consumers.lanes import Lane, configured_lanes, observe_end_to_end
+from app.consumers.retry import PERMANENT, DomainThrottled, RelayCircuitOpen, RetryPolicy, RetryTier, classify
+from app.consumers.spool_replay import SpoolReplayer
 from app.email_sender import EmailSender
+from app.models.envelope import CampaignEnvelope, CampaignRecipient, Envelope, EnvelopeError, decode_envelope
+from app.observability import health, metrics, tracing
+from app.services.delivery_index import DeliveryIndex, DurableLookupFailed
+from app.services.domain_limiter import recipient_domain
+from app.services.render_pool import RenderError, RenderPool, render_pool
+from app.services.spool import Spool, SpoolFull, adopt_orphaned_spools, open_spool
 from app.services.status_store import StatusStore
+from app.services.template_cache import compiled_templates
 
 logger = logging.getLogger(__name__)
 
@@ -20,97 +33,528 @@ class BaseConsumer:
     def __init__(self) -> None:
         self.connection: pika.BlockingConnection | None = None
         self.channel: BlockingChannel | None = None
+        self.lanes = configured_lanes()
+        # Deliveries that don't say which lane they came from retry through EMAIL_QUEUE's lane.
+        self.default_lane = next((lane for lane in self.lanes if lane.queue == settings.email_queue), self.lanes[0])
+        self.retry_policy = self.default_lane.retry_policy
 
     def connect(self) -> bool:
         try:
             self.connection = pika.BlockingConnection(pika.URLParameters(settings.rabbitmq_url))
             self.channel = self.connection.channel()
-            self.channel.queue_declare(
-                queue=settings.email_queue,
-                durable=True,
-                arguments={
-                    "x-dead-letter-exchange": "",
-                    "x-dead-letter-routing-key": settings.failed_queue,
-                },
-            )
+            # basic_publish then waits for the broker's confirm, so retries are only acked once queued.
+            self.channel.confirm_delivery()
+            for lane in self.lanes:
+                self.channel.queue_declare(
+                    queue=lane.queue,
+                    durable=True,
+                    arguments={
+                        "x-dead-letter-exchange": "",
+                        "x-dead-letter-routing-key": settings.failed_queue,
+                    },
+                )
+                for tier in lane.retry_policy.queues:
+                    self.channel.queue_declare(queue=tier.queue, durable=True, arguments=tier.arguments)
             self.channel.queue_declare(queue=settings.failed_queue, durable=True)
             return True
         except Exception as exc:
             logger.error("Failed to connect to RabbitMQ: %s", exc)
             return False
 
+    @property
+    def is_connected(self) -> bool:
+        return self.channel is not None and self.channel.is_open
+
     def stop(self) -> None:
+        # BlockingConnection is not thread-safe; hop onto its own thread to shut down.
         if self.connection and not self.connection.is_closed:
-            self.connection.close()
+            self.connection.add_callback_threadsafe(self._shutdown)
+
+    def _shutdown(self) -> None:
+        if self.channel and self.channel.is_open:
+            self.channel.stop_consuming()
+
+    def _poll_retry_depth(self) -> None:
+        if not (self.channel and self.channel.is_open):
+            return
+        try:
+            for lane in self.lanes:
+                for tier in lane.retry_policy.queues:
+                    frame = self.channel.queue_declare(queue=tier.queue, passive=True)
+                    metrics.RETRY_QUEUE_DEPTH.labels(tier.queue).set(frame.method.message_count)
+        except Exception as exc:
+            logger.warning("Could not read retry queue depth: %s", exc)
+        self.connection.call_later(settings.retry_depth_interval, self._poll_retry_depth)
 
 
 class EmailConsumer(BaseConsumer):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        email_sender: Optional[EmailSender] = None,
+        template_client: Optional[TemplateClient] = None,
+        status_store: Optional[StatusStore] = None,
+    ) -> None:
         super().__init__()
-        self.email_sender = EmailSender()
-        self.template_client = TemplateClient()
-        self.status_store = StatusStore()
+        self.email_sender = email_sender or EmailSender()
+        self.template_client = template_client or TemplateClient()
+        self.status_store = status_store or StatusStore()
+        self.delivery_index = DeliveryIndex(self.status_store, settings.delivery_index_size)
+        self.campaigns = CampaignRunner(self)
+        self.spool: Optional[Spool] = open_spool(settings.spool_dir) if settings.spool_dir else None
+        self.spool_replayer = (
+            SpoolReplayer(self.spool, self.status_store, adopt_orphaned_spools(settings.spool_dir))
+            if self.spool
+            else None
+        )
+        self.prefetch = 1
+        self.max_in_flight = 1
+        self.draining = False
+        self._active = 0
+        self._stopped = threading.Event()
+        self._register_stats()
         self._jinja_env = jinja2.Environment(autoescape=True)
+        self.render_pool: Optional[RenderPool] = render_pool
+
+    def _register_stats(self) -> None:
+        self.email_sender.register_stats("consumer")
+        metrics.register_stats("template_cache", self.template_client.stats, source="consumer")
+        metrics.register_stats("status_store", self.status_store.stats, source="consumer")
+        metrics.register_stats("delivery_index", self.delivery_index.stats, source="consumer")
+        if self.spool is not None:
+            metrics.register_stats("spool", self.spool.stats, source="consumer")
+            metrics.register_stats("spool_replay", self.spool_replayer.stats, source="consumer")
+        metrics.register_stats("tracing", tracing.stats, source="consumer")
+        health.register_probe("status_db", self.status_store.ping)
+        health.register_probe("template_service", self.template_client.ping)
+
+    @property
+    def in_flight(self) -> int:
+        return self._active
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "connected": self.is_connected,
+            "draining": self.draining,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "prefetch": self.prefetch,
+            "smtp_circuit": self.email_sender.breaker.state if self.email_sender.breaker is not None else None,
+        }
 
-    def _render(self, template: str, variables: Dict[str, Any]) -> str:
+    def drain(self, timeout: float) -> bool:
+        """Stop taking deliveries, let the current one finish and flush pending status writes.
+
+        Thread-safe and blocking; returns False if the consumer was still busy
+        at the deadline (its unacked delivery is redelivered by the broker).
+        """
+        self.draining = True
+        self.stop()
+        finished = self._stopped.wait(timeout)
+        if not finished:
+            logger.warning("Consumer still busy after %.0fs drain deadline", timeout)
+        self._stop_spool()
+        self._flush_statuses()
+        tracing.shutdown()
+        return finished
+
+    def _stop_spool(self) -> None:
+        if self.spool is None:
+            return
+        self.spool_replayer.stop()
+        try:
+            self.spool.close()
+        except OSError as exc:
+            logger.error("Could not close the SMTP spool cleanly: %s", exc)
+
+    def _flush_statuses(self) -> None:
+        try:
+            self.status_store.flush()
+        except Exception as exc:
+            logger.error("Could not flush pending status writes: %s", exc)
+
+    def _render(self, template: str, variables: Dict[str, Any], key: Optional[Hashable] = None) -> str:
         try:
-            return self._jinja_env.from_string(template).render(**variables)
+            return compiled_templates.get("consumer", self._jinja_env, template, key).render(**variables)
         except Exception as exc:
             logger.warning("Template rendering failed (%s); returning raw template", exc)
             return template
 
+    async def _render_async(self, template: str, variables: Dict[str, Any], key: Optional[Hashable] = None) -> str:
+        """``_render``, but heavy templates go to the render process pool when one is configured."""
+        if self.render_pool is None:
+            return self._render(template, variables, key)
+        try:
+            return await self.render_pool.render_or_inline(
+                "consumer", template, variables, key, partial(self._render, template, variables, key)
+            )
+        except RenderError as exc:
+            logger.warning("Template rendering failed (%s); returning raw template", exc)
+            return template
+
     def start_consuming(self) -> bool:
-        backoff = 1.0
-        for attempt in range(1, 6):
-            if self.connect():
-                break
-            logger.warning("RabbitMQ connection attempt %d failed", attempt)
-            time.sleep(backoff)
-            backoff = min(backoff * 2, 10.0)
-        else:
-            return False
+        try:
+            backoff = 1.0
+            for attempt in range(1, 6):
+                if self.draining:
+                    return False
+                if self.connect():
+                    break
+                logger.warning("RabbitMQ connection attempt %d failed", attempt)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+            else:
+                return False
 
-        assert self.channel is not None
-        self.channel.basic_qos(prefetch_count=1)
-        self.channel.basic_consume(
-            queue=settings.email_queue,
-            on_message_callback=self.process_message,
-        )
-        logger.info("Email consumer started on queue %s", settings.email_queue)
-        self.channel.start_consuming()
+            assert self.channel is not None
+            # Non-global QoS applies to each consumer started after it, so every lane gets a window of
+            # one message: this consumer handles one at a time, and EMAIL_LANE_PREFETCH is for async mode.
+            self.channel.basic_qos(prefetch_count=self.prefetch)
+            for lane in self.lanes:
+                self.channel.basic_consume(
+                    queue=lane.queue,
+                    on_message_callback=partial(self.process_message, lane=lane),
+                )
+            logger.info("Email consumer started on queues %s", ", ".join(lane.queue for lane in self.lanes))
+            if self.spool_replayer is not None:
+                self.spool_replayer.start()
+            self._poll_retry_depth()
+            if not self.draining:
+                self.channel.start_consuming()
+            if self.connection and not self.connection.is_closed:
+                self.connection.close()
+            return True
+        finally:
+            self._stopped.set()
+
+    def process_message(
+        self, ch: BlockingChannel, method, properties, body: bytes, lane: Optional[Lane] = None
+    ) -> None:
+        if not self._wait_for_relay():
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        self._active += 1
+        try:
+            ok = asyncio.run(self.handle_delivery(body, lane))
+        finally:
+            self._active -= 1
+        with metrics.stage("ack"):
+            if ok:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            else:
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+    def _wait_for_relay(self) -> bool:
+        """Hold the delivery while the SMTP circuit is open; False if a drain started meanwhile."""
+        breaker = self.email_sender.breaker
+        if breaker is None:
+            return True
+        while (wait := breaker.acquire()) > 0:
+            if self.draining:
+                return False
+            # Sleeping through the connection keeps heartbeats going.
+            self.connection.sleep(min(wait, 1.0))
         return True
 
-    def process_message(self, ch: BlockingChannel, method, properties, body: bytes) -> None:
+    async def handle_delivery(self, body: bytes, lane: Optional[Lane] = None) -> bool:
+        """Run one delivery through the pipeline; returns True when it should be acked."""
+        lane = lane or self.default_lane
+        with tracing.trace("email.delivery") as root:
+            ok = await self._run_delivery(body, lane)
+            if root is not None:
+                root.set_tag("lane", lane.name)
+                root.set_tag("acked", ok)
+                if not ok:
+                    root.set_tag("error", "true")
+            return ok
+
+    async def _run_delivery(self, body: bytes, lane: Lane) -> bool:
+        metrics.MESSAGES_IN_FLIGHT.inc()
+        envelope: Optional[Envelope] = None
         try:
-            envelope = json.loads(body)
-            logger.debug("Processing envelope: %s", envelope)
-            request_id = envelope.get("request_id")
-            user = envelope.get("user") or {}
-            template_info = envelope.get("template") or {}
-            variables = envelope.get("variables") or {}
+            # Malformed messages are rejected here, before any network I/O.
+            with metrics.stage("decode"):
+                envelope = decode_envelope(body)
+            tracing.continue_trace(
+                envelope.correlation_id, request_id=envelope.request_id, retry_count=envelope.retry_count
+            )
+            if isinstance(envelope, CampaignEnvelope):
+                return await self._handle_campaign(envelope, lane)
+            request_id = envelope.request_id
+            if request_id and await self._is_duplicate(request_id):
+                logger.info("Skipping duplicate delivery of %s", request_id)
+                metrics.record_outcome("duplicate")
+                return True
 
-            recipient_email = user.get("email")
-            if not recipient_email:
-                self.status_store.update_status(request_id, "failed", settings.provider_name, "missing email")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                return
+            delivered = False
+            try:
+                # False when the message was spooled: it only counts as delivered once replay sends it.
+                delivered = await self._deliver(envelope)
+                return True
+            finally:
+                if request_id:
+                    self.delivery_index.release(request_id, delivered)
+        except Exception as exc:
+            return await self._handle_failure(envelope, exc, lane)
+        finally:
+            metrics.MESSAGES_IN_FLIGHT.dec()
+            if envelope is not None:
+                observe_end_to_end(lane, envelope.created_at)
 
-            slug = template_info.get("slug")
-            locale = user.get("locale") or template_info.get("locale")
-            template = self.template_client.get_active_template(slug, locale)
-            rendered_subject = self._render(template["subject"], variables)
-            rendered_body = self._render(template["body"], variables)
+    async def _handle_campaign(self, envelope: CampaignEnvelope, lane: Lane) -> bool:
+        """Deliver a campaign chunk; leftovers are republished as a smaller campaign."""
+        try:
+            outcome = await self.campaigns.run(envelope)
+        except Exception as exc:
+            return await self._handle_failure(envelope, exc, lane)
+        logger.info(
+            "Campaign %s: %d delivered, %d failed, %d duplicate, %d to retry, %d deferred",
+            envelope.request_id, outcome.delivered, outcome.failed, outcome.duplicates,
+            len(outcome.retry), len(outcome.deferred),
+        )
 
-            success = asyncio.run(
-                self.email_sender.send_raw_email(recipient_email, rendered_subject, rendered_body)
+        ok = True
+        if outcome.deferred:
+            tier = lane.retry_policy.tier_for_delay(outcome.defer_delay)
+            ok = tier is not None and await self._republish_recipients(
+                tier, envelope, outcome.deferred, "rate_limited", count_attempt=False
             )
+        if outcome.retry:
+            tier = lane.retry_policy.tier_for(envelope.retry_count)
+            if tier is None:
+                await self._record_failures(outcome.retry, "retries exhausted", envelope.created_at)
+                metrics.record_outcome("failed", "retries_exhausted")
+            elif await self._republish_recipients(tier, envelope, outcome.retry, "smtp_failure"):
+                metrics.RETRIES.labels(tier.queue).inc()
+            else:
+                ok = False
+        # Dead-lettering the chunk is safe when a republish failed: replays skip delivered recipients.
+        return ok
 
-            if success:
-                self.status_store.update_status(request_id, "delivered", settings.provider_name, None)
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+    async def _republish_recipients(
+        self,
+        tier: RetryTier,
+        envelope: CampaignEnvelope,
+        recipients: List[CampaignRecipient],
+        reason: str,
+        count_attempt: bool = True,
+    ) -> bool:
+        try:
+            await self._publish_retry(
+                tier, envelope, reason, count_attempt=count_attempt, recipients=[r.raw for r in recipients]
+            )
+            return True
+        except Exception as exc:
+            logger.error("Could not republish %d recipients of %s: %s", len(recipients), envelope.request_id, exc)
+            return False
+
+    async def _record_failures(self, recipients: List[CampaignRecipient], detail: str, created_at: str) -> None:
+        updates = [(r.request_id, "failed", settings.provider_name, detail[:500]) for r in recipients]
+        try:
+            with metrics.stage("status_write"):
+                await asyncio.to_thread(self.status_store.update_statuses, updates, created_at)
+        except Exception as exc:
+            logger.error("Could not record failure of %d recipients: %s", len(updates), exc)
+
+    async def _handle_failure(
+        self, envelope: Optional[Union[Envelope, CampaignEnvelope]], exc: Exception, lane: Optional[Lane] = None
+    ) -> bool:
+        """Schedule a delayed retry for transient failures; False dead-letters the message."""
+        retry_policy = (lane or self.default_lane).retry_policy
+        reason = type(exc).__name__
+        tracing.tag("failure", reason)
+        if envelope is not None:
+            request_id = envelope.request_id
+        else:
+            request_id = exc.request_id if isinstance(exc, EnvelopeError) else None
+        if isinstance(exc, (DomainThrottled, DurableLookupFailed)) and envelope is not None:
+            # Hand the message back to the broker without spending one of its retries. When the
+            # durable duplicate check failed it may already have been sent, so it is not sent now.
+            if isinstance(exc, DomainThrottled):
+                delay = exc.delay
+                defer_reason = "relay_unavailable" if isinstance(exc, RelayCircuitOpen) else "rate_limited"
             else:
-                self.status_store.update_status(request_id, "failed", settings.provider_name, "smtp failure")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                delay, defer_reason = 0.0, "dedup_unavailable"
+            tier = retry_policy.tier_for_delay(delay)
+            if tier is not None:
+                try:
+                    await self._publish_retry(tier, envelope, defer_reason, count_attempt=False)
+                except Exception as publish_exc:
+                    logger.error("Could not defer %s: %s", request_id, publish_exc)
+                else:
+                    logger.info("Deferred %s for %.0fs (%s)", request_id, tier.delay, exc)
+                    metrics.record_outcome("deferred", defer_reason)
+                    return True
+
+        if envelope is not None and classify(exc) != PERMANENT:
+            retry_count = envelope.retry_count
+            tier = retry_policy.tier_for(retry_count)
+            if tier is not None:
+                try:
+                    await self._publish_retry(tier, envelope, reason)
+                except Exception as publish_exc:
+                    logger.error("Could not schedule retry for %s: %s", request_id, publish_exc)
+                else:
+                    logger.warning(
+                        "Delivery of %s failed (%s: %s); retry %d in %.0fs",
+                        request_id, reason, exc, retry_count + 1, tier.delay,
+                    )
+                    metrics.RETRIES.labels(tier.queue).inc()
+                    metrics.record_outcome("retry", reason)
+                    return True
+            else:
+                reason = "retries_exhausted"
+
+        logger.error("Email processing failed permanently for %s: %s", request_id, exc)
+        if isinstance(envelope, CampaignEnvelope):
+            await self._record_failures(envelope.recipients, str(exc), envelope.created_at)
+        elif request_id:
+            try:
+                with metrics.stage("status_write"):
+                    await asyncio.to_thread(
+                        self.status_store.update_status,
+                        request_id,
+                        "failed",
+                        settings.provider_name,
+                        str(exc)[:500],
+                        envelope.created_at if envelope is not None else None,
+                    )
+            except Exception as status_exc:
+                logger.error("Could not record failure of %s: %s", request_id, status_exc)
+        metrics.record_outcome("failed", reason)
+        return False
+
+    async def _publish_retry(
+        self,
+        tier: RetryTier,
+        envelope: Union[Envelope, CampaignEnvelope],
+        reason: str,
+        count_attempt: bool = True,
+        **changes: Any,
+    ) -> None:
+        """Republish to a delay queue; returns once the broker confirmed it, so the original can be acked."""
+        if count_attempt:
+            changes["retry_count"] = envelope.retry_count + 1
+        retry = envelope.to_dict(**changes) if changes else envelope.raw
+        properties = pika.BasicProperties(
+            content_type="application/json",
+            delivery_mode=2,
+            message_id=envelope.request_id,
+            headers={"x-retry-reason": reason},
+        )
+        await self._publish(tier.queue, json.dumps(retry).encode("utf-8"), properties)
+
+    async def _publish(self, routing_key: str, body: bytes, properties: pika.BasicProperties) -> None:
+        if not (self.channel and self.channel.is_open):
+            raise RuntimeError("channel is closed")
+        # The channel is in confirm mode: this raises if the message is nacked or unroutable.
+        self.channel.basic_publish(
+            exchange="", routing_key=routing_key, body=body, properties=properties, mandatory=True
+        )
+
+    async def _throttle(self, recipient_email: str) -> None:
+        wait = self.email_sender.relay_wait(recipient_email)
+        if wait > 0:
+            raise RelayCircuitOpen(recipient_domain(recipient_email), wait)
+        delay = self.email_sender.reserve(recipient_email)
+        if not delay:
+            return
+        if delay > settings.domain_max_park:
+            self.email_sender.cancel_reservation(recipient_email)
+            raise DomainThrottled(recipient_domain(recipient_email), delay)
+        with metrics.stage("rate_limit"):
+            await self._park(delay)
+
+    async def _park(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+    async def _is_duplicate(self, request_id: str) -> bool:
+        if self.delivery_index.claim(request_id) is not None:
+            return True
+        return await asyncio.to_thread(self.delivery_index.delivered_durably, request_id)
+
+    async def _deliver(self, envelope: Envelope) -> bool:
+        request_id = envelope.request_id
+        recipient_email = envelope.user.email
+        variables = envelope.variables
+        slug = envelope.template.slug
+        locale = envelope.user.locale or envelope.template.locale
+        with metrics.stage("template_fetch"):
+            template = await asyncio.to_thread(self.template_client.get_active_template, slug, locale)
+        # Compiled templates are keyed by version when we know it, by content hash otherwise.
+        version = template.get("version_id") or envelope.template.version
+        # A subject in the envelope (HTTP enqueue mode passes the caller's) overrides the template's.
+        subject = envelope.template.subject or template["subject"]
+        subject_key = body_key = None
+        if version is not None:
+            if not envelope.template.subject:
+                subject_key = (slug, locale, version, "subject")
+            body_key = (slug, locale, version, "body")
+        with metrics.stage("render"):
+            rendered_subject = await self._render_async(subject, variables, subject_key)
+            rendered_body = await self._render_async(template["body"], variables, body_key)
+
+        await self._throttle(recipient_email)
+        try:
+            with metrics.stage("smtp_send"):
+                await self.email_sender.send_raw_email(
+                    recipient_email, rendered_subject, rendered_body, raise_on_error=True, reserved=True
+                )
+        except Exception as exc:
+            if await self._spool_message(envelope, rendered_subject, rendered_body, exc):
+                return False
+            raise
+
+        metrics.record_outcome("delivered")
+        # The mail is out; a status write failure must not trigger a resend.
+        try:
+            with metrics.stage("status_write"):
+                await asyncio.to_thread(
+                    self.status_store.update_status,
+                    request_id,
+                    "delivered",
+                    settings.provider_name,
+                    None,
+                    envelope.created_at,
+                )
         except Exception as exc:
-            logger.error("Email processing failed: %s", exc)
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            logger.error("Could not record delivery of %s: %s", request_id, exc)
+        return True
+
+    async def _spool_message(self, envelope: Envelope, subject: str, body: str, exc: Exception) -> bool:
+        """Keep a rendered message in the local spool when the relay fails transiently.
+
+        Returns True once the record is fsync'd, so the delivery can be acked.
+        """
+        if self.spool is None or classify(exc) == PERMANENT:
+            return False
+        record = {
+            "request_id": envelope.request_id,
+            "correlation_id": envelope.correlation_id,
+            "to": envelope.user.email,
+            "subject": subject,
+            "body": body,
+            "created_at": envelope.created_at,
+            "spooled_at": time.time(),
+            "attempts": 0,
+        }
+        try:
+            with metrics.stage("spool_write"):
+                await asyncio.to_thread(self.spool.append, record)
+        except (SpoolFull, OSError) as spool_exc:
+            logger.warning("Could not spool %s (%s); falling back to the retry queues", envelope.request_id, spool_exc)
+            return False
+        logger.warning("Relay failed for %s (%s); spooled for replay", envelope.request_id, exc)
+        metrics.record_outcome("spooled", type(exc).__name__)
+        try:
+            with metrics.stage("status_write"):
+                await asyncio.to_thread(
+                    self.status_store.update_status,
+                    envelope.request_id,
+                    "spooled",
+                    settings.provider_name,
+                    str(exc)[:500],
+                    envelope.created_at,
+                )
+        except Exception as status_exc:
+            logger.error("Could not record spooling of %s: %s", envelope.request_id, status_exc)
+        return True
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import logging
+from typing import TYPE_CHECKING, Dict, Hashable, List, Optional, Set, Tuple
+
+import aiosmtplib
+
+from app.config.settings import settings
+from app.consumers.retry import PERMANENT, classify
+from app.models.envelope import CampaignEnvelope, CampaignRecipient
+from app.observability import metrics
+from app.services.delivery_index import DurableLookupFailed
+from app.services.domain_limiter import recipient_domain
+from app.services.status_store import StatusUpdate
+from app.services.template_cache import compiled_templates
+
+if TYPE_CHECKING:
+    from app.consumers.base_consumer import EmailConsumer
+
+logger = logging.getLogger(__name__)
+
+# (source, compiled-template cache key) of a locale's subject and body.
+TemplatePair = Tuple[Tuple[str, Hashable], Tuple[str, Hashable]]
+
+
+class CampaignOutcome:
+    __slots__ = ("delivered", "failed", "duplicates", "retry", "deferred", "defer_delay")
+
+    def __init__(self) -> None:
+        self.delivered = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.retry: List[CampaignRecipient] = []
+        self.deferred: List[CampaignRecipient] = []
+        self.defer_delay = 0.0
+
+
+class CampaignRunner:
+    """Fans one campaign envelope out to its recipients.
+
+    The template is fetched and compiled once per locale up front. Recipients
+    are then rendered chunk by chunk (``EMAIL_CAMPAIGN_CHUNK_SIZE``) through
+    the consumer's renderer, so heavy templates go to the render pool and
+    other deliveries get the loop between recipients. Within a chunk,
+    recipients with an identical rendered subject/body on the same relay
+    route share one SMTP transaction with several RCPT TO (up to
+    ``SMTP_MAX_RECIPIENTS``), and the chunk's statuses are written as one bulk
+    upsert. Transiently failed and rate-limited recipients are returned to the
+    caller, which republishes them as a smaller campaign.
+    """
+
+    def __init__(self, consumer: "EmailConsumer") -> None:
+        self.consumer = consumer
+        self.chunk_size = max(1, settings.campaign_chunk_size)
+        self.max_recipients = max(1, settings.smtp_max_recipients)
+
+    async def run(self, envelope: CampaignEnvelope) -> CampaignOutcome:
+        outcome = CampaignOutcome()
+        templates = await self._load_templates(envelope)
+        recipients = envelope.recipients
+        for start in range(0, len(recipients), self.chunk_size):
+            await self._run_chunk(envelope, recipients[start:start + self.chunk_size], templates, outcome)
+        return outcome
+
+    async def _load_templates(self, envelope: CampaignEnvelope) -> Dict[Optional[str], TemplatePair]:
+        slug = envelope.template.slug
+        locales = {recipient.locale or envelope.template.locale for recipient in envelope.recipients}
+        templates: Dict[Optional[str], TemplatePair] = {}
+        for locale in locales:
+            with metrics.stage("template_fetch"):
+                template = await asyncio.to_thread(self.consumer.template_client.get_active_template, slug, locale)
+            subject, body = template["subject"], template["body"]
+            version = template.get("version_id") or envelope.template.version
+            if version is not None:
+                keys: Tuple[Hashable, Hashable] = ((slug, locale, version, "subject"), (slug, locale, version, "body"))
+            else:
+                # Hash once here rather than once per recipient.
+                keys = (hashlib.sha1(subject.encode("utf-8")).hexdigest(), hashlib.sha1(body.encode("utf-8")).hexdigest())
+            env = self.consumer._jinja_env
+            # Compile up front, so a broken template fails the campaign before anything is sent.
+            compiled_templates.get("consumer", env, subject, keys[0])
+            compiled_templates.get("consumer", env, body, keys[1])
+            templates[locale] = ((subject, keys[0]), (body, keys[1]))
+        return templates
+
+    async def _run_chunk(
+        self,
+        envelope: CampaignEnvelope,
+        chunk: List[CampaignRecipient],
+        templates: Dict[Optional[str], TemplatePair],
+        outcome: CampaignOutcome,
+    ) -> None:
+        pending = await self._claim(chunk, outcome)
+        delivered_ids: Set[str] = set()
+        updates: List[StatusUpdate] = []
+        try:
+            groups, waits = await self._render_and_group(envelope, pending, templates, outcome)
+            # The pool's size is clamped to at least one; SMTP_POOL_SIZE=0 would hang every chunk.
+            slots = asyncio.Semaphore(self.consumer.email_sender.smtp_pool.max_size)
+            sends = []
+            for key, group in groups.items():
+                for start in range(0, len(group), self.max_recipients):
+                    batch = group[start:start + self.max_recipients]
+                    sends.append(self._send(batch, key[1], key[2], waits[key], slots, outcome, updates, delivered_ids))
+            await asyncio.gather(*sends)
+        finally:
+            for recipient in pending:
+                self.consumer.delivery_index.release(recipient.request_id, recipient.request_id in delivered_ids)
+
+        if updates:
+            try:
+                with metrics.stage("status_write"):
+                    await asyncio.to_thread(self.consumer.status_store.update_statuses, updates, envelope.created_at)
+            except Exception as exc:
+                logger.error("Could not record %d campaign statuses for %s: %s", len(updates), envelope.request_id, exc)
+
+    async def _claim(self, chunk: List[CampaignRecipient], outcome: CampaignOutcome) -> List[CampaignRecipient]:
+        index = self.consumer.delivery_index
+        claimed = []
+        for recipient in chunk:
+            if index.claim(recipient.request_id) is None:
+                claimed.append(recipient)
+            else:
+                outcome.duplicates += 1
+        if not claimed:
+            return claimed
+        try:
+            already = await asyncio.to_thread(index.delivered_durably_many, [r.request_id for r in claimed])
+        except DurableLookupFailed as exc:
+            # Unknown whether they were sent already: republish them for later instead of sending now.
+            logger.warning("Deferring %d campaign recipients: %s", len(claimed), exc)
+            outcome.deferred.extend(claimed)
+            return []
+        outcome.duplicates += len(already)
+        return [recipient for recipient in claimed if recipient.request_id not in already]
+
+    async def _render_and_group(
+        self,
+        envelope: CampaignEnvelope,
+        recipients: List[CampaignRecipient],
+        templates: Dict[Optional[str], TemplatePair],
+        outcome: CampaignOutcome,
+    ) -> Tuple[Dict[Tuple[int, str, str], List[CampaignRecipient]], Dict[Tuple[int, str, str], float]]:
+        sender = self.consumer.email_sender
+        groups: Dict[Tuple[int, str, str], List[CampaignRecipient]] = {}
+        waits: Dict[Tuple[int, str, str], float] = {}
+        with metrics.stage("render"):
+            for recipient in recipients:
+                subject, body = templates[recipient.locale or envelope.template.locale]
+                variables = {**envelope.variables, **recipient.variables} if recipient.variables else envelope.variables
+                # Falls back to the raw template when rendering fails, like single sends.
+                rendered_subject = await self.consumer._render_async(subject[0], variables, subject[1])
+                rendered_body = await self.consumer._render_async(body[0], variables, body[1])
+                # Inline renders never suspend; let other deliveries run between recipients.
+                await asyncio.sleep(0)
+
+                delay = sender.relay_wait(recipient.email)
+                if delay > 0:
+                    # Its routed relay's breaker is open.
+                    outcome.deferred.append(recipient)
+                    outcome.defer_delay = max(outcome.defer_delay, delay)
+                    continue
+                delay = sender.reserve(recipient.email)
+                if delay > settings.domain_max_park:
+                    sender.cancel_reservation(recipient.email)
+                    outcome.deferred.append(recipient)
+                    outcome.defer_delay = max(outcome.defer_delay, delay)
+                    continue
+                key = (id(sender.pool_for(recipient.email)), rendered_subject, rendered_body)
+                groups.setdefault(key, []).append(recipient)
+                waits[key] = max(waits.get(key, 0.0), delay)
+        return groups, waits
+
+    async def _send(
+        self,
+        batch: List[CampaignRecipient],
+        subject: str,
+        body: str,
+        wait: float,
+        slots: asyncio.Semaphore,
+        outcome: CampaignOutcome,
+        updates: List[StatusUpdate],
+        delivered_ids: Set[str],
+    ) -> None:
+        provider = settings.provider_name
+        if wait:
+            with metrics.stage("rate_limit"):
+                await asyncio.sleep(wait)
+        async with slots:
+            try:
+                with metrics.stage("smtp_send"):
+                    refused = await self.consumer.email_sender.send_bulk([r.email for r in batch], subject, body)
+            except aiosmtplib.SMTPRecipientsRefused as exc:
+                refused = {item.recipient: item for item in exc.recipients}
+            except Exception as exc:
+                if classify(exc) == PERMANENT:
+                    for recipient in batch:
+                        updates.append((recipient.request_id, "failed", provider, str(exc)[:500]))
+                        metrics.record_outcome("failed", type(exc).__name__)
+                    outcome.failed += len(batch)
+                else:
+                    logger.warning("Campaign send to %d recipients failed: %s", len(batch), exc)
+                    outcome.retry.extend(batch)
+                return
+
+        for recipient in batch:
+            response = refused.get(recipient.email)
+            if response is None:
+                delivered_ids.add(recipient.request_id)
+                updates.append((recipient.request_id, "delivered", provider, None))
+                metrics.record_outcome("delivered", "campaign")
+                outcome.delivered += 1
+            elif response.code >= 500:
+                updates.append((recipient.request_id, "failed", provider, f"{response.code} {response.message}"[:500]))
+                metrics.record_outcome("failed", "recipient_refused")
+                outcome.failed += 1
+            else:
+                outcome.retry.append(recipient)
+        if refused:
+            logger.info("%d of %d campaign recipients refused (%s)", len(refused), len(batch), recipient_domain(batch[0].email))
@@ -0,0 +1,9 @@
+from app.config.settings import settings
+from app.consumers.async_consumer import AsyncEmailConsumer
+from app.consumers.base_consumer import EmailConsumer
+
+
+def create_consumer() -> EmailConsumer:
+    if settings.consumer_mode == "blocking":
+        return EmailConsumer()
+    return AsyncEmailConsumer()
@@ -0,0 +1,163 @@
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from app.config.settings import settings
+from app.consumers.retry import RetryPolicy
+from app.observability import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANE = "standard"
+
+
+class Lane:
+    """One priority lane: a work queue with its own prefetch, scheduling weight and latency budget."""
+
+    __slots__ = ("name", "queue", "weight", "prefetch", "budget", "retry_policy")
+
+    def __init__(self, name: str, queue: str, weight: float = 1.0, prefetch: int = 1, budget: float = 0.0) -> None:
+        self.name = name
+        self.queue = queue
+        self.weight = weight
+        self.prefetch = prefetch
+        self.budget = budget
+        # Retries wait in this lane's own delay queues and come back to this lane.
+        self.retry_policy = RetryPolicy(queue)
+
+
+def _parse_lane_map(spec: str) -> Dict[str, str]:
+    """Parse ``"transactional=value,bulk=value"``, keeping the order lanes are listed in."""
+    entries: Dict[str, str] = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, value = item.partition("=")
+        if not sep or not name.strip() or not value.strip():
+            logger.warning("Ignoring malformed lane setting %r", item)
+            continue
+        entries[name.strip()] = value.strip()
+    return entries
+
+
+def configured_lanes() -> List[Lane]:
+    """Lanes from ``EMAIL_LANES``, highest priority first; one ``standard`` lane on ``EMAIL_QUEUE`` by default."""
+    queues = _parse_lane_map(settings.email_lanes) or {DEFAULT_LANE: settings.email_queue}
+    weights = _parse_lane_map(settings.email_lane_weights)
+    prefetch = _parse_lane_map(settings.email_lane_prefetch)
+    budgets = _parse_lane_map(settings.email_lane_budgets)
+    return [
+        Lane(
+            name,
+            queue,
+            weight=max(0.001, float(weights.get(name, 1))),
+            prefetch=max(1, int(prefetch.get(name, settings.consumer_prefetch))),
+            budget=max(0.0, float(budgets.get(name, 0))),
+        )
+        for name, queue in queues.items()
+    ]
+
+
+def observe_end_to_end(lane: Lane, created_at: str) -> None:
+    """Envelope creation to settle, so broker queueing and earlier retries are included."""
+    if not created_at:
+        return
+    try:
+        created = datetime.fromisoformat(created_at)
+    except ValueError:
+        return
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    age = (datetime.now(timezone.utc) - created).total_seconds()
+    metrics.LANE_END_TO_END.labels(lane.name).observe(max(0.0, age))
+
+
+class PendingDelivery:
+    __slots__ = ("lane", "channel", "delivery_tag", "body", "received", "slot_held")
+
+    def __init__(self, lane: Lane, channel: Any, delivery_tag: int, body: bytes) -> None:
+        self.lane = lane
+        self.channel = channel
+        self.delivery_tag = delivery_tag
+        self.body = body
+        self.received = time.monotonic()
+        # Whether the delivery holds one of the consumer's in-flight slots right now.
+        self.slot_held = False
+
+
+class LaneScheduler:
+    """Weighted fair queueing over the deliveries buffered for each lane.
+
+    Every lane has a virtual finish time that advances by ``1 / weight`` per
+    delivery it starts; the lane with the smallest one goes next, so under
+    load lanes get in-flight slots in proportion to their weights and no
+    lane starves. A lane that was idle rejoins at the current virtual time
+    instead of spending credit saved up while empty. A lane whose oldest
+    buffered delivery has used half of its latency budget jumps the queue
+    (highest-priority lane first).
+    """
+
+    def __init__(self, lanes: List[Lane]) -> None:
+        self.lanes = lanes
+        self._buffers: Dict[str, Deque[PendingDelivery]] = {lane.name: deque() for lane in lanes}
+        self._finish: Dict[str, float] = {lane.name: 0.0 for lane in lanes}
+        self._clock = 0.0
+        self._started: Dict[str, int] = {lane.name: 0 for lane in lanes}
+        self._expedited: Dict[str, int] = {lane.name: 0 for lane in lanes}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, delivery: PendingDelivery) -> None:
+        name = delivery.lane.name
+        buffer = self._buffers[name]
+        if not buffer:
+            self._finish[name] = max(self._finish[name], self._clock)
+        buffer.append(delivery)
+        self._size += 1
+
+    def pop(self) -> Optional[PendingDelivery]:
+        if not self._size:
+            return None
+        now = time.monotonic()
+        chosen: Optional[Lane] = None
+        for lane in self.lanes:
+            buffer = self._buffers[lane.name]
+            if lane.budget and buffer and now - buffer[0].received >= lane.budget / 2:
+                chosen = lane
+                self._expedited[lane.name] += 1
+                break
+        if chosen is None:
+            chosen = min(
+                (lane for lane in self.lanes if self._buffers[lane.name]),
+                key=lambda lane: self._finish[lane.name],
+            )
+
+        name = chosen.name
+        self._clock = max(self._clock, self._finish[name])
+        self._finish[name] += 1.0 / chosen.weight
+        self._started[name] += 1
+        self._size -= 1
+        delivery = self._buffers[name].popleft()
+        metrics.LANE_QUEUE_WAIT.labels(name).observe(now - delivery.received)
+        return delivery
+
+    def clear(self) -> List[PendingDelivery]:
+        """Remove and return everything still buffered (e.g. to requeue it on drain)."""
+        deliveries = [delivery for buffer in self._buffers.values() for delivery in buffer]
+        for buffer in self._buffers.values():
+            buffer.clear()
+        self._size = 0
+        return deliveries
+
+    def stats(self) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for lane in self.lanes:
+            values[f"{lane.name}_buffered"] = len(self._buffers[lane.name])
+            values[f"{lane.name}_started"] = self._started[lane.name]
+            values[f"{lane.name}_expedited"] = self._expedited[lane.name]
+        return values
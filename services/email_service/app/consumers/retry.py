@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import aiosmtplib
+import httpx
+import psycopg2
+
+from app.clients.template_client import TemplateNotFoundError
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+
+
+class PermanentDeliveryError(Exception):
+    """The message can never be delivered as-is (bad envelope, rejected recipient)."""
+
+
+class DomainThrottled(Exception):
+    """The recipient domain is over its send rate for longer than we park messages."""
+
+    def __init__(self, domain: str, delay: float) -> None:
+        super().__init__(f"{domain} throttled for {delay:.1f}s")
+        self.domain = domain
+        self.delay = delay
+
+
+class RelayCircuitOpen(DomainThrottled):
+    """The relay the recipient domain is routed to is failing; its breaker holds the domain back."""
+
+    def __init__(self, domain: str, delay: float) -> None:
+        super().__init__(domain, delay)
+        self.args = (f"relay for {domain} unavailable for {delay:.1f}s",)
+
+
+def classify(exc: BaseException) -> str:
+    """Tell failures worth retrying from ones that will fail the same way again."""
+    if isinstance(exc, (PermanentDeliveryError, TemplateNotFoundError, ValueError, KeyError, TypeError)):
+        return PERMANENT
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        codes = [refused.code for refused in exc.recipients]
+        return PERMANENT if codes and all(code >= 500 for code in codes) else TRANSIENT
+    if isinstance(exc, aiosmtplib.SMTPResponseException) and not isinstance(exc, aiosmtplib.SMTPAuthenticationError):
+        # 5xx is a definitive rejection; 4xx (greylisting, rate limits) is worth another go.
+        return PERMANENT if exc.code >= 500 else TRANSIENT
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return TRANSIENT if status >= 500 or status in (408, 429) else PERMANENT
+    if isinstance(exc, (aiosmtplib.SMTPException, httpx.TransportError, psycopg2.OperationalError, OSError, asyncio.TimeoutError)):
+        return TRANSIENT
+    # Unknown errors are retried; max_retries bounds the cost of guessing wrong.
+    return TRANSIENT
+
+
+class RetryTier:
+    __slots__ = ("index", "delay", "queue", "target")
+
+    def __init__(self, index: int, delay: float, queue: str, target: str = settings.email_queue) -> None:
+        self.index = index
+        self.delay = delay
+        self.queue = queue
+        self.target = target
+
+    @property
+    def arguments(self) -> Dict[str, Any]:
+        # Expired messages dead-letter straight back onto the work queue.
+        return {
+            "x-message-ttl": int(self.delay * 1000),
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": self.target,
+        }
+
+
+class RetryPolicy:
+    """Maps an envelope's ``retry_count`` to a delay queue.
+
+    Retry ``n`` waits ``base_delay * multiplier ** n`` seconds (capped at
+    ``max_delay``) in a queue whose per-queue TTL dead-letters it back to
+    the work queue it came from (``email_queue`` by default). Queues are
+    named after their work queue and delay, so changing the schedule
+    declares new queues instead of clashing with existing TTLs.
+    """
+
+    def __init__(
+        self,
+        queue: str = settings.email_queue,
+        max_retries: int = settings.retry_max_attempts,
+        base_delay: float = settings.retry_base_delay,
+        multiplier: float = settings.retry_multiplier,
+        max_delay: float = settings.retry_max_delay,
+    ) -> None:
+        self.max_retries = max(0, max_retries)
+        self.tiers: List[RetryTier] = []
+        for attempt in range(self.max_retries):
+            delay = min(base_delay * multiplier ** attempt, max_delay)
+            self.tiers.append(RetryTier(attempt, delay, f"{queue}.retry.{int(delay * 1000)}ms", queue))
+
+    @property
+    def queues(self) -> List[RetryTier]:
+        """Distinct delay queues to declare (capped delays share a queue)."""
+        unique: Dict[str, RetryTier] = {}
+        for tier in self.tiers:
+            unique.setdefault(tier.queue, tier)
+        return list(unique.values())
+
+    def tier_for_delay(self, delay: float) -> Optional[RetryTier]:
+        """The shortest delay queue that waits at least ``delay`` seconds (or the longest one)."""
+        for tier in self.tiers:
+            if tier.delay >= delay:
+                return tier
+        return self.tiers[-1] if self.tiers else None
+
+    def tier_for(self, retry_count: int) -> Optional[RetryTier]:
+        """The tier for the next attempt, or None once retries are exhausted."""
+        if retry_count < 0 or retry_count >= self.max_retries:
+            return None
+        return self.tiers[retry_count]
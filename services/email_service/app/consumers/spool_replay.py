@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiosmtplib
+
+from app.config.settings import settings
+from app.consumers.retry import PERMANENT, classify
+from app.email_sender import EmailSender
+from app.observability import metrics, tracing
+from app.services.spool import Position, Spool, SpoolFull, SpoolRecord
+from app.services.status_store import StatusStore
+
+logger = logging.getLogger(__name__)
+
+READ_BATCH = 50
+MAX_BACKOFF = 60.0
+
+
+def _recipient_deferred(exc: BaseException) -> bool:
+    """The relay answered with a 4xx for this message or its recipient, rather than being unreachable."""
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        # Not an SMTPResponseException; one entry per refused recipient.
+        return bool(exc.recipients) and all(400 <= refusal.code < 500 for refusal in exc.recipients)
+    return isinstance(exc, aiosmtplib.SMTPResponseException)
+
+
+class SpoolReplayer:
+    """Sends spooled messages at ``EMAIL_SPOOL_REPLAY_RATE`` per second once the relay is back.
+
+    Runs in its own thread and event loop with a dedicated EmailSender, so
+    replay traffic never competes with the consumer's SMTP pool slots.
+    Records are replayed in order. A relay-level failure (connection refused,
+    timeout, disconnect) leaves the record at the head of the spool and backs
+    off exponentially; a per-recipient 4xx moves it to the tail instead of
+    blocking the rest. Records older than ``EMAIL_SPOOL_MAX_AGE`` are marked
+    failed. Already delivered ``request_id``s (e.g. replayed again after a
+    crash before the cursor was saved) are skipped; if the status store cannot
+    be asked, the record is sent anyway. ``adopted`` spools (slots
+    left behind by workers that no longer exist) are replayed whenever the
+    own spool is empty, and closed once drained.
+    """
+
+    def __init__(self, spool: Spool, status_store: StatusStore, adopted: Optional[List[Spool]] = None) -> None:
+        self.spool = spool
+        self.adopted = list(adopted or ())
+        self.status_store = status_store
+        self.interval = 1.0 / settings.spool_replay_rate if settings.spool_replay_rate > 0 else 0.0
+        self.max_age = settings.spool_max_age
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._backoff = 1.0
+        self._waiting = 0.0
+
+        self._delivered = 0
+        self._failed = 0
+        self._skipped = 0
+        self._requeued = 0
+        self._relay_failures = 0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="spool-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stopping = True
+        if self._loop is not None and self._wake is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wake.set)
+            except RuntimeError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "delivered": self._delivered,
+            "failed": self._failed,
+            "skipped_duplicates": self._skipped,
+            "requeued": self._requeued,
+            "relay_failures": self._relay_failures,
+            "backoff_seconds": self._waiting,
+            "adopted_slots": len(self.adopted),
+            "adopted_pending": sum(spool.stats()["pending_records"] for spool in self.adopted),
+        }
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._replay_loop())
+        except Exception:
+            logger.exception("Spool replayer stopped unexpectedly")
+        finally:
+            self._loop.close()
+
+    async def _replay_loop(self) -> None:
+        self._wake = asyncio.Event()
+        sender = EmailSender()
+        try:
+            while not self._stopping:
+                spool, batch = await asyncio.to_thread(self._next_batch)
+                if not batch:
+                    await self._sleep(1.0)
+                    continue
+                for position, record in batch:
+                    if self._stopping:
+                        break
+                    with tracing.trace("email.spool_replay"):
+                        tracing.continue_trace(record.get("correlation_id"), request_id=record["request_id"])
+                        replayed = await self._replay(sender, record)
+                    if not replayed:
+                        logger.warning("Relay still unavailable; next spool replay in %.0fs", self._backoff)
+                        self._waiting = self._backoff
+                        await self._sleep(self._backoff)
+                        self._waiting = 0.0
+                        self._backoff = min(self._backoff * 2, MAX_BACKOFF)
+                        break
+                    self._backoff = 1.0
+                    spool.commit(position)
+                    if self.interval:
+                        await self._sleep(self.interval)
+        finally:
+            await sender.close()
+            for spool in self.adopted:
+                spool.close()
+            self.adopted = []
+
+    def _next_batch(self) -> Tuple[Spool, List[Tuple[Position, SpoolRecord]]]:
+        batch = self.spool.read(READ_BATCH)
+        while not batch and self.adopted:
+            batch = self.adopted[0].read(READ_BATCH)
+            if batch:
+                return self.adopted[0], batch
+            drained = self.adopted.pop(0)
+            drained.close()
+            logger.info("Drained orphaned SMTP spool %s", drained.directory)
+        return self.spool, batch
+
+    async def _replay(self, sender: EmailSender, record: SpoolRecord) -> bool:
+        """Handle one record; False means the relay is down and it should be retried later."""
+        request_id = record["request_id"]
+        if time.time() - record["spooled_at"] > self.max_age:
+            await self._record(record, "failed", f"undeliverable for {self.max_age:.0f}s")
+            self._failed += 1
+            metrics.record_outcome("failed", "spool_expired")
+            return True
+        try:
+            status = await asyncio.to_thread(self.status_store.get_status, request_id)
+        except Exception as exc:
+            # Postgres being down must not stall the spool; a rare duplicate is the lesser harm.
+            logger.warning("Could not check status of spooled %s (%s); sending it", request_id, exc)
+            status = None
+        if status == "delivered":
+            self._skipped += 1
+            return True
+
+        try:
+            with metrics.stage("spool_replay"):
+                await sender.send_raw_email(record["to"], record["subject"], record["body"], raise_on_error=True)
+        except Exception as exc:
+            if classify(exc) == PERMANENT:
+                await self._record(record, "failed", str(exc)[:500])
+                self._failed += 1
+                metrics.record_outcome("failed", type(exc).__name__)
+                return True
+            if _recipient_deferred(exc):
+                # The relay answered; only this recipient is deferred, so don't block the others.
+                try:
+                    await asyncio.to_thread(self.spool.append, {**record, "attempts": record.get("attempts", 0) + 1})
+                    self._requeued += 1
+                    return True
+                except (SpoolFull, OSError) as spool_exc:
+                    logger.error("Could not requeue spooled %s: %s", request_id, spool_exc)
+            self._relay_failures += 1
+            return False
+
+        self._delivered += 1
+        metrics.record_outcome("delivered", "spool_replay")
+        await self._record(record, "delivered", None)
+        return True
+
+    async def _record(self, record: SpoolRecord, status: str, detail: Optional[str]) -> None:
+        request_id = record["request_id"]
+        try:
+            await asyncio.to_thread(
+                self.status_store.update_status,
+                request_id,
+                status,
+                settings.provider_name,
+                detail,
+                record.get("created_at"),
+            )
+        except Exception as exc:
+            logger.error("Could not record %s status of spooled %s: %s", status, request_id, exc)
+
+    async def _sleep(self, delay: float) -> None:
+        try:
+            await asyncio.wait_for(self._wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,354 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Connection
+from multiprocessing.sharedctypes import Synchronized
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector, mark_process_dead
+
+from app.config.settings import settings
+from app.observability import profiler
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 2.0
+
+
+def _serve_profiles(conn: Connection) -> None:
+    """Run the profiles the supervisor's ``/profile`` asks this worker for."""
+    while True:
+        try:
+            seconds, interval, thread_name = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply: Any = profiler.collapse(profiler.sample_stacks(seconds, interval, thread_name))
+        except profiler.ProfilerBusy as exc:
+            reply = exc
+        try:
+            conn.send(reply)
+        except OSError:
+            return
+
+
+def _run_worker(
+    worker_id: int, heartbeat: Any, in_flight: Synchronized, connected: Synchronized, profile_conn: Connection
+) -> None:
+    """Entry point of one consumer process."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s worker-{worker_id} %(levelname)s %(name)s: %(message)s",
+    )
+    from app.consumers.factory import create_consumer
+    from app.observability import metrics
+
+    consumer = create_consumer()
+    stop_requested = threading.Event()
+
+    def request_stop(signum, frame) -> None:
+        stop_requested.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    threading.Thread(target=_serve_profiles, args=(profile_conn,), name="worker-profiler", daemon=True).start()
+
+    outcome: Dict[str, bool] = {}
+    thread = threading.Thread(
+        target=lambda: outcome.setdefault("ok", consumer.start_consuming()),
+        name="email-consumer",
+        daemon=True,
+    )
+    thread.start()
+
+    while thread.is_alive() and not stop_requested.wait(HEARTBEAT_INTERVAL / 2):
+        heartbeat.value = time.time()
+        in_flight.value = getattr(consumer, "in_flight", 0)
+        connected.value = 1 if consumer.is_connected else 0
+        try:
+            metrics.export_stats()
+        except Exception as exc:
+            logger.debug("Could not export stats: %s", exc)
+
+    if stop_requested.is_set():
+        logger.info("Draining consumer")
+        # Stay inside the supervisor's kill deadline so the flush is not cut short.
+        consumer.drain(min(settings.drain_timeout, settings.worker_shutdown_timeout * 0.8))
+        thread.join(5)
+        os._exit(0)
+
+    # The consumer thread ended by itself (could not connect, broker gone).
+    os._exit(0 if outcome.get("ok") else 1)
+
+
+class WorkerHandle:
+    def __init__(self, worker_id: int, ctx: multiprocessing.context.BaseContext) -> None:
+        self.worker_id = worker_id
+        self.heartbeat = ctx.Value("d", 0.0, lock=False)
+        self.in_flight = ctx.Value("i", 0, lock=False)
+        self.connected = ctx.Value("b", 0, lock=False)
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.profile_conn: Optional[Connection] = None
+        self.profile_lock = threading.Lock()
+        self.started_at = 0.0
+        self.restarts = 0
+        self.backoff = 1.0
+        self.next_start = 0.0
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        alive = self.process is not None and self.process.is_alive()
+        heartbeat_age = now - self.heartbeat.value if self.heartbeat.value else None
+        return {
+            "worker_id": self.worker_id,
+            "pid": self.process.pid if self.process else None,
+            "alive": alive,
+            "connected": bool(self.connected.value) and alive,
+            "in_flight": self.in_flight.value if alive else 0,
+            "heartbeat_age_seconds": heartbeat_age,
+            "uptime_seconds": now - self.started_at if alive else 0.0,
+            "restarts": self.restarts,
+        }
+
+
+class ConsumerSupervisor:
+    """Runs N consumer processes, restarts crashed ones and stops them together.
+
+    Each worker is a separate process with its own event loop, so Jinja
+    rendering and JSON work spread across cores. A worker that exits is
+    restarted with exponential backoff (reset after it stayed up for a
+    minute). SIGTERM/SIGINT stops all workers, waiting up to
+    ``WORKER_SHUTDOWN_TIMEOUT`` seconds before killing stragglers. Aggregated
+    health and the workers' Prometheus metrics (multiprocess mode, files in
+    ``PROMETHEUS_MULTIPROC_DIR`` or a temporary directory) are served on
+    ``WORKER_HEALTH_PORT``, along with ``POST /profile`` for sampling one
+    worker's stacks.
+    """
+
+    def __init__(self, processes: int) -> None:
+        self._ctx = multiprocessing.get_context("spawn")
+        self.workers: List[WorkerHandle] = [WorkerHandle(i, self._ctx) for i in range(max(1, processes))]
+        self._stopping = threading.Event()
+        self._health_server: Optional[ThreadingHTTPServer] = None
+        self.metrics_dir = ""
+        self._owns_metrics_dir = False
+        self._metrics_registry: Optional[CollectorRegistry] = None
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        self._prepare_metrics_dir()
+        self._start_health_server()
+        logger.info("Starting %d email consumer processes", len(self.workers))
+
+        for worker in self.workers:
+            self._spawn(worker)
+        while not self._stopping.wait(1.0):
+            self._reap_and_restart()
+
+        self._shutdown_workers()
+        if self._health_server is not None:
+            self._health_server.shutdown()
+        if self._owns_metrics_dir:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        logger.info("All email consumer processes stopped")
+        return 0
+
+    def health(self) -> Dict[str, Any]:
+        now = time.time()
+        workers = [worker.snapshot(now) for worker in self.workers]
+        stale_after = HEARTBEAT_INTERVAL * 5
+        healthy = [
+            w for w in workers
+            if w["alive"] and w["heartbeat_age_seconds"] is not None and w["heartbeat_age_seconds"] < stale_after
+        ]
+        if len(healthy) == len(workers):
+            status = "healthy"
+        elif healthy:
+            status = "degraded"
+        else:
+            status = "unhealthy"
+        return {
+            "status": status,
+            "service": settings.service_name,
+            "workers_total": len(workers),
+            "workers_healthy": len(healthy),
+            "workers_connected": sum(1 for w in workers if w["connected"]),
+            "in_flight": sum(w["in_flight"] for w in workers),
+            "workers": workers,
+        }
+
+    def metrics(self) -> bytes:
+        """Prometheus text for every worker, merged from the multiprocess directory."""
+        if self._metrics_registry is None:
+            self._metrics_registry = CollectorRegistry()
+            MultiProcessCollector(self._metrics_registry, path=self.metrics_dir)
+        return generate_latest(self._metrics_registry)
+
+    def profile(self, worker_id: int, seconds: float, interval: float, thread_name: Optional[str]) -> str:
+        """Collapsed stacks of one worker, sampled inside that process; raises LookupError if it is not running."""
+        if not 0 <= worker_id < len(self.workers):
+            raise LookupError(f"no worker {worker_id}")
+        worker = self.workers[worker_id]
+        seconds = min(seconds, settings.profile_max_seconds)
+        with worker.profile_lock:
+            conn = worker.profile_conn
+            if conn is None or worker.process is None or not worker.process.is_alive():
+                raise LookupError(f"worker {worker_id} is not running")
+            # Drop a reply a timed-out request left behind.
+            while conn.poll():
+                conn.recv()
+            conn.send((seconds, interval, thread_name))
+            if not conn.poll(seconds + 10.0):
+                raise TimeoutError(f"worker {worker_id} did not answer")
+            reply = conn.recv()
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def _prepare_metrics_dir(self) -> None:
+        self.metrics_dir = settings.worker_metrics_dir
+        if not self.metrics_dir:
+            self.metrics_dir = tempfile.mkdtemp(prefix="email-worker-metrics-")
+            self._owns_metrics_dir = True
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        # Files left by an earlier run would be merged into this one's counters.
+        for name in os.listdir(self.metrics_dir):
+            if name.endswith(".db"):
+                os.remove(os.path.join(self.metrics_dir, name))
+        # Spawned workers inherit it and put prometheus_client in multiprocess mode.
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = self.metrics_dir
+
+    def _request_stop(self, signum, frame) -> None:
+        logger.info("Received signal %s; stopping consumer processes", signum)
+        self._stopping.set()
+
+    def _spawn(self, worker: WorkerHandle) -> None:
+        worker.heartbeat.value = 0.0
+        worker.connected.value = 0
+        worker.in_flight.value = 0
+        if worker.profile_conn is not None:
+            worker.profile_conn.close()
+        worker.profile_conn, child_conn = self._ctx.Pipe()
+        worker.process = self._ctx.Process(
+            target=_run_worker,
+            args=(worker.worker_id, worker.heartbeat, worker.in_flight, worker.connected, child_conn),
+            name=f"email-worker-{worker.worker_id}",
+        )
+        worker.process.start()
+        child_conn.close()
+        worker.started_at = time.time()
+        logger.info("Started email worker %d (pid %s)", worker.worker_id, worker.process.pid)
+
+    def _reap_and_restart(self) -> None:
+        now = time.time()
+        for worker in self.workers:
+            process = worker.process
+            if process is None or process.is_alive():
+                continue
+            if worker.next_start == 0.0:
+                mark_process_dead(process.pid, self.metrics_dir)
+                if now - worker.started_at > 60.0:
+                    worker.backoff = 1.0
+                worker.next_start = now + worker.backoff
+                logger.warning(
+                    "Email worker %d exited with code %s; restarting in %.0fs",
+                    worker.worker_id,
+                    process.exitcode,
+                    worker.backoff,
+                )
+                worker.backoff = min(worker.backoff * 2, 60.0)
+            elif now >= worker.next_start:
+                worker.next_start = 0.0
+                worker.restarts += 1
+                self._spawn(worker)
+
+    def _shutdown_workers(self) -> None:
+        running = [w.process for w in self.workers if w.process is not None and w.process.is_alive()]
+        for process in running:
+            process.terminate()
+
+        deadline = time.monotonic() + settings.worker_shutdown_timeout
+        for process in running:
+            process.join(max(0.0, deadline - time.monotonic()))
+        for process in running:
+            if process.is_alive():
+                logger.warning("Email worker pid %s did not stop in time; killing it", process.pid)
+                process.kill()
+                process.join()
+            mark_process_dead(process.pid, self.metrics_dir)
+
+    def _start_health_server(self) -> None:
+        if not settings.worker_health_port:
+            return
+        supervisor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802 - http.server API
+                path = self.path.rstrip("/")
+                if path == "/metrics":
+                    payload = supervisor.metrics()
+                    self.send_response(200)
+                    self.send_header("Content-Type", CONTENT_TYPE_LATEST)
+                elif path == "/health":
+                    report = supervisor.health()
+                    payload = json.dumps(report).encode()
+                    self.send_response(200 if report["status"] != "unhealthy" else 503)
+                    self.send_header("Content-Type", "application/json")
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self) -> None:  # noqa: N802 - http.server API
+                url = urlsplit(self.path)
+                if url.path.rstrip("/") != "/profile":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                try:
+                    worker_id = int(query.get("worker", "0"))
+                    seconds = float(query.get("seconds", "10"))
+                    interval = float(query.get("interval_ms", "10")) / 1000
+                    if seconds <= 0 or interval < 0.001:
+                        raise ValueError("seconds must be > 0 and interval_ms >= 1")
+                except ValueError as exc:
+                    self._reply(400, f"{exc}\n".encode())
+                    return
+                try:
+                    text = supervisor.profile(worker_id, seconds, interval, query.get("thread"))
+                except LookupError as exc:
+                    self._reply(404, f"{exc}\n".encode())
+                except profiler.ProfilerBusy as exc:
+                    self._reply(409, f"{exc}\n".encode())
+                except (TimeoutError, OSError, EOFError) as exc:
+                    self._reply(503, f"{exc}\n".encode())
+                else:
+                    self._reply(200, text.encode())
+
+            def _reply(self, status: int, payload: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._health_server = ThreadingHTTPServer(("0.0.0.0", settings.worker_health_port), Handler)
+        self._health_server.daemon_threads = True
+        threading.Thread(target=self._health_server.serve_forever, name="worker-health", daemon=True).start()
+        logger.info("Worker health endpoint on :%d/health, metrics on /metrics", settings.worker_health_port)
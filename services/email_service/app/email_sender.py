@@ -1,12 +1,20 @@
 # app/email_sender.py
+import asyncio
+import functools
 import logging
 from email.message import EmailMessage
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 import aiosmtplib
 import jinja2
 
 from app.config.settings import settings
+from app.observability import metrics
+from app.services.concurrency import AdaptiveLimit, CircuitBreaker
+from app.services.domain_limiter import DomainRateLimiter, parse_domain_map, parse_rate, recipient_domain
+from app.services.render_pool import RenderError, render_pool
+from app.services.smtp_pool import SMTPConnectionPool
+from app.services.template_cache import compiled_templates
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +25,72 @@ class EmailSender:
         self.smtp_port = settings.smtp_port
         self.smtp_username = settings.smtp_username
         self.smtp_password = settings.smtp_password
+        self.smtp_start_tls = settings.smtp_start_tls
 
+        self.builtin_templates = self._get_builtin_templates()
         self.template_env = jinja2.Environment(
-            loader=jinja2.DictLoader(self._get_builtin_templates())
+            loader=jinja2.DictLoader(self.builtin_templates)
+        )
+        # The default relay's breaker pauses consumption (``relay_wait`` leaves it to the consumer).
+        self.breaker = self._new_breaker()
+        self.smtp_pool = self._new_pool(self.smtp_host, self.smtp_port, breaker=self.breaker)
+        # Domains routed to dedicated relays get their own pool, adaptive limit
+        # and breaker, so a slow or failing provider only holds back its own mail.
+        self.route_pools: Dict[str, SMTPConnectionPool] = {}
+        self.domain_routes: Dict[str, SMTPConnectionPool] = {}
+        for domain, relay in parse_domain_map(settings.smtp_domain_routes).items():
+            if relay not in self.route_pools:
+                host, _, port = relay.partition(":")
+                breaker = self._new_breaker(f"SMTP relay {relay}")
+                self.route_pools[relay] = self._new_pool(host, int(port or self.smtp_port), breaker=breaker)
+            self.domain_routes[domain] = self.route_pools[relay]
+
+        self.rate_limiter = DomainRateLimiter(
+            default_rate=settings.domain_default_rate,
+            default_burst=settings.domain_default_burst,
+            rates={domain: parse_rate(rate) for domain, rate in parse_domain_map(settings.domain_rates).items()},
+        )
+
+    def _new_breaker(self, name: str = "SMTP") -> Optional[CircuitBreaker]:
+        if not settings.smtp_breaker_enabled:
+            return None
+        return CircuitBreaker(
+            failure_rate=settings.smtp_breaker_failure_rate,
+            min_requests=settings.smtp_breaker_min_requests,
+            window=settings.smtp_breaker_window,
+            open_seconds=settings.smtp_breaker_open_seconds,
+            max_open_seconds=settings.smtp_breaker_max_open_seconds,
+            probes=settings.smtp_breaker_probes,
+            name=name,
+        )
+
+    def _new_pool(
+        self, host: Optional[str], port: Optional[int], breaker: Optional[CircuitBreaker] = None
+    ) -> SMTPConnectionPool:
+        limit = None
+        if settings.smtp_adaptive_concurrency:
+            limit = AdaptiveLimit(
+                settings.smtp_pool_size,
+                min_limit=settings.smtp_adaptive_min_limit,
+                tolerance=settings.smtp_adaptive_latency_tolerance,
+                backoff=settings.smtp_adaptive_backoff,
+            )
+        return SMTPConnectionPool(
+            functools.partial(self._new_smtp_connection, host, port),
+            max_size=settings.smtp_pool_size,
+            max_messages_per_connection=settings.smtp_pool_max_messages,
+            idle_timeout=settings.smtp_pool_idle_timeout,
+            limit=limit,
+            breaker=breaker,
+        )
+
+    def _new_smtp_connection(self, host: Optional[str] = None, port: Optional[int] = None) -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(
+            hostname=host or self.smtp_host,
+            port=port or self.smtp_port,
+            username=self.smtp_username,
+            password=self.smtp_password,
+            start_tls=self.smtp_start_tls,
         )
 
     def _get_builtin_templates(self) -> Dict[str, str]:
@@ -37,11 +108,30 @@ class EmailSender:
 
     def render_template(self, template_id: str, variables: Dict[str, Any]) -> str:
         try:
-            template = self.template_env.get_template(template_id)
+            source = self.builtin_templates.get(template_id)
+            if source is None:
+                raise jinja2.TemplateNotFound(template_id)
+            template = compiled_templates.get("builtin", self.template_env, source, template_id)
             return template.render(**variables)
         except jinja2.TemplateError as exc:
             logger.warning("Template %s not found (%s); using fallback", template_id, exc)
-            return f"""
+            return self._fallback_body(variables)
+
+    async def render_template_async(self, template_id: str, variables: Dict[str, Any]) -> str:
+        """``render_template``, offloading costly templates to the render process pool when one is configured."""
+        source = self.builtin_templates.get(template_id)
+        if render_pool is None or source is None:
+            return self.render_template(template_id, variables)
+        try:
+            return await render_pool.render_or_inline(
+                "builtin", source, variables, template_id, functools.partial(self.render_template, template_id, variables)
+            )
+        except RenderError as exc:
+            logger.warning("Template %s failed to render (%s); using fallback", template_id, exc)
+            return self._fallback_body(variables)
+
+    def _fallback_body(self, variables: Dict[str, Any]) -> str:
+        return f"""
             <html>
                 <body>
                     <p>{variables.get('message', 'You have a new notification.')}</p>
@@ -49,40 +139,106 @@ class EmailSender:
             </html>
             """
 
+    def register_stats(self, source: str) -> None:
+        pools = {source: self.smtp_pool}
+        pools.update({f"{source}:{relay}": pool for relay, pool in self.route_pools.items()})
+        for name, pool in pools.items():
+            metrics.register_stats("smtp_pool", pool.stats, source=name)
+            if pool.limit is not None:
+                metrics.register_stats("smtp_concurrency", pool.limit.stats, source=name)
+            if pool.breaker is not None:
+                metrics.register_stats("smtp_breaker", pool.breaker.stats, source=name)
+        metrics.register_stats("domain_limiter", self.rate_limiter.stats, source=source)
+        if render_pool is not None:
+            metrics.register_stats("render_pool", render_pool.stats, source=source)
+
+    def pool_for(self, to_email: str) -> SMTPConnectionPool:
+        if not self.domain_routes:
+            return self.smtp_pool
+        return self.domain_routes.get(recipient_domain(to_email), self.smtp_pool)
+
+    def relay_wait(self, to_email: str) -> float:
+        """Seconds until the recipient's routed relay takes mail again (its breaker is open); 0 to send now."""
+        pool = self.pool_for(to_email)
+        if pool is self.smtp_pool or pool.breaker is None:
+            return 0.0
+        return pool.breaker.acquire()
+
+    def reserve(self, to_email: str) -> float:
+        """Book a send slot for the recipient's domain; returns seconds to wait for it."""
+        return self.rate_limiter.reserve(recipient_domain(to_email))
+
+    def cancel_reservation(self, to_email: str) -> None:
+        self.rate_limiter.cancel(recipient_domain(to_email))
+
     def _is_smtp_configured(self) -> bool:
         return all([self.smtp_host, self.smtp_port, self.smtp_username, self.smtp_password])
 
-    async def send_raw_email(self, to_email: str, subject: str, body: str) -> bool:
+    async def send_raw_email(
+        self,
+        to_email: str,
+        subject: str,
+        body: str,
+        raise_on_error: bool = False,
+        reserved: bool = False,
+    ) -> bool:
+        """Send one message; ``reserved`` means the caller already waited out ``reserve``."""
+        if not reserved:
+            delay = self.reserve(to_email)
+            if delay:
+                await asyncio.sleep(delay)
+
         if not self._is_smtp_configured():
             logger.warning("SMTP not configured - simulated send to %s", to_email)
             logger.info("SUBJECT: %s", subject)
             logger.info("BODY: %s", body)
             return True
 
-        message = EmailMessage()
-        message["From"] = self.smtp_username
-        message["To"] = to_email
-        message["Subject"] = subject
-        message.set_content(body, subtype="html")
-
+        message = self._build_message(to_email, subject, body)
         try:
-            await aiosmtplib.send(
-                message,
-                hostname=self.smtp_host,
-                port=self.smtp_port,
-                username=self.smtp_username,
-                password=self.smtp_password,
-                start_tls=True,
-            )
+            await self.pool_for(to_email).send_message(message)
             logger.info("Email sent successfully to %s", to_email)
             return True
         except Exception as exc:
             logger.error("Failed to send email via SMTP: %s", exc)
+            if raise_on_error:
+                raise
             return False
 
+    async def send_bulk(
+        self, recipients: List[str], subject: str, body: str
+    ) -> Dict[str, aiosmtplib.SMTPResponse]:
+        """Send one identical message to several recipients in a single SMTP transaction.
+
+        The MIME message is built once and addressed via RCPT TO only, so
+        recipients do not see each other. All recipients must share a route
+        (see ``pool_for``). Returns the refused recipients with the server's
+        reply; raises when the transaction as a whole failed.
+        """
+        if not self._is_smtp_configured():
+            logger.warning("SMTP not configured - simulated send to %d recipients", len(recipients))
+            return {}
+
+        to_header = recipients[0] if len(recipients) == 1 else "undisclosed-recipients:;"
+        message = self._build_message(to_header, subject, body)
+        return await self.pool_for(recipients[0]).send_message(message, recipients=recipients)
+
+    def _build_message(self, to_header: str, subject: str, body: str) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.smtp_username
+        message["To"] = to_header
+        message["Subject"] = subject
+        message.set_content(body, subtype="html")
+        return message
+
+    async def close(self) -> None:
+        await self.smtp_pool.close()
+        for pool in self.route_pools.values():
+            await pool.close()
+
     async def send_email(
         self, to_email: str, subject: str, template_id: str, variables: Dict[str, Any]
     ) -> bool:
-        rendered_body = self.render_template(template_id, variables)
+        rendered_body = await self.render_template_async(template_id, variables)
         final_subject = subject or "Notification"
         return await self.send_raw_email(to_email, final_subject, rendered_body)
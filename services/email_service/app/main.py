@@ -1,19 +1,39 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from typing import Dict, Any, Optional, List, AsyncIterator, Set, Tuple
+from datetime import datetime, timezone
+import asyncio
 import threading
 import logging
 import json
+import time
+import uuid
+from app.api.admin import drain_service, router as admin_router
 from app.api.health import router as health_router
-from app.consumers.base_consumer import EmailConsumer
+from app.api.metrics import router as metrics_router
+from app.api.statuses import router as statuses_router, shared_status_store
+from app.consumers.factory import create_consumer
 from app.config.settings import settings
+from app.email_sender import EmailSender
+from app.models.envelope import EnvelopeError, decode_envelope
+from app.observability import metrics
+from app.services.delivery_index import DELIVERED, IN_FLIGHT, DeliveryIndex, DurableLookupFailed
+from app.services.publisher import EnvelopePublisher, PublishError, create_publisher
+from app.services.status_store import IdempotencyKeyStore
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+HTTP_SEND_MODES = ("send", "enqueue")
+if settings.http_send_mode not in HTTP_SEND_MODES:
+    raise ValueError(f"EMAIL_HTTP_SEND_MODE must be one of {HTTP_SEND_MODES}")
+
 app = FastAPI(title=settings.service_name)
+_state_lock = threading.Lock()
+# Queued-status writes still running; held so they are not garbage-collected, and awaited on shutdown.
+_status_writes: Set[asyncio.Task] = set()
 
 # Request/Response Models
 class EmailRequest(BaseModel):
@@ -29,6 +49,7 @@ class EmailResponse(BaseModel):
     message: str
     error: Optional[str] = None
     timestamp: str
+    request_id: Optional[str] = None
 
 class BatchEmailRequest(BaseModel):
     emails: List[EmailRequest]
@@ -43,41 +64,267 @@ class BatchEmailResponse(BaseModel):
 
 # Include routers
 app.include_router(health_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
+app.include_router(statuses_router)
+
+INSTRUMENTED_ENDPOINTS = {"/send-email", "/send-batch-emails", "/test-email"}
+
+@app.middleware("http")
+async def instrument_send_endpoints(request: Request, call_next):
+    endpoint = request.url.path
+    if endpoint not in INSTRUMENTED_ENDPOINTS:
+        return await call_next(request)
+
+    in_flight = metrics.HTTP_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        metrics.HTTP_REQUEST_DURATION.labels(endpoint, str(status_code)).observe(time.perf_counter() - started)
+
+def get_email_sender() -> EmailSender:
+    """Sender shared by the HTTP endpoints so SMTP sessions and compiled templates are reused."""
+    sender = getattr(app.state, "email_sender", None)
+    if sender is None:
+        sender = EmailSender()
+        app.state.email_sender = sender
+        sender.register_stats("http")
+    return sender
+
+def get_envelope_publisher() -> EnvelopePublisher:
+    """Publisher for EMAIL_HTTP_SEND_MODE=enqueue; its connection and channels live as long as the app."""
+    publisher = getattr(app.state, "envelope_publisher", None)
+    if publisher is None:
+        publisher = create_publisher()
+        app.state.envelope_publisher = publisher
+        metrics.register_stats("publisher", publisher.stats, source="http")
+    return publisher
+
+def get_delivery_index() -> DeliveryIndex:
+    """Idempotency index for the HTTP endpoints, backed by the idempotency key table when reachable."""
+    with _state_lock:
+        index = getattr(app.state, "delivery_index", None)
+        if index is None:
+            keys = None
+            store = shared_status_store(app)
+            if store is not None:
+                try:
+                    keys = IdempotencyKeyStore(store)
+                except Exception as exc:
+                    logger.warning("Idempotency key table unavailable: %s", exc)
+            if keys is None:
+                logger.warning("Idempotency keys are remembered in memory only")
+            index = DeliveryIndex(keys, settings.delivery_index_size)
+            app.state.delivery_index = index
+            metrics.register_stats("delivery_index", index.stats, source="http")
+        return index
+
+async def _deliver_once(
+    email_sender: EmailSender, email_request: EmailRequest, idempotency_key: Optional[str]
+) -> Tuple[bool, Optional[str]]:
+    """Send unless idempotency_key was already handled; returns (success, duplicate_state)."""
+    async def send() -> bool:
+        return await email_sender.send_email(
+            to_email=email_request.recipient_email,
+            subject=email_request.subject,
+            template_id=email_request.template_id,
+            variables=email_request.variables
+        )
+
+    if not idempotency_key:
+        return await send(), None
+
+    key = idempotency_key
+    index = await asyncio.to_thread(get_delivery_index)
+    state = index.claim(key)
+    if state is None:
+        try:
+            if await asyncio.to_thread(index.delivered_durably, key):
+                state = DELIVERED
+        except DurableLookupFailed:
+            # Unknown whether it was sent: answer as in progress so the client retries later.
+            state = IN_FLIGHT
+    if state is not None:
+        return state == DELIVERED, state
+
+    delivered = False
+    try:
+        delivered = await send()
+        if delivered and index.status_store is not None:
+            try:
+                await asyncio.to_thread(index.status_store.mark_delivered, key)
+            except Exception as exc:
+                logger.warning("Failed to record delivery of idempotency key %s: %s", idempotency_key, exc)
+        return delivered, None
+    finally:
+        index.release(key, delivered)
+
+def _delivery_response(
+    endpoint: str, message_id: str, success: bool, duplicate_state: Optional[str]
+) -> EmailResponse:
+    if duplicate_state is not None:
+        metrics.HTTP_EMAILS.labels(endpoint, "duplicate").inc()
+    else:
+        metrics.HTTP_EMAILS.labels(endpoint, "sent" if success else "failed").inc()
+
+    if duplicate_state == DELIVERED:
+        return EmailResponse(
+            success=True,
+            message_id=message_id,
+            message="Email already sent for this idempotency key",
+            timestamp=datetime.utcnow().isoformat()
+        )
+    if duplicate_state is not None:
+        return EmailResponse(
+            success=False,
+            message_id=message_id,
+            message="Duplicate request still in progress",
+            error="Request with this idempotency key is in progress",
+            timestamp=datetime.utcnow().isoformat()
+        )
+    if success:
+        return EmailResponse(
+            success=True,
+            message_id=message_id,
+            message="Email queued successfully",
+            timestamp=datetime.utcnow().isoformat()
+        )
+    return EmailResponse(
+        success=False,
+        message_id=message_id,
+        message="Failed to process email",
+        error="Email processing failed",
+        timestamp=datetime.utcnow().isoformat()
+    )
+
+def _build_envelope(
+    email_request: EmailRequest, idempotency_key: Optional[str], correlation_id: Optional[str], created_at: str
+) -> Tuple[str, bytes]:
+    """The queue message for one request, checked against the envelope schema; returns (request_id, body)."""
+    if idempotency_key:
+        # Same key, same request_id: the consumer's delivery index then drops the repeat.
+        request_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"email-service:http:{idempotency_key}"))
+    else:
+        request_id = str(uuid.uuid4())
+    recipient = email_request.recipient_email
+    envelope = {
+        "request_id": request_id,
+        "correlation_id": correlation_id or request_id,
+        "created_at": created_at,
+        "channel": "email",
+        # HTTP callers name a mailbox rather than a user record; derive a stable id from it.
+        "user": {"id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"mailto:{recipient}")), "email": recipient},
+        "template": {"slug": email_request.template_id, "subject": email_request.subject},
+        "variables": email_request.variables,
+        "retry_count": 0,
+    }
+    body = json.dumps(envelope).encode("utf-8")
+    # Same checks the consumer applies, so nothing accepted here is dead-lettered as malformed.
+    decode_envelope(body)
+    return request_id, body
+
+def _record_queued(request_ids: List[str], created_at: str) -> None:
+    """Write a ``queued`` status row per published request in the background.
+
+    The reply does not wait for it: the messages are already with the broker,
+    and a slow or unreachable status database must not hold up or fail it.
+    """
+    if not request_ids:
+        return
+    task = asyncio.get_running_loop().create_task(_write_queued(request_ids, created_at))
+    _status_writes.add(task)
+    task.add_done_callback(_status_writes.discard)
+
+async def _write_queued(request_ids: List[str], created_at: str) -> None:
+    store = await asyncio.to_thread(shared_status_store, app)
+    if store is None:
+        return
+    updates = [(request_id, "queued", settings.provider_name, None) for request_id in request_ids]
+    try:
+        await asyncio.to_thread(store.add_statuses, updates, created_at)
+    except Exception as e:
+        # The messages are queued either way; the consumer writes their next status.
+        logger.warning("Could not record queued status for %d emails: %s", len(updates), e)
+
+async def _enqueue(
+    endpoint: str,
+    email_request: EmailRequest,
+    idempotency_key: Optional[str],
+    correlation_id: Optional[str],
+    created_at: Optional[str] = None,
+) -> Tuple[int, EmailResponse]:
+    """Publish one request to EMAIL_QUEUE; returns (status_code, response) once the broker has confirmed it.
+
+    A single request (no ``created_at``) also gets its ``queued`` status row
+    here; batches pass one ``created_at`` for all items and write the rows
+    together.
+    """
+    record_status = created_at is None
+    created_at = created_at or datetime.now(timezone.utc).isoformat()
+    try:
+        request_id, body = _build_envelope(email_request, idempotency_key, correlation_id, created_at)
+    except EnvelopeError as e:
+        metrics.HTTP_EMAILS.labels(endpoint, "rejected").inc()
+        return 422, EmailResponse(
+            success=False,
+            message_id="invalid",
+            message="Request does not make a valid message envelope",
+            error=str(e),
+            timestamp=datetime.utcnow().isoformat()
+        )
+    try:
+        await get_envelope_publisher().publish(body, request_id, correlation_id or request_id)
+    except PublishError as e:
+        metrics.HTTP_EMAILS.labels(endpoint, "error").inc()
+        return 503, EmailResponse(
+            success=False,
+            message_id=request_id,
+            message="Email could not be queued",
+            error=str(e),
+            timestamp=datetime.utcnow().isoformat(),
+            request_id=request_id
+        )
+    metrics.HTTP_EMAILS.labels(endpoint, "queued").inc()
+    if record_status:
+        _record_queued([request_id], created_at)
+    return 202, EmailResponse(
+        success=True,
+        message_id=request_id,
+        message="Email queued successfully",
+        timestamp=datetime.utcnow().isoformat(),
+        request_id=request_id
+    )
 
 # Client Endpoints
 @app.post("/send-email", response_model=EmailResponse)
-async def send_email(request: EmailRequest, background_tasks: BackgroundTasks):
-    """Send a single email - Client facing endpoint"""
+async def send_email(request: EmailRequest, background_tasks: BackgroundTasks, http_request: Request):
+    """Send a single email - Client facing endpoint
+
+    With EMAIL_HTTP_SEND_MODE=enqueue the email is published to EMAIL_QUEUE
+    instead of sent, and the reply is a 202 carrying its ``request_id``.
+    """
+    if settings.http_send_mode == "enqueue":
+        status_code, response = await _enqueue(
+            "/send-email", request, request.idempotency_key, http_request.headers.get("x-correlation-id")
+        )
+        return JSONResponse(status_code=status_code, content=response.model_dump())
+
     try:
         message_id = f"email-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{hash(request.recipient_email) % 10000:04d}"
         
-        from app.email_sender import EmailSender
-        email_sender = EmailSender()
+        email_sender = get_email_sender()
         
-        success = await email_sender.send_email(
-            to_email=request.recipient_email,
-            subject=request.subject,
-            template_id=request.template_id,
-            variables=request.variables
-        )
-        
-        if success:
-            return EmailResponse(
-                success=True,
-                message_id=message_id,
-                message="Email queued successfully",
-                timestamp=datetime.utcnow().isoformat()
-            )
-        else:
-            return EmailResponse(
-                success=False,
-                message_id=message_id,
-                message="Failed to process email",
-                error="Email processing failed",
-                timestamp=datetime.utcnow().isoformat()
-            )
+        success, duplicate_state = await _deliver_once(email_sender, request, request.idempotency_key)
+        return _delivery_response("/send-email", message_id, success, duplicate_state)
             
     except Exception as e:
+        metrics.HTTP_EMAILS.labels("/send-email", "error").inc()
         return EmailResponse(
             success=False,
             message_id="error",
@@ -86,55 +333,118 @@ async def send_email(request: EmailRequest, background_tasks: BackgroundTasks):
             timestamp=datetime.utcnow().isoformat()
         )
 
-@app.post("/send-batch-emails", response_model=BatchEmailResponse)
-async def send_batch_emails(request: BatchEmailRequest):
-    """Send multiple emails in batch - Client facing endpoint"""
+async def _send_batch_item(
+    email_sender: EmailSender,
+    index: int,
+    email_request: EmailRequest,
+    slots: asyncio.Semaphore,
+    batch_key: Optional[str] = None,
+) -> Tuple[int, EmailResponse]:
+    message_id = f"batch-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{index:04d}"
+    idempotency_key = email_request.idempotency_key
+    if not idempotency_key and batch_key:
+        idempotency_key = f"{batch_key}:{index}"
+    async with slots:
+        try:
+            success, duplicate_state = await _deliver_once(email_sender, email_request, idempotency_key)
+        except Exception as e:
+            metrics.HTTP_EMAILS.labels("/send-batch-emails", "error").inc()
+            return index, EmailResponse(
+                success=False,
+                message_id=message_id,
+                message="Internal error processing email",
+                error=str(e),
+                timestamp=datetime.utcnow().isoformat()
+            )
+
+    return index, _delivery_response("/send-batch-emails", message_id, success, duplicate_state)
+
+async def _stream_batch(email_sender: EmailSender, request: BatchEmailRequest) -> AsyncIterator[str]:
+    """Yield one NDJSON line per item as it finishes, then a summary line."""
+    slots = asyncio.Semaphore(max(1, settings.batch_send_concurrency))
+    tasks = [
+        asyncio.create_task(
+            _send_batch_item(email_sender, index, email_request, slots, request.idempotency_key)
+        )
+        for index, email_request in enumerate(request.emails)
+    ]
+    processed_count = 0
+    failed_count = 0
     try:
-        results = []
-        processed_count = 0
-        failed_count = 0
-        
-        for email_request in request.emails:
-            message_id = f"batch-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{processed_count:04d}"
-            
-            try:
-                from app.email_sender import EmailSender
-                email_sender = EmailSender()
-                
-                success = await email_sender.send_email(
-                    to_email=email_request.recipient_email,
-                    subject=email_request.subject,
-                    template_id=email_request.template_id,
-                    variables=email_request.variables
-                )
-                
-                if success:
-                    results.append(EmailResponse(
-                        success=True,
-                        message_id=message_id,
-                        message="Email queued successfully",
-                        timestamp=datetime.utcnow().isoformat()
-                    ))
-                    processed_count += 1
-                else:
-                    results.append(EmailResponse(
-                        success=False,
-                        message_id=message_id,
-                        message="Failed to process email",
-                        error="Email processing failed",
-                        timestamp=datetime.utcnow().isoformat()
-                    ))
-                    failed_count += 1
-                    
-            except Exception as e:
-                results.append(EmailResponse(
-                    success=False,
-                    message_id=message_id,
-                    message="Internal error processing email",
-                    error=str(e),
-                    timestamp=datetime.utcnow().isoformat()
-                ))
+        for next_done in asyncio.as_completed(tasks):
+            index, result = await next_done
+            if result.success:
+                processed_count += 1
+            else:
                 failed_count += 1
+            yield json.dumps({"index": index, **result.model_dump()}) + "\n"
+
+        yield json.dumps({
+            "success": failed_count == 0,
+            "processed_count": processed_count,
+            "failed_count": failed_count,
+            "message": f"Processed {processed_count} emails, {failed_count} failed"
+        }) + "\n"
+    finally:
+        # Client went away mid-stream: don't keep sending on its behalf.
+        for task in tasks:
+            task.cancel()
+
+async def _enqueue_batch(request: BatchEmailRequest, correlation_id: Optional[str]) -> JSONResponse:
+    created_at = datetime.now(timezone.utc).isoformat()
+    outcomes = await asyncio.gather(*(
+        _enqueue(
+            "/send-batch-emails",
+            email_request,
+            email_request.idempotency_key or (f"{request.idempotency_key}:{index}" if request.idempotency_key else None),
+            correlation_id,
+            created_at,
+        )
+        for index, email_request in enumerate(request.emails)
+    ))
+    results = [result for _, result in outcomes]
+    _record_queued([result.request_id for result in results if result.success], created_at)
+    processed_count = sum(1 for result in results if result.success)
+    failed_count = len(results) - processed_count
+    # Partly queued batches are still 202: failed items can be resent with their idempotency keys.
+    status_code = 202
+    if results and not processed_count:
+        status_code = 422 if all(code == 422 for code, _ in outcomes) else 503
+    response = BatchEmailResponse(
+        success=failed_count == 0,
+        processed_count=processed_count,
+        failed_count=failed_count,
+        results=results,
+        message=f"Queued {processed_count} emails, {failed_count} failed"
+    )
+    return JSONResponse(status_code=status_code, content=response.model_dump())
+
+@app.post("/send-batch-emails", response_model=BatchEmailResponse)
+async def send_batch_emails(request: BatchEmailRequest, http_request: Request, stream: bool = False):
+    """Send multiple emails in batch - Client facing endpoint
+
+    Items are sent concurrently (bounded by BATCH_SEND_CONCURRENCY). With
+    ``?stream=true`` per-item results are streamed back as NDJSON in
+    completion order, followed by a summary line. In enqueue mode every
+    item is published at once and the reply comes when the broker has
+    confirmed them all, so ``stream`` has no effect.
+    """
+    if settings.http_send_mode == "enqueue":
+        return await _enqueue_batch(request, http_request.headers.get("x-correlation-id"))
+
+    email_sender = get_email_sender()
+    if stream:
+        return StreamingResponse(_stream_batch(email_sender, request), media_type="application/x-ndjson")
+
+    try:
+        slots = asyncio.Semaphore(max(1, settings.batch_send_concurrency))
+        outcomes = await asyncio.gather(*(
+            _send_batch_item(email_sender, index, email_request, slots, request.idempotency_key)
+            for index, email_request in enumerate(request.emails)
+        ))
+        results = [result for _, result in outcomes]
+        processed_count = sum(1 for result in results if result.success)
+        failed_count = len(results) - processed_count
         
         return BatchEmailResponse(
             success=failed_count == 0,
@@ -156,8 +466,7 @@ async def send_batch_emails(request: BatchEmailRequest):
 @app.post("/test-email")
 async def test_email(recipient_email: str = "test@example.com"):
     """Test endpoint with parameter support"""
-    from app.email_sender import EmailSender
-    email_sender = EmailSender()
+    email_sender = get_email_sender()
     
     success = await email_sender.send_email(
         to_email=recipient_email,
@@ -177,22 +486,45 @@ async def test_email(recipient_email: str = "test@example.com"):
 
 @app.on_event("startup")
 def startup_event():
-    consumer = EmailConsumer()
-    thread = threading.Thread(target=consumer.start_consuming, daemon=True)
+    get_email_sender()
+    if settings.http_send_mode == "enqueue":
+        get_envelope_publisher()
+    if not settings.embedded_consumer:
+        # Consumers run as separate processes (python worker.py).
+        logger.info("Embedded email consumer disabled; serving HTTP API only")
+        return
+    consumer = create_consumer()
+    thread = threading.Thread(target=consumer.start_consuming, name="email-consumer", daemon=True)
     thread.start()
     app.state.email_consumer = consumer
     app.state.consumer_thread = thread
     logger.info("🚀 Email consumer thread started")
 
 @app.on_event("shutdown")
-def shutdown_event():
+async def shutdown_event():
+    result = await drain_service(app, settings.drain_timeout)
+    if _status_writes:
+        await asyncio.wait(set(_status_writes), timeout=settings.status_pool_timeout)
+    closers = []
     consumer = getattr(app.state, "email_consumer", None)
     if consumer:
+        await asyncio.to_thread(app.state.consumer_thread.join, 5)
+        closers += [consumer.status_store.close, consumer.template_client.close]
+    store = getattr(app.state, "status_store", None)
+    if store is not None:
+        closers.append(store.close)
+    for close in closers:
         try:
-            consumer.stop_consuming()
-        except Exception:
-            pass
-    logger.info("🛑 Shutdown complete")
+            await asyncio.to_thread(close)
+        except Exception as exc:
+            logger.error("Error while closing %s: %s", close.__qualname__, exc)
+    publisher = getattr(app.state, "envelope_publisher", None)
+    if publisher is not None:
+        await publisher.close()
+    sender = getattr(app.state, "email_sender", None)
+    if sender is not None:
+        await sender.close()
+    logger.info("🛑 Shutdown complete (drained=%s)", result["drained"])
 
 @app.get("/")
 async def root():
@@ -201,6 +533,12 @@ async def root():
         "service": settings.service_name,
         "endpoints": {
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
+            "metrics": "/metrics",
+            "drain": "/admin/drain (POST)",
+            "profile": "/admin/profile (POST)",
+            "statuses": "/statuses, /statuses/{request_id}, /statuses/lookup (POST)",
             "send_email": "/send-email (POST)",
             "send_batch_emails": "/send-batch-emails (POST)", 
             "test_email": "/test-email (POST)",
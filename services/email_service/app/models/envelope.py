@@ -0,0 +1,324 @@
+import json
+import logging
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_NAME = "message-envelope.json"
+CAMPAIGN_SCHEMA_NAME = "campaign-envelope.json"
+
+Validator = Callable[[Any], None]
+
+_UUID = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class EnvelopeError(ValueError):
+    """The message does not match the envelope contract; retrying cannot fix it."""
+
+    def __init__(self, message: str, path: str = "") -> None:
+        super().__init__(message)
+        self.message = message
+        self.path = path
+        self.request_id: Optional[str] = None
+
+    def __str__(self) -> str:
+        return f"${self.path}: {self.message}"
+
+
+def _check_date_time(value: str) -> bool:
+    try:
+        datetime.fromisoformat(value)
+        return True
+    except ValueError:
+        return False
+
+
+FORMATS: Dict[str, Callable[[str], bool]] = {
+    "uuid": lambda value: _UUID.match(value) is not None,
+    "email": lambda value: _EMAIL.match(value) is not None,
+    "date-time": _check_date_time,
+}
+
+_TYPES: Dict[str, tuple] = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+
+
+def compile_schema(schema: Dict[str, Any]) -> Validator:
+    """Turn a JSON schema into nested closures, resolved once at import time.
+
+    Supports the draft-07 subset our contracts use: type, required,
+    properties, additionalProperties, items, enum, minimum and the uuid,
+    email and date-time formats. Optional properties may be ``null``:
+    producers with non-omitempty nil slices/maps send them that way.
+    Error paths are only built while an EnvelopeError unwinds.
+    """
+    checks: List[Validator] = []
+
+    types = schema.get("type")
+    if types is not None:
+        names = [types] if isinstance(types, str) else list(types)
+        python_types = tuple(t for name in names for t in _TYPES[name])
+        # bool is an int subclass but not a JSON number.
+        allow_bool = "boolean" in names
+        expected = "/".join(names)
+
+        def check_type(value: Any) -> None:
+            if not isinstance(value, python_types) or (value is True or value is False) and not allow_bool:
+                raise EnvelopeError(f"expected {expected}, got {type(value).__name__}")
+
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value: Any) -> None:
+            if value not in allowed:
+                raise EnvelopeError(f"{value!r} is not one of {allowed}")
+
+        checks.append(check_enum)
+
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+
+        def check_minimum(value: Any) -> None:
+            if isinstance(value, (int, float)) and value < minimum:
+                raise EnvelopeError(f"{value} is below {minimum}")
+
+        checks.append(check_minimum)
+
+    format_check = FORMATS.get(schema.get("format", ""))
+    if format_check is not None:
+        format_name = schema["format"]
+
+        def check_format(value: Any) -> None:
+            if isinstance(value, str) and not format_check(value):
+                raise EnvelopeError(f"{value!r} is not a valid {format_name}")
+
+        checks.append(check_format)
+
+    required = tuple(schema.get("required", ()))
+    properties = {name: compile_schema(sub) for name, sub in schema.get("properties", {}).items()}
+    additional = schema.get("additionalProperties", True)
+    additional_check = compile_schema(additional) if isinstance(additional, dict) else None
+    if required or properties or additional is not True:
+
+        def check_object(value: Any) -> None:
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if name not in value:
+                    raise EnvelopeError(f"missing required field {name!r}")
+            for name, item in value.items():
+                check = properties.get(name)
+                if check is None:
+                    if additional is False:
+                        raise EnvelopeError(f"unexpected field {name!r}")
+                    check = additional_check
+                    if check is None:
+                        continue
+                elif item is None and name not in required:
+                    continue
+                try:
+                    check(item)
+                except EnvelopeError as exc:
+                    exc.path = f".{name}{exc.path}"
+                    raise
+
+        checks.append(check_object)
+
+    if isinstance(schema.get("items"), dict):
+        item_check = compile_schema(schema["items"])
+
+        def check_items(value: Any) -> None:
+            if not isinstance(value, list):
+                return
+            for index, item in enumerate(value):
+                try:
+                    item_check(item)
+                except EnvelopeError as exc:
+                    exc.path = f"[{index}]{exc.path}"
+                    raise
+
+        checks.append(check_items)
+
+    if not checks:
+        return lambda value: None
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_all(value: Any) -> None:
+        for check in checks:
+            check(value)
+
+    return check_all
+
+
+def _find_schema(name: str) -> Optional[Path]:
+    if settings.envelope_schema_dir:
+        return Path(settings.envelope_schema_dir) / name
+    # In a checkout the contracts live in <repo>/shared/schemas.
+    for parent in Path(__file__).resolve().parents:
+        candidate = parent / "shared" / "schemas" / name
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def load_validator(name: str = SCHEMA_NAME) -> Optional[Validator]:
+    path = _find_schema(name)
+    if path is None or not path.is_file():
+        logger.warning("Envelope schema %s not found; only structural checks are applied", name)
+        return None
+    return compile_schema(json.loads(path.read_text()))
+
+
+class EnvelopeUser:
+    __slots__ = ("id", "email", "locale")
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.id: str = data.get("id") or ""
+        self.email: str = data.get("email") or ""
+        self.locale: Optional[str] = data.get("locale") or None
+
+
+class EnvelopeTemplate:
+    __slots__ = ("slug", "locale", "version", "subject", "body")
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.slug: str = data.get("slug") or ""
+        self.locale: Optional[str] = data.get("locale") or None
+        self.version: Optional[int] = data.get("version")
+        self.subject: Optional[str] = data.get("subject")
+        self.body: Optional[str] = data.get("body")
+
+
+class Envelope:
+    """Typed view of a queue message; ``raw`` keeps the decoded dict for republishing."""
+
+    __slots__ = (
+        "request_id",
+        "correlation_id",
+        "created_at",
+        "channel",
+        "user",
+        "template",
+        "variables",
+        "provider_overrides",
+        "retry_count",
+        "raw",
+    )
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.raw = data
+        self.request_id: str = data.get("request_id") or ""
+        self.correlation_id: str = data.get("correlation_id") or ""
+        self.created_at: str = data.get("created_at") or ""
+        self.channel: str = data.get("channel") or ""
+        self.user = EnvelopeUser(data.get("user") or {})
+        self.template = EnvelopeTemplate(data.get("template") or {})
+        self.variables: Dict[str, Any] = data.get("variables") or {}
+        self.provider_overrides: Dict[str, Any] = data.get("provider_overrides") or {}
+        self.retry_count: int = data.get("retry_count") or 0
+
+    def to_dict(self, **changes: Any) -> Dict[str, Any]:
+        data = dict(self.raw)
+        data.update(changes)
+        return data
+
+
+class CampaignRecipient:
+    __slots__ = ("request_id", "email", "locale", "variables", "raw")
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.raw = data
+        self.request_id: str = data.get("request_id") or ""
+        self.email: str = data.get("email") or ""
+        self.locale: Optional[str] = data.get("locale") or None
+        self.variables: Dict[str, Any] = data.get("variables") or {}
+
+
+class CampaignEnvelope:
+    """One template, many recipients; statuses are tracked per recipient ``request_id``."""
+
+    __slots__ = (
+        "request_id",
+        "correlation_id",
+        "created_at",
+        "channel",
+        "template",
+        "variables",
+        "recipients",
+        "provider_overrides",
+        "retry_count",
+        "raw",
+    )
+
+    def __init__(self, data: Dict[str, Any]) -> None:
+        self.raw = data
+        self.request_id: str = data.get("request_id") or ""
+        self.correlation_id: str = data.get("correlation_id") or ""
+        self.created_at: str = data.get("created_at") or ""
+        self.channel: str = data.get("channel") or ""
+        self.template = EnvelopeTemplate(data.get("template") or {})
+        self.variables: Dict[str, Any] = data.get("variables") or {}
+        self.recipients = [CampaignRecipient(item) for item in data.get("recipients") or ()]
+        self.provider_overrides: Dict[str, Any] = data.get("provider_overrides") or {}
+        self.retry_count: int = data.get("retry_count") or 0
+
+    def to_dict(self, **changes: Any) -> Dict[str, Any]:
+        data = dict(self.raw)
+        data.update(changes)
+        return data
+
+
+_validator = load_validator(SCHEMA_NAME)
+_campaign_validator = load_validator(CAMPAIGN_SCHEMA_NAME)
+
+
+def decode_envelope(body: bytes) -> Union[Envelope, CampaignEnvelope]:
+    """Parse and validate a queue message in one pass; raises EnvelopeError if it is malformed.
+
+    Messages with a ``recipients`` list are campaign envelopes.
+    """
+    try:
+        data = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise EnvelopeError(f"envelope is not valid JSON: {exc}") from exc
+    if not isinstance(data, dict):
+        raise EnvelopeError("envelope is not a JSON object")
+    try:
+        if "recipients" in data:
+            if _campaign_validator is not None:
+                _campaign_validator(data)
+            envelope = CampaignEnvelope(data)
+            for index, recipient in enumerate(envelope.recipients):
+                if not recipient.email or not recipient.request_id:
+                    raise EnvelopeError("recipient needs request_id and email", f".recipients[{index}]")
+        else:
+            if _validator is not None:
+                _validator(data)
+            envelope = Envelope(data)
+            if not envelope.user.email:
+                raise EnvelopeError("missing email", ".user")
+        if not envelope.template.slug:
+            raise EnvelopeError("missing slug", ".template")
+    except (EnvelopeError, AttributeError) as exc:
+        # Keep the id (when there is a usable one) so the failure can still be recorded.
+        error = exc if isinstance(exc, EnvelopeError) else EnvelopeError(f"malformed envelope: {exc}")
+        request_id = data.get("request_id")
+        error.request_id = request_id if isinstance(request_id, str) else None
+        raise error from (None if error is exc else exc)
+    return envelope
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyProbe:
+    """Times a blocking dependency check, running it at most once per ``interval``.
+
+    Readiness is polled every few seconds by every orchestrator replica; the
+    cached result keeps those polls from turning into database and HTTP load.
+    """
+
+    def __init__(self, name: str, check: Callable[[], None], interval: float = settings.health_probe_interval) -> None:
+        self.name = name
+        self.check = check
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._result: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+
+    def result(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._result is not None and time.monotonic() - self._checked_at < self.interval:
+                return self._result
+            started = time.perf_counter()
+            try:
+                self.check()
+                result: Dict[str, Any] = {"ok": True}
+            except Exception as exc:
+                logger.warning("Dependency %s is unhealthy: %s", self.name, exc)
+                result = {"ok": False, "error": str(exc)[:200]}
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            self._result = result
+            self._checked_at = time.monotonic()
+            return result
+
+
+_probes: Dict[str, DependencyProbe] = {}
+_probes_lock = threading.Lock()
+
+
+def register_probe(name: str, check: Callable[[], None]) -> None:
+    with _probes_lock:
+        _probes[name] = DependencyProbe(name, check)
+
+
+async def check_dependencies() -> Dict[str, Dict[str, Any]]:
+    with _probes_lock:
+        probes: List[DependencyProbe] = list(_probes.values())
+    results = await asyncio.gather(*(asyncio.to_thread(probe.result) for probe in probes))
+    return {probe.name: result for probe, result in zip(probes, results)}
@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from app.observability import tracing
+
+logger = logging.getLogger(__name__)
+
+# Buckets cover sub-millisecond cache hits up to slow SMTP relays.
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_DURATION = Histogram(
+    "email_stage_duration_seconds",
+    "Time spent in each stage of the email pipeline",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "email_stage_errors_total",
+    "Pipeline stages that raised",
+    ["stage"],
+)
+MESSAGES_IN_FLIGHT = Gauge(
+    "email_messages_in_flight",
+    "Queue deliveries currently being processed",
+    multiprocess_mode="livesum",
+)
+MESSAGES = Counter(
+    "email_messages_total",
+    "Queue deliveries by outcome",
+    ["result", "reason"],
+)
+RETRIES = Counter(
+    "email_retries_total",
+    "Deliveries republished to a delay queue for another attempt",
+    ["queue"],
+)
+RETRY_QUEUE_DEPTH = Gauge(
+    "email_retry_queue_depth",
+    "Messages waiting in each retry delay queue",
+    ["queue"],
+    multiprocess_mode="livemax",
+)
+LANE_QUEUE_WAIT = Histogram(
+    "email_lane_queue_wait_seconds",
+    "Time a delivery waited in the consumer for an in-flight slot, per priority lane",
+    ["lane"],
+    buckets=STAGE_BUCKETS,
+)
+LANE_END_TO_END = Histogram(
+    "email_lane_end_to_end_seconds",
+    "Envelope creation to settle, per priority lane",
+    ["lane"],
+    buckets=STAGE_BUCKETS + (60.0, 300.0, 900.0, 3600.0),
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "email_http_request_duration_seconds",
+    "Latency of the HTTP send endpoints",
+    ["endpoint", "status_code"],
+    buckets=STAGE_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "email_http_requests_in_flight",
+    "HTTP send requests currently being served",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+HTTP_EMAILS = Counter(
+    "email_http_emails_total",
+    "Emails handled by the HTTP send endpoints by outcome",
+    ["endpoint", "result"],
+)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time one pipeline stage; inside a sampled delivery it is also recorded as a trace span."""
+    started = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    except BaseException:
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        STAGE_DURATION.labels(name).observe(time.perf_counter() - started)
+
+
+def record_outcome(result: str, reason: str = "") -> None:
+    MESSAGES.labels(result, reason).inc()
+
+
+class _StatsCollector(Collector):
+    """Exposes the ``stats()`` dicts of pools and caches as gauges.
+
+    Each registered component becomes ``email_<component>_<key>`` with a
+    ``source`` label telling apart e.g. the consumer's and the HTTP API's
+    SMTP pools.
+    """
+
+    def __init__(self) -> None:
+        self._providers: List[Tuple[str, str, Callable[[], Dict[str, Any]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, component: str, source: str, provider: Callable[[], Dict[str, Any]]) -> None:
+        with self._lock:
+            self._providers = [p for p in self._providers if (p[0], p[1]) != (component, source)]
+            self._providers.append((component, source, provider))
+
+    def collect(self):
+        with self._lock:
+            providers = list(self._providers)
+
+        families: Dict[str, GaugeMetricFamily] = {}
+        for component, source, provider in providers:
+            try:
+                values = provider()
+            except Exception as exc:
+                logger.debug("Stats provider %s/%s failed: %s", component, source, exc)
+                continue
+            for key, value in values.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                name = f"email_{component}_{key}"
+                family = families.get(name)
+                if family is None:
+                    family = GaugeMetricFamily(name, f"{component} {key.replace('_', ' ')}", labels=["source"])
+                    families[name] = family
+                family.add_metric([source], float(value))
+        return list(families.values())
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def register_stats(component: str, provider: Callable[[], Dict[str, Any]], source: str = "default") -> None:
+    _stats_collector.register(component, source, provider)
+
+
+_exported_stats: Dict[str, Gauge] = {}
+
+
+def export_stats() -> None:
+    """Copy the registered ``stats()`` values into plain gauges.
+
+    Collectors are not shared between processes, so supervisor workers call
+    this periodically; in prometheus multiprocess mode the gauges end up in
+    ``PROMETHEUS_MULTIPROC_DIR`` and the supervisor's ``/metrics`` serves
+    them with a ``pid`` label per worker.
+    """
+    for family in _stats_collector.collect():
+        gauge = _exported_stats.get(family.name)
+        if gauge is None:
+            gauge = Gauge(family.name, family.documentation, ["source"], registry=None, multiprocess_mode="liveall")
+            _exported_stats[family.name] = gauge
+        for sample in family.samples:
+            gauge.labels(sample.labels["source"]).set(sample.value)
+
+
+def snapshot(component: str) -> Dict[str, Dict[str, Any]]:
+    """Current ``stats()`` of every registered provider of ``component``, keyed by source."""
+    with _stats_collector._lock:
+        providers = [p for p in _stats_collector._providers if p[0] == component]
+    result: Dict[str, Dict[str, Any]] = {}
+    for _, source, provider in providers:
+        try:
+            result[source] = provider()
+        except Exception as exc:
+            logger.debug("Stats provider %s/%s failed: %s", component, source, exc)
+    return result
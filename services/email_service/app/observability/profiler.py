@@ -0,0 +1,55 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+_running = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(duration: float, interval: float = 0.01, thread_name: Optional[str] = None) -> Dict[str, int]:
+    """Sample every thread's Python stack for ``duration`` seconds.
+
+    Returns collapsed stacks (``thread;outer;...;inner`` -> sample count),
+    the input format of flamegraph.pl and speedscope. Only one profile runs
+    at a time; a second caller gets ProfilerBusy. ``thread_name`` limits
+    sampling to threads whose name starts with it, or with any of several
+    comma-separated prefixes (``email-consumer`` covers the consumer loop and
+    its ``email-consumer-io`` threads).
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+    try:
+        me = threading.get_ident()
+        prefixes = tuple(prefix.strip() for prefix in thread_name.split(",") if prefix.strip()) if thread_name else ()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, f"thread-{ident}")
+                if ident == me or (prefixes and not name.startswith(prefixes)):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(name)
+                counts[";".join(reversed(stack)).replace("\n", " ")] += 1
+            time.sleep(interval)
+        return dict(counts)
+    finally:
+        _running.release()
+
+
+def collapse(counts: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
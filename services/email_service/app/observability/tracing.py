@@ -0,0 +1,275 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+EXPORTERS = ("file", "zipkin")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("email_trace_span", default=None)
+
+
+def trace_id_for(correlation_id: Optional[str]) -> str:
+    """128-bit trace id derived from the correlation id, so every hop of one request shares a trace."""
+    if not correlation_id:
+        return uuid.uuid4().hex
+    try:
+        return uuid.UUID(correlation_id).hex
+    except ValueError:
+        return hashlib.sha256(correlation_id.encode()).hexdigest()[:32]
+
+
+def _span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = False
+        self.spans: List["Span"] = []
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_us", "duration_us", "tags", "_started")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], kind: Optional[str] = None) -> None:
+        self.trace = trace
+        self.span_id = _span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_us = int(time.time() * 1_000_000)
+        self.duration_us = 0
+        self.tags: Dict[str, str] = {}
+        self._started = time.perf_counter()
+
+    def set_tag(self, key: str, value: Any) -> None:
+        self.tags[key] = str(value)
+
+    def finish(self) -> None:
+        self.duration_us = max(1, int((time.perf_counter() - self._started) * 1_000_000))
+        self.trace.spans.append(self)
+
+    def to_zipkin(self, service_name: str) -> Dict[str, Any]:
+        span: Dict[str, Any] = {
+            "traceId": self.trace.trace_id,
+            "id": self.span_id,
+            "name": self.name,
+            "timestamp": self.start_us,
+            "duration": self.duration_us,
+            "localEndpoint": {"serviceName": service_name},
+            "tags": self.tags,
+        }
+        if self.parent_id:
+            span["parentId"] = self.parent_id
+        if self.kind:
+            span["kind"] = self.kind
+        return span
+
+
+class SpanExporter:
+    """Ships finished traces from a background thread, as Zipkin v2 JSON.
+
+    ``file`` appends one span per line (replayable into any Zipkin-compatible
+    collector); ``zipkin`` POSTs batches to ``TRACING_ENDPOINT`` (Jaeger
+    accepts them on its Zipkin port, 9411). When the queue is full spans
+    are dropped rather than slowing deliveries down.
+    """
+
+    def __init__(
+        self,
+        kind: str = settings.tracing_exporter,
+        path: str = settings.tracing_file,
+        endpoint: str = settings.tracing_endpoint,
+        max_queue: int = settings.tracing_max_queue,
+    ) -> None:
+        self.kind = kind
+        self.path = path
+        self.endpoint = endpoint
+        self.service_name = settings.service_name
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(max(1, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+        self._exported = 0
+        self._dropped = 0
+        self._errors = 0
+
+    def submit(self, spans: List[Span]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait([span.to_zipkin(self.service_name) for span in spans])
+        except queue.Full:
+            self._dropped += len(spans)
+
+    def close(self, timeout: float = 5.0) -> None:
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exported_spans": self._exported,
+            "dropped_spans": self._dropped,
+            "export_errors": self._errors,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def _ensure_started(self) -> None:
+        # A forked child (fork start method) inherits ``_thread`` but not the running thread, so it
+        # starts its own; supervisor workers are spawned and import this module afresh anyway.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        client = httpx.Client(timeout=5.0) if self.kind == "zipkin" else None
+        try:
+            stopping = False
+            while not stopping:
+                batch: List[Dict[str, Any]] = []
+                deadline = time.monotonic() + settings.tracing_flush_interval
+                while len(batch) < settings.tracing_batch_size:
+                    try:
+                        spans = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if spans is None:
+                        stopping = True
+                        break
+                    batch.extend(spans)
+                if batch:
+                    self._export(client, batch)
+        finally:
+            if client is not None:
+                client.close()
+
+    def _export(self, client: Optional[httpx.Client], batch: List[Dict[str, Any]]) -> None:
+        try:
+            if client is not None:
+                client.post(self.endpoint, json=batch).raise_for_status()
+            else:
+                with open(self.path, "a", encoding="utf-8") as handle:
+                    handle.writelines(json.dumps(span, separators=(",", ":")) + "\n" for span in batch)
+            self._exported += len(batch)
+        except Exception as exc:
+            self._errors += 1
+            self._dropped += len(batch)
+            logger.warning("Could not export %d spans: %s", len(batch), exc)
+
+
+exporter: Optional[SpanExporter] = None
+if settings.tracing_exporter:
+    if settings.tracing_exporter not in EXPORTERS:
+        raise ValueError(f"TRACING_EXPORTER must be one of {EXPORTERS}")
+    exporter = SpanExporter()
+    atexit.register(exporter.close)
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Optional[Span]]:
+    """Root span of one delivery; call ``continue_trace`` once the envelope is decoded.
+
+    All spans are recorded in memory while the delivery runs. At the end the
+    trace is exported if it was sampled, failed, or took longer than
+    ``TRACING_SLOW_THRESHOLD`` seconds, so latency spikes are kept even at a
+    low sample rate.
+    """
+    if exporter is None:
+        yield None
+        return
+    root = Span(Trace(), name, None, kind="CONSUMER")
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as exc:
+        _mark_error(root, exc)
+        raise
+    finally:
+        _current.reset(token)
+        root.finish()
+        slow = settings.tracing_slow_threshold > 0 and root.duration_us >= settings.tracing_slow_threshold * 1_000_000
+        if root.trace.sampled or slow or "error" in root.tags:
+            exporter.submit(root.trace.spans)
+
+
+def continue_trace(correlation_id: Optional[str], **tags: Any) -> None:
+    """Join the current delivery to the trace of ``correlation_id`` and tag its root span."""
+    root = _current.get()
+    if root is None:
+        return
+    trace_ = root.trace
+    trace_.trace_id = trace_id_for(correlation_id)
+    # Decided from the trace id, so every service and every retry of one request agrees.
+    trace_.sampled = int(trace_.trace_id[:8], 16) < settings.tracing_sample_rate * 0x1_0000_0000
+    if correlation_id:
+        root.set_tag("correlation_id", correlation_id)
+    for key, value in tags.items():
+        if value is not None:
+            root.set_tag(key, value)
+
+
+@contextmanager
+def span(name: str) -> Iterator[Optional[Span]]:
+    """Child span of whatever span is current; a no-op outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        _mark_error(child, exc)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def tag(key: str, value: Any) -> None:
+    current = _current.get()
+    if current is not None:
+        current.set_tag(key, value)
+
+
+def _mark_error(target: Span, exc: BaseException) -> None:
+    target.set_tag("error", "true")
+    target.set_tag("exception", type(exc).__name__)
+
+
+def stats() -> Dict[str, Any]:
+    return exporter.stats() if exporter is not None else {}
+
+
+def shutdown() -> None:
+    if exporter is not None:
+        exporter.close()
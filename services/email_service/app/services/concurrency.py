@@ -0,0 +1,216 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+# Numeric encoding for the state gauge.
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+BASELINE_WINDOW = 30.0
+
+
+class AdaptiveLimit:
+    """Concurrent SMTP transactions allowed against one relay, driven by its latency and errors.
+
+    The relay's unloaded latency is taken as the lowest transaction time of
+    the last one to two ``BASELINE_WINDOW`` periods, and compared with a
+    moving average of the current one. While the average stays within
+    ``tolerance`` times the baseline, every success moves the limit towards
+    ``limit + sqrt(limit)``; once latency climbs past that, it moves towards
+    the limit scaled down by the excess (at most halved), so it settles
+    where latency is about ``tolerance`` times the baseline. Failed transactions
+    (timeouts, dropped connections, 4xx replies) cut it by ``backoff``, at
+    most once per average latency so one burst of failures counts once.
+
+    The limit starts at ``min_limit`` so the baseline is measured before the
+    relay is loaded, and only grows while at least half of it is in use.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        tolerance: float = 2.0,
+        backoff: float = 0.7,
+        smoothing: float = 0.2,
+    ) -> None:
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.tolerance = max(1.0, tolerance)
+        self.backoff = min(max(backoff, 0.1), 0.99)
+        self.smoothing = smoothing
+        self._limit = float(self.min_limit)
+        self._short = 0.0
+        self._baseline = (0.0, 0.0)
+        self._window_started = 0.0
+        self._hold_until = 0.0
+        self._lock = threading.Lock()
+        self._samples = 0
+        self._errors = 0
+        self._decreases = 0
+
+    @property
+    def value(self) -> int:
+        return int(self._limit)
+
+    def observe(self, seconds: float, ok: bool, in_flight: int) -> None:
+        with self._lock:
+            self._samples += 1
+            if not ok:
+                self._errors += 1
+                now = time.monotonic()
+                if now >= self._hold_until:
+                    self._set(self._limit * self.backoff)
+                    self._decreases += 1
+                    self._hold_until = now + max(self._short, 0.05)
+                return
+
+            now = time.monotonic()
+            current, previous = self._baseline
+            if not self._window_started or now - self._window_started >= BASELINE_WINDOW:
+                # Roll the window; a baseline from a quieter period ages out instead of sticking forever.
+                self._baseline = (seconds, current or seconds)
+                self._window_started = now
+            else:
+                self._baseline = (min(current, seconds), previous)
+            baseline = min(self._baseline)
+            self._short = seconds if not self._short else self._short + 0.1 * (seconds - self._short)
+
+            gradient = max(0.5, min(1.0, self.tolerance * baseline / max(self._short, 1e-6)))
+            if gradient >= 1.0:
+                if in_flight < self._limit / 2:
+                    return
+                target = self._limit + math.sqrt(self._limit)
+            else:
+                target = self._limit * gradient
+            self._set(self._limit + self.smoothing * (target - self._limit))
+
+    def _set(self, value: float) -> None:
+        self._limit = max(float(self.min_limit), min(float(self.max_limit), value))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.value,
+            "max_limit": self.max_limit,
+            "latency_seconds": self._short,
+            "latency_baseline_seconds": min(self._baseline),
+            "samples": self._samples,
+            "errors": self._errors,
+            "decreases": self._decreases,
+        }
+
+
+class CircuitBreaker:
+    """Stops traffic to a relay that keeps failing and probes it until it recovers.
+
+    Trips from ``closed`` to ``open`` when at least ``failure_rate`` of the
+    last ``window`` transactions failed (once ``min_requests`` have been
+    seen). Counting transactions rather than seconds lets a sudden outage
+    trip it after a handful of failures however busy the relay was before.
+    After ``open_seconds`` it turns ``half_open`` and lets one trial send
+    through at a time; ``probes`` successes in a row close it, a failure
+    reopens it for twice as long (up to ``max_open_seconds``).
+    Callers ask ``acquire`` before starting work and wait out what it
+    returns, so messages are held back instead of failing one by one.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        min_requests: int = 10,
+        window: int = 50,
+        open_seconds: float = 10.0,
+        max_open_seconds: float = 300.0,
+        probes: int = 3,
+        name: str = "SMTP",
+    ) -> None:
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_requests = max(1, min_requests)
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max(open_seconds, max_open_seconds)
+        self.probes = max(1, probes)
+        self.state = CLOSED
+        self._results: Deque[bool] = deque(maxlen=max(self.min_requests, window))
+        self._failures = 0
+        self._cooldown = open_seconds
+        self._open_until = 0.0
+        self._probe_started = 0.0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        self._trips = 0
+        self._probes_sent = 0
+
+    def acquire(self) -> float:
+        """0 if work may start now (claiming the trial slot when half-open), else seconds to wait."""
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self._open_until:
+                    return self._open_until - now
+                self.state = HALF_OPEN
+                self._probe_successes = 0
+                self._probe_started = 0.0
+                logger.info("%s circuit half-open; sending trial messages", self.name)
+            # A trial that never reached the relay (duplicate, template error) must not block recovery.
+            if self._probe_started and now - self._probe_started < self.open_seconds:
+                return min(1.0, self.open_seconds - (now - self._probe_started))
+            self._probe_started = now
+            self._probes_sent += 1
+            return 0.0
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._probe_started = 0.0
+                if not ok:
+                    self._cooldown = min(self._cooldown * 2, self.max_open_seconds)
+                    self._open(now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self.state = CLOSED
+                    self._cooldown = self.open_seconds
+                    self._results.clear()
+                    self._failures = 0
+                    logger.info("%s circuit closed; relay recovered", self.name)
+                return
+            if self.state == OPEN:
+                # Sends that started before the circuit opened.
+                return
+
+            if len(self._results) == self._results.maxlen and not self._results[0]:
+                self._failures -= 1
+            self._results.append(ok)
+            if not ok:
+                self._failures += 1
+            total = len(self._results)
+            if not ok and total >= self.min_requests and self._failures >= self.failure_rate * total:
+                self._open(now)
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._open_until = now + self._cooldown
+        self._trips += 1
+        self._results.clear()
+        self._failures = 0
+        logger.warning("%s circuit open for %.0fs; pausing sends", self.name, self._cooldown)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": BREAKER_STATES[self.state],
+            "trips": self._trips,
+            "probes": self._probes_sent,
+            "open_seconds": self._cooldown,
+        }
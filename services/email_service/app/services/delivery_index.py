@@ -0,0 +1,134 @@
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Union
+
+from app.services.status_store import IdempotencyKeyStore, StatusStore
+
+logger = logging.getLogger(__name__)
+
+DELIVERED = "delivered"
+IN_FLIGHT = "in_flight"
+
+
+class DurableLookupFailed(Exception):
+    """The status table could not be asked whether a key was delivered; the message must not be sent yet."""
+
+
+class DeliveryIndex:
+    """Remembers which request/idempotency keys were already delivered.
+
+    A bounded in-process set of recently delivered keys answers most lookups
+    without I/O; on a miss the status table is consulted, so redeliveries
+    after a restart are still caught. Keys currently being processed are
+    tracked too, so two copies of one message are never sent concurrently.
+
+    A durable lookup that fails raises DurableLookupFailed (after giving up
+    the claim): an unanswered lookup must not be read as "not delivered".
+    ``status_store`` is anything with ``get_status``/``get_statuses``.
+    """
+
+    def __init__(self, status_store: Optional[Union[StatusStore, IdempotencyKeyStore]], max_keys: int) -> None:
+        self.status_store = status_store
+        self.max_keys = max(1, max_keys)
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._in_flight: Set[str] = set()
+        self._key_bytes = 0
+        self._lock = threading.Lock()
+
+        self._front_hits = 0
+        self._durable_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lookup_errors = 0
+
+    def claim(self, key: str) -> Optional[str]:
+        """Claim ``key`` for delivery using the in-memory layer only.
+
+        Returns None when the caller now owns the key, otherwise DELIVERED or
+        IN_FLIGHT.
+        """
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                self._front_hits += 1
+                return DELIVERED
+            if key in self._in_flight:
+                self._front_hits += 1
+                return IN_FLIGHT
+            self._in_flight.add(key)
+            return None
+
+    def delivered_durably(self, key: str) -> bool:
+        """Check the status table for a key the caller has claimed (blocking)."""
+        status = None
+        if self.status_store is not None:
+            try:
+                status = self.status_store.get_status(key)
+            except Exception as exc:
+                logger.warning("Durable idempotency lookup for %s failed: %s", key, exc)
+                self._lookup_failed([key])
+                raise DurableLookupFailed(str(exc)) from exc
+
+        if status == DELIVERED:
+            with self._lock:
+                self._durable_hits += 1
+            self.release(key, delivered=True)
+            return True
+
+        with self._lock:
+            self._misses += 1
+        return False
+
+    def delivered_durably_many(self, keys: List[str]) -> Set[str]:
+        """Bulk variant of ``delivered_durably``: one status-table query for many claimed keys."""
+        delivered: Set[str] = set()
+        if self.status_store is not None and keys:
+            try:
+                statuses = self.status_store.get_statuses(keys)
+            except Exception as exc:
+                logger.warning("Durable idempotency lookup for %d keys failed: %s", len(keys), exc)
+                self._lookup_failed(keys)
+                raise DurableLookupFailed(str(exc)) from exc
+            delivered = {key for key, status in statuses.items() if status == DELIVERED}
+
+        for key in delivered:
+            self.release(key, delivered=True)
+        with self._lock:
+            self._durable_hits += len(delivered)
+            self._misses += len(keys) - len(delivered)
+        return delivered
+
+    def _lookup_failed(self, keys: List[str]) -> None:
+        with self._lock:
+            self._lookup_errors += 1
+            self._in_flight.difference_update(keys)
+
+    def release(self, key: str, delivered: bool) -> None:
+        with self._lock:
+            self._in_flight.discard(key)
+            if not delivered or key in self._recent:
+                return
+            self._recent[key] = None
+            self._key_bytes += sys.getsizeof(key)
+            while len(self._recent) > self.max_keys:
+                evicted, _ = self._recent.popitem(last=False)
+                self._key_bytes -= sys.getsizeof(evicted)
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._front_hits + self._durable_hits + self._misses
+            return {
+                "size": len(self._recent),
+                "max_size": self.max_keys,
+                "in_flight": len(self._in_flight),
+                "front_hits": self._front_hits,
+                "durable_hits": self._durable_hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "lookup_errors": self._lookup_errors,
+                "hit_rate": (self._front_hits + self._durable_hits) / lookups if lookups else 0.0,
+                "memory_bytes": sys.getsizeof(self._recent) + sys.getsizeof(self._in_flight) + self._key_bytes,
+            }
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_domain_map(spec: str) -> Dict[str, str]:
+    """Parse ``"gmail.com=value,yahoo.com=value"`` into a dict keyed by lowercase domain."""
+    entries: Dict[str, str] = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        domain, sep, value = item.partition("=")
+        if not sep or not domain.strip() or not value.strip():
+            logger.warning("Ignoring malformed domain setting %r", item)
+            continue
+        entries[domain.strip().lower()] = value.strip()
+    return entries
+
+
+def parse_rate(value: str) -> Tuple[float, float]:
+    """``"20"`` is 20 msgs/sec with a burst of 20; ``"20/50"`` sets the burst explicitly."""
+    rate, _, burst = value.partition("/")
+    return float(rate), float(burst or rate)
+
+
+def recipient_domain(email: str) -> str:
+    return email.rpartition("@")[2].strip().lower()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        """Take a token, borrowing from the future if needed; returns the wait in seconds."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1.0
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self) -> None:
+        self.tokens = min(self.burst, self.tokens + 1.0)
+
+
+class DomainRateLimiter:
+    """Token buckets keyed by recipient domain.
+
+    ``reserve`` never blocks: it books the next send slot for the domain and
+    returns how long the caller has to wait for it, so the caller decides
+    whether to sleep, park the message or hand it back to the broker (in which
+    case it ``cancel``s the reservation). Domains without an explicit rate use
+    ``default_rate``; a rate of 0 means unlimited.
+    """
+
+    def __init__(
+        self,
+        default_rate: float = 0.0,
+        default_burst: float = 0.0,
+        rates: Optional[Dict[str, Tuple[float, float]]] = None,
+        max_buckets: int = 10000,
+    ) -> None:
+        self.default_rate = default_rate
+        self.default_burst = default_burst or default_rate
+        self.rates = rates or {}
+        self.max_buckets = max(1, max_buckets)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._granted = 0
+        self._delayed = 0
+        self._cancelled = 0
+        self._delay_total = 0.0
+
+    def reserve(self, domain: str) -> float:
+        bucket = self._bucket(domain)
+        if bucket is None:
+            return 0.0
+        with self._lock:
+            wait = bucket.reserve(time.monotonic())
+            if wait:
+                self._delayed += 1
+                self._delay_total += wait
+            else:
+                self._granted += 1
+        return wait
+
+    def cancel(self, domain: str) -> None:
+        with self._lock:
+            bucket = self._buckets.get(domain)
+            if bucket is not None:
+                bucket.refund()
+                self._cancelled += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "buckets": len(self._buckets),
+                "granted": self._granted,
+                "delayed": self._delayed,
+                "cancelled": self._cancelled,
+                "delay_seconds_total": self._delay_total,
+            }
+
+    def _bucket(self, domain: str) -> Optional[TokenBucket]:
+        rate, burst = self.rates.get(domain, (self.default_rate, self.default_burst))
+        if rate <= 0:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(domain)
+            if bucket is None:
+                if len(self._buckets) >= self.max_buckets:
+                    self._prune(time.monotonic())
+                bucket = self._buckets[domain] = TokenBucket(rate, burst)
+            return bucket
+
+    def _prune(self, now: float) -> None:
+        # Buckets that refilled completely carry no state worth keeping.
+        for domain, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated_at) * bucket.rate >= bucket.burst:
+                del self._buckets[domain]
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.channel import Channel
+from pika.spec import Basic
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PublishError(Exception):
+    """The broker did not confirm a message, so it may not have been queued; the caller should retry."""
+
+
+class ConfirmChannel:
+    """A confirm-mode channel and the messages published on it that the broker has not confirmed yet."""
+
+    def __init__(self, channel: Channel) -> None:
+        self.channel = channel
+        self.pending: "OrderedDict[int, Tuple[asyncio.Future, str]]" = OrderedDict()
+        self._next_tag = 1
+        self._returned: Set[str] = set()
+        self.confirm_frames = 0
+
+    def publish(self, routing_key: str, body: bytes, properties: pika.BasicProperties, future: asyncio.Future) -> None:
+        self.channel.basic_publish("", routing_key, body, properties, mandatory=True)
+        # The broker numbers confirms per channel, in publish order, starting at 1.
+        self.pending[self._next_tag] = (future, properties.message_id)
+        self._next_tag += 1
+
+    def on_confirm(self, frame: Any) -> None:
+        method = frame.method
+        ok = isinstance(method, Basic.Ack)
+        self.confirm_frames += 1
+        if not method.multiple:
+            self._settle(method.delivery_tag, ok)
+            return
+        # One frame settles every message up to its tag.
+        while self.pending:
+            tag = next(iter(self.pending))
+            if tag > method.delivery_tag:
+                break
+            self._settle(tag, ok)
+
+    def on_return(self, channel: Channel, method: Any, properties: pika.BasicProperties, body: bytes) -> None:
+        # A mandatory message no queue took; the broker still acks it, right after this.
+        self._returned.add(properties.message_id)
+
+    def _settle(self, tag: int, ok: bool) -> None:
+        entry = self.pending.pop(tag, None)
+        if entry is None:
+            return
+        future, message_id = entry
+        error = None
+        if message_id in self._returned:
+            self._returned.discard(message_id)
+            error = PublishError("no queue accepted the message")
+        elif not ok:
+            error = PublishError("broker rejected the message")
+        if future.done():
+            # The caller stopped waiting (confirm timeout).
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
+    def fail_pending(self, reason: str) -> None:
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(PublishError(reason))
+        self.pending.clear()
+
+
+class EnvelopePublisher:
+    """Publishes envelopes to a queue over long-lived channels, with batched publisher confirms.
+
+    Each publish is written straight away without waiting for earlier ones
+    to be confirmed, so the broker confirms them in batches (``multiple``
+    acks) and one round trip covers every message published in the
+    meantime. Callers still wait for their own message's confirm, so a
+    successful ``publish`` means the broker has taken responsibility for a
+    persistent message. ``channels`` confirm-mode channels share one
+    connection, and a publish goes to the one with the fewest unconfirmed
+    messages. At most ``max_pending`` messages are unconfirmed at a time;
+    further callers wait for a slot.
+
+    The connection is opened on first use on the running event loop and
+    reopened after it drops; messages unconfirmed when a channel closes fail
+    with PublishError. While some channels are still open, lost ones are
+    reopened in the background and publishes go to the open ones.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        queue: str,
+        channels: int = 2,
+        max_pending: int = 2000,
+        confirm_timeout: float = 5.0,
+        queue_arguments: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.url = url
+        self.queue = queue
+        self.channel_count = max(1, channels)
+        self.max_pending = max(1, max_pending)
+        self.confirm_timeout = confirm_timeout
+        self.queue_arguments = queue_arguments
+        self.connection: Optional[AsyncioConnection] = None
+        self._channels: List[ConfirmChannel] = []
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._open_lock = asyncio.Lock()
+        self._top_up_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._retry_at = 0.0
+        self._published = 0
+        self._confirmed = 0
+        self._failed = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._lost = 0
+        self._confirm_frames = 0
+
+    async def publish(self, body: bytes, message_id: str, correlation_id: str) -> None:
+        """Publish one persistent message; returns once the broker confirms it, raises PublishError otherwise."""
+        properties = pika.BasicProperties(
+            content_type="application/json",
+            delivery_mode=2,
+            message_id=message_id,
+            correlation_id=correlation_id,
+        )
+        async with self._slots:
+            channel = await self._channel()
+            future = asyncio.get_running_loop().create_future()
+            try:
+                channel.publish(self.queue, body, properties, future)
+            except Exception as exc:
+                self._failed += 1
+                raise PublishError(f"could not publish: {exc}") from exc
+            self._published += 1
+            try:
+                await asyncio.wait_for(future, self.confirm_timeout)
+            except asyncio.TimeoutError:
+                self._timeouts += 1
+                raise PublishError(f"not confirmed within {self.confirm_timeout:.1f}s") from None
+            except PublishError:
+                self._failed += 1
+                raise
+            self._confirmed += 1
+
+    async def _channel(self) -> ConfirmChannel:
+        usable = self._usable()
+        if len(usable) < self.channel_count:
+            if not usable:
+                await self._top_up()
+                usable = self._usable()
+                if not usable:
+                    raise PublishError("no publisher channel is open")
+            elif self._top_up_task is None or self._top_up_task.done():
+                # Publish on the channels still open; replace the lost ones meanwhile.
+                self._top_up_task = asyncio.get_running_loop().create_task(self._top_up_quietly())
+        return min(usable, key=lambda channel: len(channel.pending))
+
+    def _usable(self) -> List[ConfirmChannel]:
+        return [channel for channel in self._channels if channel.channel.is_open]
+
+    async def _top_up(self) -> None:
+        """Open channels (and the connection) up to ``channel_count``; raises PublishError if that fails."""
+        async with self._open_lock:
+            if len(self._usable()) >= self.channel_count:
+                return
+            loop = asyncio.get_running_loop()
+            if loop.time() < self._retry_at:
+                # Fail fast for a moment after a failed attempt rather than dialling once per request.
+                if self._usable():
+                    return
+                raise PublishError("RabbitMQ unreachable; not retrying yet")
+            try:
+                await asyncio.wait_for(self._open(), self.confirm_timeout)
+            except Exception as exc:
+                self._retry_at = loop.time() + 1.0
+                if isinstance(exc, PublishError):
+                    raise
+                if isinstance(exc, asyncio.TimeoutError):
+                    raise PublishError(f"RabbitMQ did not answer within {self.confirm_timeout:.1f}s") from None
+                raise PublishError(f"could not open a publisher channel: {exc!r}") from exc
+
+    async def _top_up_quietly(self) -> None:
+        try:
+            await self._top_up()
+        except PublishError as exc:
+            logger.warning("Could not open another publisher channel: %s", exc)
+
+    async def _open(self) -> None:
+        if self._closing:
+            raise PublishError("publisher is closed")
+        loop = asyncio.get_running_loop()
+        if self.connection is None or not self.connection.is_open:
+            if self.connection is not None:
+                self._reconnects += 1
+                if not (self.connection.is_closing or self.connection.is_closed):
+                    # Left half-open by an attempt that timed out.
+                    self.connection.close()
+            opened = loop.create_future()
+
+            def on_open(connection: AsyncioConnection) -> None:
+                if not opened.done():
+                    opened.set_result(connection)
+
+            def on_open_error(connection: AsyncioConnection, exc: Exception) -> None:
+                if not opened.done():
+                    opened.set_exception(PublishError(f"could not connect to RabbitMQ: {exc!r}"))
+
+            self.connection = AsyncioConnection(
+                pika.URLParameters(self.url),
+                on_open_callback=on_open,
+                on_open_error_callback=on_open_error,
+                on_close_callback=self._on_connection_closed,
+                custom_ioloop=loop,
+            )
+            await opened
+            # The consumer declares the queue the same way; declaring it here too means nothing
+            # published before the first consumer starts is dropped as unroutable.
+            declaring = await self._open_channel()
+            await self._call(declaring.queue_declare, queue=self.queue, durable=True, arguments=self.queue_arguments)
+            declaring.close()
+
+        self._channels = [channel for channel in self._channels if channel.channel.is_open]
+        while len(self._channels) < self.channel_count:
+            raw = await self._open_channel()
+            channel = ConfirmChannel(raw)
+            raw.add_on_close_callback(self._on_channel_closed)
+            raw.add_on_return_callback(channel.on_return)
+            await self._call(raw.confirm_delivery, ack_nack_callback=channel.on_confirm)
+            self._channels.append(channel)
+            logger.debug("Publisher channel %d open", raw.channel_number)
+
+    async def _open_channel(self) -> Channel:
+        opened = asyncio.get_running_loop().create_future()
+        self.connection.channel(on_open_callback=opened.set_result)
+        return await opened
+
+    async def _call(self, method: Callable[..., Any], **kwargs: Any) -> Any:
+        done = asyncio.get_running_loop().create_future()
+
+        def callback(frame: Any) -> None:
+            if not done.done():
+                done.set_result(frame)
+
+        method(callback=callback, **kwargs)
+        return await done
+
+    def _on_channel_closed(self, raw: Channel, reason: Exception) -> None:
+        for channel in self._channels:
+            if channel.channel is raw:
+                if channel.pending:
+                    logger.warning("Publisher channel closed with %d unconfirmed messages: %s", len(channel.pending), reason)
+                    self._lost += len(channel.pending)
+                self._confirm_frames += channel.confirm_frames
+                channel.fail_pending(f"channel closed before the broker confirmed: {reason}")
+        self._channels = [channel for channel in self._channels if channel.channel is not raw]
+
+    def _on_connection_closed(self, connection: AsyncioConnection, reason: Exception) -> None:
+        if connection is not self.connection:
+            return
+        if not self._closing:
+            logger.warning("Publisher connection closed: %s", reason)
+        for channel in self._channels:
+            self._lost += len(channel.pending)
+            self._confirm_frames += channel.confirm_frames
+            channel.fail_pending(f"connection closed before the broker confirmed: {reason}")
+        self._channels = []
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Wait up to ``timeout`` for outstanding confirms, then close the connection."""
+        self._closing = True
+        if self._top_up_task is not None:
+            self._top_up_task.cancel()
+        waiting = [future for channel in self._channels for future, _ in channel.pending.values()]
+        if waiting:
+            await asyncio.wait(waiting, timeout=timeout)
+        if self.connection is not None and not (self.connection.is_closing or self.connection.is_closed):
+            self.connection.close()
+
+    def stats(self) -> Dict[str, Any]:
+        confirm_frames = self._confirm_frames + sum(channel.confirm_frames for channel in self._channels)
+        return {
+            "connected": self.connection is not None and self.connection.is_open,
+            "channels": len(self._channels),
+            "pending": sum(len(channel.pending) for channel in self._channels),
+            "max_pending": self.max_pending,
+            "published": self._published,
+            "confirmed": self._confirmed,
+            "failed": self._failed,
+            "timeouts": self._timeouts,
+            "lost_on_close": self._lost,
+            "reconnects": self._reconnects,
+            "confirm_frames": confirm_frames,
+        }
+
+
+def create_publisher() -> EnvelopePublisher:
+    return EnvelopePublisher(
+        settings.rabbitmq_url,
+        settings.email_queue,
+        channels=settings.publisher_channels,
+        max_pending=settings.publisher_max_pending,
+        confirm_timeout=settings.publisher_confirm_timeout,
+        queue_arguments={
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": settings.failed_queue,
+        },
+    )
@@ -0,0 +1,245 @@
+import asyncio
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import jinja2
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Mirrors the environments templates are compiled with in-process: consumer
+# templates are autoescaped, the sender's built-in ones are not.
+NAMESPACE_OPTIONS: Dict[str, Dict[str, Any]] = {"consumer": {"autoescape": True}, "builtin": {}}
+
+
+class RenderTimeout(TimeoutError):
+    """An offloaded render ran past ``RENDER_OFFLOAD_TIMEOUT``; the delivery is retried."""
+
+
+class RenderError(Exception):
+    """A template failed to compile or render in a worker (the Jinja error, flattened to text)."""
+
+
+class TemplateNotLoaded(Exception):
+    pass
+
+
+# Worker process state: each worker compiles a template the first time it is sent the source.
+_worker_templates: "OrderedDict[Tuple[str, Hashable], jinja2.Template]" = OrderedDict()
+_worker_envs: Dict[str, jinja2.Environment] = {}
+_worker_cache_size = 1
+
+
+def _init_worker(cache_size: int, niceness: int) -> None:
+    global _worker_cache_size
+    _worker_cache_size = max(1, cache_size)
+    if niceness:
+        # Lower priority, so when cores are scarce the scheduler favours the process running the I/O loop.
+        os.nice(niceness)
+
+
+def _render_in_worker(namespace: str, key: Hashable, variables: Dict[str, Any], source: Optional[str] = None) -> str:
+    cache_key = (namespace, key)
+    template = _worker_templates.get(cache_key)
+    if template is None:
+        if source is None:
+            raise TemplateNotLoaded(key)
+        env = _worker_envs.get(namespace)
+        if env is None:
+            env = _worker_envs[namespace] = jinja2.Environment(**NAMESPACE_OPTIONS.get(namespace, {}))
+        try:
+            template = env.from_string(source)
+        except jinja2.TemplateError as exc:
+            raise RenderError(f"{type(exc).__name__}: {exc}") from None
+        _worker_templates[cache_key] = template
+        while len(_worker_templates) > _worker_cache_size:
+            _worker_templates.popitem(last=False)
+    else:
+        _worker_templates.move_to_end(cache_key)
+    try:
+        return template.render(**variables)
+    except Exception as exc:
+        raise RenderError(f"{type(exc).__name__}: {exc}") from None
+
+
+class RenderPool:
+    """Renders heavy templates in a process pool so they do not stall the event loop.
+
+    A template is offloaded when its source is at least ``min_bytes`` long or
+    when rendering it in-process has been taking ``min_seconds`` or more
+    (tracked per template key). Each worker keeps its own compiled-template
+    LRU, so normally only the key and the variables are pickled; the source
+    goes along only when the worker that picked the job has not compiled
+    it yet. A render that exceeds ``timeout`` raises RenderTimeout and the
+    workers are replaced, since a stuck render cannot be interrupted.
+
+    Workers are spawned (not forked) on first use in each process and run
+    at ``niceness``, so they only take CPU the event loop does not need.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        min_bytes: int = 65536,
+        min_seconds: float = 0.005,
+        timeout: float = 5.0,
+        cache_size: int = 256,
+        niceness: int = 10,
+    ) -> None:
+        self.workers = max(1, workers)
+        self.min_bytes = min_bytes
+        self.min_seconds = min_seconds
+        self.timeout = timeout
+        self.cache_size = max(1, cache_size)
+        self.niceness = niceness
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+        self._costs: "OrderedDict[Tuple[str, Hashable], float]" = OrderedDict()
+        self._offloaded = 0
+        self._sources_shipped = 0
+        self._timeouts = 0
+        self._errors = 0
+        self._restarts = 0
+
+    @staticmethod
+    def key_for(source: str, key: Optional[Hashable]) -> Hashable:
+        return key if key is not None else hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def should_offload(self, namespace: str, source: str, key: Hashable) -> bool:
+        if len(source) >= self.min_bytes:
+            return True
+        with self._lock:
+            cost = self._costs.get((namespace, key))
+        return cost is not None and cost >= self.min_seconds
+
+    def record_inline(self, namespace: str, key: Hashable, seconds: float) -> None:
+        """Feed the time an in-process render took, so costly templates are offloaded next time."""
+        cache_key = (namespace, key)
+        with self._lock:
+            previous = self._costs.get(cache_key)
+            self._costs[cache_key] = seconds if previous is None else previous + 0.3 * (seconds - previous)
+            self._costs.move_to_end(cache_key)
+            while len(self._costs) > self.cache_size:
+                self._costs.popitem(last=False)
+
+    async def render_or_inline(
+        self,
+        namespace: str,
+        source: str,
+        variables: Dict[str, Any],
+        key: Optional[Hashable],
+        inline: Callable[[], str],
+    ) -> str:
+        """Offload when the template qualifies; otherwise call ``inline`` and remember what it cost."""
+        key = self.key_for(source, key)
+        if self.should_offload(namespace, source, key):
+            return await self.render(namespace, source, variables, key)
+        started = time.perf_counter()
+        rendered = inline()
+        self.record_inline(namespace, key, time.perf_counter() - started)
+        return rendered
+
+    async def render(self, namespace: str, source: str, variables: Dict[str, Any], key: Hashable) -> str:
+        self._offloaded += 1
+        try:
+            try:
+                return await self._submit(namespace, key, variables, None)
+            except TemplateNotLoaded:
+                self._sources_shipped += 1
+                return await self._submit(namespace, key, variables, source)
+        except RenderError:
+            self._errors += 1
+            raise
+
+    async def _submit(self, namespace: str, key: Hashable, variables: Dict[str, Any], source: Optional[str]) -> str:
+        try:
+            return await self._run_in_worker(namespace, key, variables, source)
+        except BrokenProcessPool:
+            # The pool was replaced under us (another render timed out) or a worker died; once more on a fresh one.
+            return await self._run_in_worker(namespace, key, variables, source)
+
+    async def _run_in_worker(
+        self, namespace: str, key: Hashable, variables: Dict[str, Any], source: Optional[str]
+    ) -> str:
+        executor = self._get_executor()
+        try:
+            try:
+                future = executor.submit(_render_in_worker, namespace, key, variables, source)
+            except RuntimeError as exc:
+                # Shut down by a restart from another thread between lookup and submit.
+                raise BrokenProcessPool(str(exc)) from exc
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            self._restart(executor)
+            raise RenderTimeout(f"rendering {key!r} took longer than {self.timeout:.1f}s") from None
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.cache_size, self.niceness),
+                )
+            return self._executor
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self._restarts += 1
+        logger.warning("Replacing the render worker pool")
+        # Workers stuck in a render never pick up a shutdown request; stop them outright.
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "offloaded": self._offloaded,
+            "sources_shipped": self._sources_shipped,
+            "timeouts": self._timeouts,
+            "errors": self._errors,
+            "restarts": self._restarts,
+            "tracked_templates": len(self._costs),
+        }
+
+
+render_pool: Optional[RenderPool] = None
+if settings.render_offload_workers > 0:
+    render_pool = RenderPool(
+        settings.render_offload_workers,
+        min_bytes=settings.render_offload_min_bytes,
+        min_seconds=settings.render_offload_min_seconds,
+        timeout=settings.render_offload_timeout,
+        cache_size=settings.compiled_template_cache_size,
+        niceness=settings.render_offload_nice,
+    )
+    atexit.register(render_pool.close)
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from email.message import EmailMessage
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+import aiosmtplib
+
+from app.services.concurrency import AdaptiveLimit, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Status code servers use to say "closing transmission channel" (throttling,
+# shutdown, session limits). The message can be retried on a new session.
+SERVICE_NOT_AVAILABLE = 421
+
+
+def relay_ok(exc: Optional[BaseException]) -> bool:
+    """Whether a transaction says the relay itself is healthy; 5xx rejections are about the message."""
+    if exc is None or isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(exc, aiosmtplib.SMTPResponseException) and exc.code >= 500
+
+
+class PooledConnection:
+    __slots__ = ("smtp", "created_at", "last_used", "messages_sent")
+
+    def __init__(self, smtp: aiosmtplib.SMTP) -> None:
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP sessions open and hands them out per message.
+
+    Sessions are recycled after ``max_messages_per_connection`` sends or when
+    they sat idle longer than ``idle_timeout`` seconds. A send that hits a 421
+    or a dropped connection is retried once on a freshly opened session.
+
+    With an AdaptiveLimit, at most ``limit.value`` (never more than
+    ``max_size``) transactions run at once and every transaction's latency
+    and outcome feed it; a CircuitBreaker is fed the same outcomes.
+
+    The pool is bound to the event loop it is first used on; if it is later
+    used from another loop (e.g. ``asyncio.run`` per message) the stale
+    sessions are dropped and the pool starts over on the new loop.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], aiosmtplib.SMTP],
+        max_size: int = 10,
+        max_messages_per_connection: int = 100,
+        idle_timeout: float = 60.0,
+        limit: Optional[AdaptiveLimit] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        self._factory = factory
+        self.max_size = max(1, max_size)
+        self.max_messages_per_connection = max(1, max_messages_per_connection)
+        self.idle_timeout = idle_timeout
+        self.limit = limit
+        self.breaker = breaker
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._in_use = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._idle: Deque[PooledConnection] = deque()
+        self._open_count = 0
+        self._closing: Set[asyncio.Task] = set()
+
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._opened = 0
+        self._reused = 0
+        self._reconnects = 0
+        self._recycled = 0
+
+    async def send_message(
+        self, message: EmailMessage, recipients: Optional[List[str]] = None
+    ) -> Dict[str, aiosmtplib.SMTPResponse]:
+        """Send one message; returns the recipients the server refused (when others were accepted)."""
+        for attempt in (1, 2):
+            conn = await self._checkout(fresh=attempt > 1)
+            started = time.perf_counter()
+            try:
+                refused, _ = await conn.smtp.send_message(message, recipients=recipients)
+            except aiosmtplib.SMTPServerDisconnected as exc:
+                self._checkin(conn, reusable=False)
+                if attempt > 1:
+                    self._observe(started, exc)
+                    raise
+                self._reconnects += 1
+                logger.info("SMTP connection dropped (%s); retrying on a new session", exc)
+            except aiosmtplib.SMTPResponseException as exc:
+                self._observe(started, exc)
+                self._checkin(conn, reusable=False)
+                if exc.code != SERVICE_NOT_AVAILABLE or attempt > 1:
+                    raise
+                self._reconnects += 1
+                logger.info("SMTP server closed the session (421); retrying on a new session")
+            except BaseException as exc:
+                if not isinstance(exc, asyncio.CancelledError):
+                    self._observe(started, exc)
+                self._checkin(conn, reusable=False)
+                raise
+            else:
+                self._observe(started, None)
+                conn.messages_sent += 1
+                self._checkin(conn, reusable=True)
+                return refused
+
+    async def close(self) -> None:
+        self._bind_loop()
+        while self._idle:
+            self._open_count -= 1
+            await self._quit(self._idle.popleft())
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self._open_count,
+            "max_size": self.max_size,
+            "limit": self._allowed(),
+            "idle": len(self._idle),
+            "in_use": self._open_count - len(self._idle),
+            "checkouts": self._checkouts,
+            "checkout_wait_seconds_total": self._wait_total,
+            "checkout_wait_seconds_max": self._wait_max,
+            "connections_opened": self._opened,
+            "reuses": self._reused,
+            "reconnects": self._reconnects,
+            "recycled": self._recycled,
+        }
+
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            logger.debug("SMTP pool moved to a new event loop; dropping %d idle sessions", len(self._idle))
+            for conn in self._idle:
+                try:
+                    conn.smtp.close()
+                except Exception:
+                    pass
+            self._idle.clear()
+            self._closing.clear()
+            self._open_count = 0
+            self._waiters.clear()
+            self._in_use = 0
+        self._loop = loop
+
+    def _allowed(self) -> int:
+        return self.max_size if self.limit is None else min(self.max_size, self.limit.value)
+
+    def _observe(self, started: float, exc: Optional[BaseException]) -> None:
+        ok = relay_ok(exc)
+        if self.limit is not None:
+            self.limit.observe(time.perf_counter() - started, ok, self._in_use)
+        if self.breaker is not None:
+            self.breaker.record(ok)
+
+    async def _acquire(self) -> None:
+        # A semaphore whose size follows the adaptive limit; when the limit
+        # drops, callers wait until enough transactions have finished.
+        while self._in_use >= self._allowed():
+            waiter = self._loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._in_use += 1
+        if self._in_use < self._allowed():
+            # The limit grew: let the next caller in as well.
+            self._wake()
+
+    def _release(self) -> None:
+        self._in_use -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def _checkout(self, fresh: bool = False) -> PooledConnection:
+        self._bind_loop()
+        started = time.perf_counter()
+        await self._acquire()
+        waited = time.perf_counter() - started
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+        now = time.monotonic()
+        while self._idle and not fresh:
+            conn = self._idle.pop()
+            if now - conn.last_used > self.idle_timeout or not conn.smtp.is_connected:
+                self._retire(conn)
+                continue
+            self._reused += 1
+            return conn
+        if fresh and self._idle and self._open_count >= self.max_size:
+            self._retire(self._idle.popleft())
+
+        connect_started = time.perf_counter()
+        try:
+            smtp = self._factory()
+            await smtp.connect()
+        except BaseException as exc:
+            if not isinstance(exc, asyncio.CancelledError):
+                self._observe(connect_started, exc)
+            self._release()
+            raise
+        self._opened += 1
+        self._open_count += 1
+        return PooledConnection(smtp)
+
+    def _checkin(self, conn: PooledConnection, reusable: bool) -> None:
+        if reusable and conn.messages_sent < self.max_messages_per_connection:
+            conn.last_used = time.monotonic()
+            self._idle.append(conn)
+        else:
+            if reusable:
+                self._recycled += 1
+            self._retire(conn)
+        self._release()
+
+    def _retire(self, conn: PooledConnection) -> None:
+        self._open_count -= 1
+        task = asyncio.ensure_future(self._quit(conn))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _quit(self, conn: PooledConnection) -> None:
+        try:
+            if conn.smtp.is_connected:
+                await conn.smtp.quit()
+        except Exception:
+            conn.smtp.close()
@@ -0,0 +1,352 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Each record is framed as <payload length><crc32 of payload><JSON payload>.
+HEADER = struct.Struct("<II")
+MAX_SLOTS = 64
+
+Position = Tuple[int, int]
+SpoolRecord = Dict[str, Any]
+
+
+class SpoolFull(Exception):
+    """The spool is at ``EMAIL_SPOOL_MAX_BYTES``; the caller must fall back to the broker."""
+
+
+class Spool:
+    """Append-only, segmented on-disk log of messages waiting for the SMTP relay.
+
+    Records are appended to the active segment and ``append`` returns only
+    once they are fsync'd; concurrent appenders share one fsync. Segments
+    roll over at ``segment_bytes`` and are read back through ``mmap``. The
+    replay position is kept in a ``cursor`` file; segments entirely behind it
+    are deleted. A torn record at the end of the last segment (crash during a
+    write) is truncated away on open.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = settings.spool_max_bytes,
+        segment_bytes: int = settings.spool_segment_bytes,
+        lock_fd: Optional[int] = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.segment_bytes = max(HEADER.size + 1, segment_bytes)
+        self._lock_fd = lock_fd
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+        self._sizes: Dict[int, int] = {}
+        for path in sorted(self.directory.glob("*.seg")):
+            self._sizes[int(path.stem)] = path.stat().st_size
+        self._cursor = self._load_cursor()
+        self._cursor_saved = self._cursor
+        self._cursor_saved_at = time.monotonic()
+        if self._sizes:
+            self._recover(max(self._sizes))
+
+        self._bytes = sum(self._sizes.values())
+        self._pending = self._count_records(self._cursor)
+        self._appended = 0
+        self._committed = 0
+        self._rejected = 0
+        self._corrupt = 0
+
+        # Appends always go to a fresh segment; older ones are only read from now on.
+        self._active_seq = max(self._sizes, default=self._cursor[0]) + 1
+        self._fd = self._open_segment(self._active_seq)
+        self._written = 0
+        self._synced: Position = (self._active_seq, 0)
+        self._roll_pending = False
+        if not self._sizes.keys() - {self._active_seq} and self._cursor[0] < self._active_seq:
+            self._cursor = (self._active_seq, 0)
+
+    def append(self, record: SpoolRecord) -> None:
+        payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        frame = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._bytes + len(frame) > self.max_bytes:
+                self._rejected += 1
+                raise SpoolFull(f"spool holds {self._bytes} bytes (limit {self.max_bytes})")
+            os.write(self._fd, frame)
+            self._written += len(frame)
+            self._bytes += len(frame)
+            self._sizes[self._active_seq] = self._written
+            self._pending += 1
+            self._appended += 1
+            target = (self._active_seq, self._written)
+            if self._written >= self.segment_bytes:
+                self._roll_pending = True
+        self._sync(target)
+
+    def read(self, limit: int) -> List[Tuple[Position, SpoolRecord]]:
+        """Up to ``limit`` durable records after the cursor, each with the position to ``commit``."""
+        with self._lock:
+            segments = sorted(seq for seq in self._sizes if seq >= self._cursor[0])
+            cursor = self._cursor
+            synced = self._synced
+            sizes = dict(self._sizes)
+
+        records: List[Tuple[Position, SpoolRecord]] = []
+        for seq in segments:
+            if seq > synced[0]:
+                break
+            end = synced[1] if seq == synced[0] else sizes[seq]
+            start = cursor[1] if seq == cursor[0] else 0
+            if end - start < HEADER.size:
+                continue
+            with open(self._segment_path(seq), "rb") as handle, mmap.mmap(
+                handle.fileno(), 0, access=mmap.ACCESS_READ
+            ) as view:
+                pos = start
+                end = min(end, len(view))
+                while pos + HEADER.size <= end and len(records) < limit:
+                    length, crc = HEADER.unpack_from(view, pos)
+                    body_end = pos + HEADER.size + length
+                    if body_end > end:
+                        break
+                    payload = view[pos + HEADER.size:body_end]
+                    if zlib.crc32(payload) != crc:
+                        self._skip_corrupt(seq, pos, sizes[seq], bool(records))
+                        return records
+                    records.append(((seq, body_end), json.loads(payload)))
+                    pos = body_end
+            if len(records) >= limit:
+                break
+        return records
+
+    def commit(self, position: Position) -> None:
+        """Mark everything up to ``position`` as handled; fully handled segments are deleted."""
+        with self._lock:
+            if position <= self._cursor:
+                return
+            passed = self._count_records(self._cursor, position)
+            self._cursor = position
+            self._pending = max(0, self._pending - passed)
+            self._committed += passed
+            self._compact()
+            save = time.monotonic() - self._cursor_saved_at >= 1.0
+        if save:
+            self._save_cursor()
+
+    def close(self) -> None:
+        with self._sync_lock, self._lock:
+            if self._fd < 0:
+                return
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = -1
+        self._save_cursor()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_records": self._pending,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "segments": len(self._sizes),
+                "appended": self._appended,
+                "replayed": self._committed,
+                "rejected_full": self._rejected,
+                "corrupt_records": self._corrupt,
+            }
+
+    def _sync(self, target: Position) -> None:
+        # Group commit: whoever takes the lock first fsyncs every appender's bytes.
+        with self._sync_lock:
+            if self._synced >= target:
+                return
+            with self._lock:
+                fd, upto = self._fd, (self._active_seq, self._written)
+                roll = self._roll_pending
+            os.fsync(fd)
+            with self._lock:
+                self._synced = upto
+                if roll:
+                    self._roll()
+
+    def _roll(self) -> None:
+        # Called with both locks held, so nobody is writing to or syncing the old fd.
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._synced = (self._active_seq, self._written)
+        self._active_seq += 1
+        self._fd = self._open_segment(self._active_seq)
+        self._written = 0
+        self._roll_pending = False
+        self._compact()
+
+    def _open_segment(self, seq: int) -> int:
+        fd = os.open(self._segment_path(seq), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self._sizes[seq] = 0
+        self._fsync_directory()
+        return fd
+
+    def _compact(self) -> None:
+        cursor_seq, cursor_offset = self._cursor
+        for seq in sorted(self._sizes):
+            if seq == self._active_seq or seq > cursor_seq:
+                break
+            if seq == cursor_seq and cursor_offset < self._sizes[seq]:
+                break
+            self._bytes -= self._sizes.pop(seq)
+            try:
+                self._segment_path(seq).unlink()
+            except FileNotFoundError:
+                pass
+            if seq == cursor_seq:
+                self._cursor = (seq + 1, 0)
+
+    def _skip_corrupt(self, seq: int, pos: int, size: int, have_records: bool) -> None:
+        if have_records:
+            # The records before it are replayed first; it is skipped on the read after they are committed.
+            return
+        logger.error("Corrupt spool record in segment %d at offset %d; skipping the rest of the segment", seq, pos)
+        # Nothing before the bad record is outstanding, so the segment can go.
+        self.commit((seq, size))
+        with self._lock:
+            self._corrupt += 1
+            # The lengths past the bad record are garbage, so commit's count was a guess.
+            self._pending = self._count_records(self._cursor)
+
+    def _recover(self, seq: int) -> None:
+        path = self._segment_path(seq)
+        size = self._sizes[seq]
+        valid = 0
+        with open(path, "rb") as handle:
+            data = handle.read()
+        while valid + HEADER.size <= size:
+            length, crc = HEADER.unpack_from(data, valid)
+            end = valid + HEADER.size + length
+            if end > size or zlib.crc32(data[valid + HEADER.size:end]) != crc:
+                break
+            valid = end
+        if valid < size:
+            logger.warning("Truncating torn tail of spool segment %d (%d bytes)", seq, size - valid)
+            os.truncate(path, valid)
+            self._sizes[seq] = valid
+
+    def _count_records(self, start: Position, end: Optional[Position] = None) -> int:
+        """Records from ``start`` up to ``end`` (default: the end of the spool), walking the length headers."""
+        count = 0
+        for seq in sorted(self._sizes):
+            if seq < start[0] or not self._sizes[seq]:
+                continue
+            if end is not None and seq > end[0]:
+                break
+            with open(self._segment_path(seq), "rb") as handle, mmap.mmap(
+                handle.fileno(), 0, access=mmap.ACCESS_READ
+            ) as view:
+                pos = start[1] if seq == start[0] else 0
+                stop = min(end[1], len(view)) if end is not None and seq == end[0] else len(view)
+                while pos + HEADER.size <= stop:
+                    length, _ = HEADER.unpack_from(view, pos)
+                    pos += HEADER.size + length
+                    count += 1
+        return count
+
+    def _load_cursor(self) -> Position:
+        try:
+            data = json.loads((self.directory / "cursor").read_text())
+            return int(data["segment"]), int(data["offset"])
+        except FileNotFoundError:
+            return min(self._sizes, default=0), 0
+        except (ValueError, KeyError) as exc:
+            logger.error("Unreadable spool cursor (%s); replaying from the oldest segment", exc)
+            return min(self._sizes, default=0), 0
+
+    def _save_cursor(self) -> None:
+        with self._lock:
+            cursor = self._cursor
+        if cursor == self._cursor_saved:
+            return
+        tmp = self.directory / "cursor.tmp"
+        with open(tmp, "w") as handle:
+            json.dump({"segment": cursor[0], "offset": cursor[1]}, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, self.directory / "cursor")
+        self._cursor_saved = cursor
+        self._cursor_saved_at = time.monotonic()
+
+    def _fsync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _segment_path(self, seq: int) -> Path:
+        return self.directory / f"{seq:010d}.seg"
+
+
+def _lock_slot(directory: Path) -> Optional[int]:
+    fd = os.open(directory / "LOCK", os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def open_spool(base_dir: str) -> Spool:
+    """Open the first spool slot under ``base_dir`` that no other process holds.
+
+    Every consumer process needs a spool of its own; slots are claimed with
+    an exclusive ``flock`` so a restarted worker picks up where a crashed one
+    left off.
+    """
+    for slot in range(MAX_SLOTS):
+        directory = Path(base_dir) / f"slot-{slot}"
+        directory.mkdir(parents=True, exist_ok=True)
+        fd = _lock_slot(directory)
+        if fd is None:
+            continue
+        spool = Spool(directory, lock_fd=fd)
+        logger.info("Using SMTP spool %s (%d records pending)", directory, spool.stats()["pending_records"])
+        return spool
+    raise RuntimeError(f"all {MAX_SLOTS} spool slots under {base_dir} are in use")
+
+
+def adopt_orphaned_spools(base_dir: str) -> List[Spool]:
+    """Lock the other slots under ``base_dir`` that hold records but no process.
+
+    With fewer ``EMAIL_WORKER_PROCESSES`` than before, the highest slots are
+    never opened again; whoever adopts them replays what is left and then
+    closes them, which releases the slot.
+    """
+    adopted: List[Spool] = []
+    for directory in sorted(Path(base_dir).glob("slot-*")):
+        if not any(path.stat().st_size for path in directory.glob("*.seg")):
+            continue
+        fd = _lock_slot(directory)
+        if fd is None:
+            continue
+        spool = Spool(directory, lock_fd=fd)
+        pending = spool.stats()["pending_records"]
+        if not pending:
+            spool.close()
+            continue
+        logger.info("Adopted orphaned SMTP spool %s (%d records pending)", directory, pending)
+        adopted.append(spool)
+    return adopted
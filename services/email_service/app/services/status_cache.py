@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.status_store import StatusRecord
+
+TERMINAL_STATUSES = frozenset({"delivered", "failed"})
+
+
+class StatusReadCache:
+    """Short-lived LRU of terminal status rows for hot polling.
+
+    Only ``delivered`` and ``failed`` rows are cached: they almost never
+    change, while in-progress rows have to be read fresh to be useful.
+    """
+
+    def __init__(self, max_size: int = settings.status_cache_size, ttl: float = settings.status_cache_ttl) -> None:
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, StatusRecord]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, request_id: str) -> Optional[StatusRecord]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(request_id)
+            if entry is None or now - entry[0] >= self.ttl:
+                if entry is not None:
+                    del self._entries[request_id]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(request_id)
+            self._hits += 1
+            return entry[1]
+
+    def put_many(self, records: Iterable[StatusRecord]) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for record in records:
+                if record["status"] not in TERMINAL_STATUSES:
+                    continue
+                self._entries[record["request_id"]] = (now, record)
+                self._entries.move_to_end(record["request_id"])
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
@@ -1,22 +1,154 @@
 import logging
-from typing import Optional
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 import psycopg2
-from psycopg2 import sql
+from psycopg2 import pool, sql
+from psycopg2.extras import execute_values
 
 from app.config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# (status, provider, detail, updated_at, created_at)
+PendingStatus = Tuple[str, Optional[str], Optional[str], datetime, Optional[datetime]]
+StatusUpdate = Tuple[str, str, str, Optional[str]]
+StatusRecord = Dict[str, Any]
+
+RECORD_COLUMNS = ("request_id", "status", "provider", "detail", "updated_at")
+PARTITIONED_COLUMNS = RECORD_COLUMNS + ("created_at",)
+PARTITION_INTERVALS = ("day", "week", "month")
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def partition_time(value: Union[str, datetime, None]) -> Optional[datetime]:
+    """The partition key for a status row: when the notification was created.
+
+    Envelopes carry ``created_at``; it is the same for every update of a
+    request, so all of them land in (and conflict within) one partition.
+    Values are truncated to microseconds, as Postgres stores them. None when
+    it is missing or unparseable: the write then reuses the key of the
+    request's existing row.
+    """
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if value:
+        try:
+            parsed = datetime.fromisoformat(value)
+            return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        except ValueError:
+            logger.debug("Unparseable created_at %r; using the existing row's", value)
+    return None
+
 
 class StatusStore:
+    """Persists delivery statuses through a pooled set of Postgres connections.
+
+    With ``STATUS_WRITE_MODE=write_behind`` updates are buffered in memory,
+    repeated updates for one ``request_id`` collapse to the latest, and a
+    background thread flushes them as one multi-row upsert whenever
+    ``batch_size`` rows are pending or ``flush_interval`` seconds have passed.
+    Rows from ``add_statuses`` wait in a buffer of their own and are flushed
+    first, as inserts that leave existing rows alone.
+
+    With ``STATUS_PARTITION_INTERVAL`` set (day/week/month) the table is
+    range-partitioned by the notification's ``created_at`` and keyed on
+    ``(request_id, created_at)``. A maintenance thread keeps
+    ``STATUS_PARTITION_PREMAKE`` future partitions ready and drops partitions
+    older than ``STATUS_RETENTION_DAYS``. An existing unpartitioned table is
+    migrated in place and becomes the oldest partition.
+    """
+
     def __init__(self) -> None:
         self.dsn = settings.status_database_url
         self.table = settings.status_table
-        self._ensure_table()
+        self.write_behind = settings.status_write_mode == "write_behind"
+        self.batch_size = max(1, settings.status_batch_size)
+        self.flush_interval = settings.status_flush_interval
+        self.max_pending = max(self.batch_size, settings.status_max_pending)
+        self.partition_interval = settings.status_partition_interval.lower()
+        if self.partition_interval and self.partition_interval not in PARTITION_INTERVALS:
+            raise ValueError(f"STATUS_PARTITION_INTERVAL must be one of {PARTITION_INTERVALS}")
+        self.partitioned = bool(self.partition_interval)
+        self.premake = max(1, settings.status_partition_premake)
+        self.retention_days = settings.status_retention_days
+
+        pool_size = max(1, settings.status_pool_size)
+        self._pool = pool.ThreadedConnectionPool(1, pool_size, self.dsn)
+        # getconn() raises PoolError instead of waiting when every connection is out, and the
+        # consumer runs more I/O threads than that; callers queue here for a free connection.
+        self._pool_slots = threading.BoundedSemaphore(pool_size)
+        self.pool_timeout = settings.status_pool_timeout
+        self._pool_waits = 0
+        self._partitions = 0
+        self._partitions_dropped = 0
+        self._maintenance_errors = 0
+        self._maintenance_stop = threading.Event()
+        self._maintainer: Optional[threading.Thread] = None
+        if self.partitioned:
+            self._ensure_partitioned_table()
+            try:
+                self.maintain_partitions()
+            except Exception as exc:
+                # Writes still land in the default partition; the maintenance thread retries.
+                self._maintenance_errors += 1
+                logger.error("Initial status partition maintenance failed: %s", exc)
+            self._maintainer = threading.Thread(target=self._maintenance_loop, name="status-partitions", daemon=True)
+            self._maintainer.start()
+        else:
+            self._ensure_table()
+
+        self._pending: Dict[str, PendingStatus] = {}
+        self._inserts: Dict[str, PendingStatus] = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._flusher: Optional[threading.Thread] = None
+
+        self._collapsed = 0
+        self._inserts_dropped = 0
+        self._flushes = 0
+        self._flush_errors = 0
+        self._rows_flushed = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+        if self.write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name="status-flusher", daemon=True)
+            self._flusher.start()
+
+    def _checkout(self) -> Any:
+        if not self._pool_slots.acquire(blocking=False):
+            self._pool_waits += 1
+            if not self._pool_slots.acquire(timeout=self.pool_timeout):
+                raise pool.PoolError(f"no status store connection free within {self.pool_timeout:.0f}s")
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._pool_slots.release()
+            raise
 
-    def _get_connection(self):
-        return psycopg2.connect(self.dsn)
+    def _checkin(self, conn: Any, close: bool = False) -> None:
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._pool_slots.release()
+
+    @contextmanager
+    def _get_connection(self) -> Iterator[Any]:
+        conn = self._checkout()
+        broken = False
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._checkin(conn, close=broken or conn.closed != 0)
 
     def _ensure_table(self) -> None:
         query = sql.SQL(
@@ -34,25 +166,748 @@ class StatusStore:
         with self._get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(query)
+        self._ensure_indexes()
         logger.info("Status table %s ready", self.table)
 
-    def update_status(self, request_id: str, status: str, provider: str, detail: Optional[str] = None) -> None:
+    def _ensure_indexes(self) -> None:
+        # (updated_at, request_id) serves time-range listings, (status, updated_at, request_id)
+        # the same filtered by status; request_id is the keyset tie-breaker in both.
+        indexes = (
+            (f"{self.table}_updated_at_idx", sql.SQL("(updated_at, request_id)")),
+            (f"{self.table}_status_updated_at_idx", sql.SQL("(status, updated_at, request_id)")),
+        )
+        conn = self._checkout()
+        try:
+            # CONCURRENTLY keeps writers going on a large existing table but cannot run in a transaction.
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for name, columns in indexes:
+                    try:
+                        cur.execute(
+                            sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {columns}").format(
+                                name=sql.Identifier(name), table=sql.Identifier(self.table), columns=columns
+                            )
+                        )
+                    except psycopg2.Error as exc:
+                        logger.warning("Could not create index %s: %s", name, exc)
+        finally:
+            conn.autocommit = False
+            self._checkin(conn)
+
+    @contextmanager
+    def _admin_connection(self) -> Iterator[Any]:
+        """Autocommit connection holding the table's advisory lock, so only one process runs DDL."""
+        conn = self._checkout()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (self.table,))
+            try:
+                yield conn
+            finally:
+                if not conn.closed:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (self.table,))
+        finally:
+            if not conn.closed:
+                conn.autocommit = False
+            self._checkin(conn, close=conn.closed != 0)
+
+    def _ensure_partitioned_table(self) -> None:
+        with self._admin_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(quote_ident(%s))", (self.table,))
+                row = cur.fetchone()
+                if row is None:
+                    self._run_transaction(cur, self._parent_ddl())
+                    logger.info("Created partitioned status table %s (%s partitions)", self.table, self.partition_interval)
+                elif row[0] == "r":
+                    self._migrate_to_partitioned(cur)
+                elif row[0] != "p":
+                    raise RuntimeError(f"{self.table} exists but is not a table")
+
+    def _parent_ddl(self) -> List[Tuple[sql.Composable, tuple]]:
+        table = sql.Identifier(self.table)
+        return [
+            (
+                sql.SQL(
+                    """
+                    CREATE TABLE {table} (
+                        request_id TEXT NOT NULL,
+                        status TEXT NOT NULL,
+                        provider TEXT,
+                        detail TEXT,
+                        updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                        PRIMARY KEY (request_id, created_at)
+                    ) PARTITION BY RANGE (created_at)
+                    """
+                ).format(table=table),
+                (),
+            ),
+            (
+                sql.SQL("CREATE INDEX {name} ON {table} (updated_at, request_id)").format(
+                    name=sql.Identifier(f"{self.table}_updated_at_idx"), table=table
+                ),
+                (),
+            ),
+            (
+                sql.SQL("CREATE INDEX {name} ON {table} (status, updated_at, request_id)").format(
+                    name=sql.Identifier(f"{self.table}_status_updated_at_idx"), table=table
+                ),
+                (),
+            ),
+            # Catches rows outside every range partition instead of failing the write.
+            (
+                sql.SQL("CREATE TABLE {name} PARTITION OF {table} DEFAULT").format(
+                    name=sql.Identifier(f"{self.table}_default"), table=table
+                ),
+                (),
+            ),
+        ]
+
+    def _migrate_to_partitioned(self, cur: Any) -> None:
+        """Turn the existing table into the oldest partition of a new partitioned table.
+
+        The steps that scan the old table (building the new key index,
+        validating its range) do not block writers; only the final
+        rename-and-attach takes a short exclusive lock. Existing rows get
+        ``created_at = '-infinity'`` and are dropped with that partition once
+        it falls out of the retention window.
+        """
+        legacy = f"{self.table}_legacy"
+        table = sql.Identifier(self.table)
+        check = sql.Identifier(f"{legacy}_range")
+        bound = self._bucket_start(datetime.now(timezone.utc))
+        logger.warning("Migrating %s to a partitioned table; existing rows move to partition %s", self.table, legacy)
+
+        cur.execute(
+            sql.SQL("ALTER TABLE {table} ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT '-infinity'").format(
+                table=table
+            )
+        )
+        cur.execute(
+            sql.SQL("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} (request_id, created_at)").format(
+                name=sql.Identifier(f"{legacy}_key"), table=table
+            )
+        )
+        # Dropped first in case an earlier, interrupted attempt used another bound.
+        cur.execute(sql.SQL("ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}").format(table=table, check=check))
+        cur.execute(
+            sql.SQL("ALTER TABLE {table} ADD CONSTRAINT {check} CHECK (created_at < %s) NOT VALID").format(
+                table=table, check=check
+            ),
+            (bound,),
+        )
+        cur.execute(sql.SQL("ALTER TABLE {table} VALIDATE CONSTRAINT {check}").format(table=table, check=check))
+
+        cur.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(quote_ident(%s)) AND contype = 'p'",
+            (self.table,),
+        )
+        primary_key = cur.fetchone()
+        statements: List[Tuple[sql.Composable, tuple]] = [
+            (sql.SQL("SET LOCAL lock_timeout = '10s'"), ()),
+            (sql.SQL("ALTER TABLE {table} RENAME TO {legacy}").format(table=table, legacy=sql.Identifier(legacy)), ()),
+        ]
+        if primary_key is not None:
+            statements.append(
+                (
+                    sql.SQL("ALTER TABLE {legacy} DROP CONSTRAINT {name}").format(
+                        legacy=sql.Identifier(legacy), name=sql.Identifier(primary_key[0])
+                    ),
+                    (),
+                )
+            )
+        # The parent's key has to be backed by a constraint on the partition, not just a unique index.
+        statements.append(
+            (
+                sql.SQL("ALTER TABLE {legacy} ADD CONSTRAINT {name} PRIMARY KEY USING INDEX {index}").format(
+                    legacy=sql.Identifier(legacy),
+                    name=sql.Identifier(f"{legacy}_pkey"),
+                    index=sql.Identifier(f"{legacy}_key"),
+                ),
+                (),
+            )
+        )
+        for suffix in ("updated_at_idx", "status_updated_at_idx"):
+            statements.append(
+                (
+                    sql.SQL("ALTER INDEX IF EXISTS {old} RENAME TO {new}").format(
+                        old=sql.Identifier(f"{self.table}_{suffix}"), new=sql.Identifier(f"{legacy}_{suffix}")
+                    ),
+                    (),
+                )
+            )
+        statements.extend(self._parent_ddl())
+        statements.append(
+            (
+                sql.SQL("ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO (%s)").format(
+                    table=table, legacy=sql.Identifier(legacy)
+                ),
+                (bound,),
+            )
+        )
+        self._run_transaction(cur, statements)
+        logger.info("Migrated %s; rows before %s live in %s", self.table, bound.isoformat(), legacy)
+
+    @staticmethod
+    def _run_transaction(cur: Any, statements: List[Tuple[sql.Composable, tuple]]) -> None:
+        cur.execute("BEGIN")
+        try:
+            for statement, params in statements:
+                cur.execute(statement, params or None)
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        cur.execute("COMMIT")
+
+    def maintain_partitions(self, since: Optional[datetime] = None) -> None:
+        """Create partitions from ``since`` (default: now) through the premake window and drop expired ones."""
+        now = datetime.now(timezone.utc)
+        start = self._bucket_start(since or now)
+        last = self._bucket_start(now)
+        for _ in range(self.premake):
+            last = self._next_bucket(last)
+        table = sql.Identifier(self.table)
+
+        with self._admin_connection() as conn:
+            with conn.cursor() as cur:
+                # Partition DDL locks the parent; give up rather than stall the writers queued behind us.
+                cur.execute("SET lock_timeout = '5s'")
+                try:
+                    while start <= last:
+                        upper = self._next_bucket(start)
+                        try:
+                            self._create_partition(cur, f"{self.table}_p{start:%Y%m%d}", start, upper)
+                        except psycopg2.Error as exc:
+                            self._maintenance_errors += 1
+                            logger.error("Could not create %s partition for %s: %s", self.table, start.date(), exc)
+                        start = upper
+
+                    if self.retention_days > 0:
+                        cutoff = now - timedelta(days=self.retention_days)
+                        for name, upper in self._partition_bounds(cur):
+                            if upper is None or upper > cutoff:
+                                continue
+                            try:
+                                cur.execute(sql.SQL("DROP TABLE {name}").format(name=sql.Identifier(name)))
+                            except psycopg2.Error as exc:
+                                self._maintenance_errors += 1
+                                logger.error("Could not drop expired partition %s: %s", name, exc)
+                            else:
+                                self._partitions_dropped += 1
+                                logger.info("Dropped expired status partition %s (ended %s)", name, upper.isoformat())
+                    self._partitions = len(self._partition_bounds(cur))
+                finally:
+                    cur.execute("RESET lock_timeout")
+
+    def _create_partition(self, cur: Any, name: str, start: datetime, upper: datetime) -> None:
+        table = sql.Identifier(self.table)
+        default = f"{self.table}_default"
+        cur.execute("SELECT to_regclass(quote_ident(%s)), to_regclass(quote_ident(%s))", (name, default))
+        exists, has_default = cur.fetchone()
+        if exists is not None:
+            return
+        create = sql.SQL("CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)").format(
+            name=sql.Identifier(name), table=table
+        )
+        in_range = sql.SQL("created_at >= %s AND created_at < %s")
+        if has_default is not None:
+            cur.execute(
+                sql.SQL("SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})").format(
+                    default=sql.Identifier(default), in_range=in_range
+                ),
+                (start, upper),
+            )
+            stranded = cur.fetchone()[0]
+        else:
+            stranded = False
+        if not stranded:
+            cur.execute(create, (start, upper))
+            return
+
+        # Postgres refuses to create a partition while the default one holds rows in its range
+        # (written before the partition existed), so move them into the new table before attaching it.
+        columns = sql.SQL(", ").join(map(sql.Identifier, PARTITIONED_COLUMNS))
+        self._run_transaction(
+            cur,
+            [
+                (sql.SQL("LOCK TABLE {default} IN ACCESS EXCLUSIVE MODE").format(default=sql.Identifier(default)), ()),
+                (
+                    sql.SQL("CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)").format(
+                        name=sql.Identifier(name), table=table
+                    ),
+                    (),
+                ),
+                (
+                    sql.SQL(
+                        "WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING {columns}) "
+                        "INSERT INTO {name} ({columns}) SELECT {columns} FROM moved"
+                    ).format(default=sql.Identifier(default), in_range=in_range, columns=columns, name=sql.Identifier(name)),
+                    (start, upper),
+                ),
+                (
+                    sql.SQL("ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)").format(
+                        table=table, name=sql.Identifier(name)
+                    ),
+                    (start, upper),
+                ),
+            ],
+        )
+        logger.warning("Moved rows for %s out of %s into new partition %s", start.date(), default, name)
+
+    def _partition_bounds(self, cur: Any) -> List[Tuple[str, Optional[datetime]]]:
+        """(name, exclusive upper bound) of every partition; None for the default partition."""
+        cur.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(quote_ident(%s))
+            """,
+            (self.table,),
+        )
+        bounds = []
+        for name, expression in cur.fetchall():
+            match = _UPPER_BOUND.search(expression or "")
+            bounds.append((name, datetime.fromisoformat(match.group(1)) if match else None))
+        return bounds
+
+    def _maintenance_loop(self) -> None:
+        while not self._maintenance_stop.wait(settings.status_partition_maintenance_interval):
+            try:
+                self.maintain_partitions()
+            except Exception as exc:
+                self._maintenance_errors += 1
+                logger.error("Status partition maintenance failed: %s", exc)
+
+    def _bucket_start(self, moment: datetime) -> datetime:
+        moment = moment.astimezone(timezone.utc)
+        day = datetime(moment.year, moment.month, moment.day, tzinfo=timezone.utc)
+        if self.partition_interval == "week":
+            return day - timedelta(days=day.weekday())
+        if self.partition_interval == "month":
+            return day.replace(day=1)
+        return day
+
+    def _next_bucket(self, start: datetime) -> datetime:
+        if self.partition_interval == "week":
+            return start + timedelta(days=7)
+        if self.partition_interval == "month":
+            return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start + timedelta(days=1)
+
+    def update_status(
+        self,
+        request_id: str,
+        status: str,
+        provider: str,
+        detail: Optional[str] = None,
+        created_at: Union[str, datetime, None] = None,
+    ) -> None:
+        """``created_at`` is the notification's creation time (the partition key when partitioned)."""
         if not request_id:
             return
 
+        row = (status, provider, detail, datetime.now(timezone.utc), partition_time(created_at))
+        if self.write_behind:
+            self._enqueue(request_id, row)
+            return
+        self._write_batch({request_id: row})
+        logger.debug("Updated status for %s -> %s", request_id, status)
+
+    def update_statuses(self, updates: Iterable[StatusUpdate], created_at: Union[str, datetime, None] = None) -> None:
+        """Write many ``(request_id, status, provider, detail)`` rows as one multi-row upsert."""
+        now = datetime.now(timezone.utc)
+        created = partition_time(created_at)
+        batch = {
+            request_id: (status, provider, detail, now, created)
+            for request_id, status, provider, detail in updates
+            if request_id
+        }
+        if not batch:
+            return
+        if self.write_behind:
+            for request_id, row in batch.items():
+                self._enqueue(request_id, row)
+            return
+        self._write_batch(batch)
+
+    def add_statuses(self, updates: Iterable[StatusUpdate], created_at: Union[str, datetime, None] = None) -> None:
+        """Insert rows for requests that have none yet; rows already written (e.g. by a consumer) are kept.
+
+        In write-behind mode this never waits: rows that do not fit in the
+        buffer are dropped, since a later update writes the request's row anyway.
+        """
+        now = datetime.now(timezone.utc)
+        created = partition_time(created_at)
+        batch = {
+            request_id: (status, provider, detail, now, created)
+            for request_id, status, provider, detail in updates
+            if request_id
+        }
+        if not batch:
+            return
+        if not self.write_behind:
+            self._write_batch(batch, overwrite=False)
+            return
+        with self._cond:
+            for request_id, row in batch.items():
+                if request_id in self._pending or request_id in self._inserts:
+                    continue
+                if len(self._pending) + len(self._inserts) >= self.max_pending:
+                    self._inserts_dropped += 1
+                    continue
+                self._inserts[request_id] = row
+            if len(self._pending) + len(self._inserts) >= self.batch_size:
+                self._cond.notify_all()
+
+    def get_statuses(self, request_ids: List[str]) -> Dict[str, str]:
+        """Bulk lookup; ids without a row are left out of the result."""
+        found: Dict[str, str] = {}
+        with self._cond:
+            for request_id in request_ids:
+                pending = self._pending.get(request_id) or self._inserts.get(request_id)
+                if pending is not None:
+                    found[request_id] = pending[0]
+        missing = [request_id for request_id in request_ids if request_id not in found]
+        if not missing:
+            return found
+
         query = sql.SQL(
             """
-            INSERT INTO {table} (request_id, status, provider, detail, updated_at)
-            VALUES (%s, %s, %s, %s, NOW())
-            ON CONFLICT (request_id)
-            DO UPDATE SET status = EXCLUDED.status,
-                          provider = EXCLUDED.provider,
-                          detail = EXCLUDED.detail,
-                          updated_at = NOW();
+            SELECT DISTINCT ON (request_id) request_id, status FROM {table}
+            WHERE request_id = ANY(%s) ORDER BY request_id, updated_at DESC
             """
         ).format(table=sql.Identifier(self.table))
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (missing,))
+                found.update(cur.fetchall())
+        return found
 
+    def get_records(self, request_ids: List[str]) -> Dict[str, StatusRecord]:
+        """Full rows for ``request_ids`` in one round-trip; unknown ids are left out."""
+        found: Dict[str, StatusRecord] = {}
+        with self._cond:
+            for request_id in request_ids:
+                pending = self._pending.get(request_id) or self._inserts.get(request_id)
+                if pending is not None:
+                    found[request_id] = dict(zip(RECORD_COLUMNS, (request_id, *pending[:4])))
+        missing = [request_id for request_id in request_ids if request_id not in found]
+        if not missing:
+            return found
+
+        # DISTINCT ON: a request written both before and after a partitioning migration has two rows.
+        query = sql.SQL(
+            """
+            SELECT DISTINCT ON (request_id) request_id, status, provider, detail, updated_at FROM {table}
+            WHERE request_id = ANY(%s) ORDER BY request_id, updated_at DESC
+            """
+        ).format(table=sql.Identifier(self.table))
         with self._get_connection() as conn:
             with conn.cursor() as cur:
-                cur.execute(query, (request_id, status, provider, detail))
-        logger.debug("Updated status for %s -> %s", request_id, status)
+                cur.execute(query, (missing,))
+                for row in cur.fetchall():
+                    found[row[0]] = dict(zip(RECORD_COLUMNS, row))
+        return found
+
+    def list_records(
+        self,
+        status: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+        limit: int = 100,
+    ) -> List[StatusRecord]:
+        """Rows newest first, optionally filtered by status and ``updated_at`` range.
+
+        ``after`` is the ``(updated_at, request_id)`` of the last row of the
+        previous page (keyset pagination), so deep pages cost the same as the
+        first. Rows still buffered by write-behind show up once flushed.
+        """
+        conditions = []
+        params: List[Any] = []
+        if status is not None:
+            conditions.append(sql.SQL("status = %s"))
+            params.append(status)
+        if since is not None:
+            conditions.append(sql.SQL("updated_at >= %s"))
+            params.append(since)
+        if until is not None:
+            conditions.append(sql.SQL("updated_at < %s"))
+            params.append(until)
+        if after is not None:
+            conditions.append(sql.SQL("(updated_at, request_id) < (%s, %s)"))
+            params.extend(after)
+        where = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions) if conditions else sql.SQL("")
+        query = sql.SQL(
+            """
+            SELECT request_id, status, provider, detail, updated_at FROM {table}
+            {where}
+            ORDER BY updated_at DESC, request_id DESC
+            LIMIT %s
+            """
+        ).format(table=sql.Identifier(self.table), where=where)
+        params.append(limit)
+
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                return [dict(zip(RECORD_COLUMNS, row)) for row in cur.fetchall()]
+
+    def get_status(self, request_id: str) -> Optional[str]:
+        with self._cond:
+            pending = self._pending.get(request_id) or self._inserts.get(request_id)
+        if pending is not None:
+            return pending[0]
+
+        query = sql.SQL("SELECT status FROM {table} WHERE request_id = %s ORDER BY updated_at DESC LIMIT 1").format(
+            table=sql.Identifier(self.table)
+        )
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (request_id,))
+                row = cur.fetchone()
+        return row[0] if row else None
+
+    def ping(self) -> None:
+        timeout_ms = int(settings.health_probe_timeout * 1000)
+        with self._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL statement_timeout = %s", (timeout_ms,))
+                cur.execute("SELECT 1")
+
+    def flush(self) -> None:
+        with self._cond:
+            batch, self._pending = self._pending, {}
+            inserts, self._inserts = self._inserts, {}
+        self._write_buffers(batch, inserts)
+
+    def close(self) -> None:
+        if self._maintainer is not None:
+            self._maintenance_stop.set()
+            self._maintainer.join()
+            self._maintainer = None
+        if self._flusher is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        self._pool.closeall()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._pending) + len(self._inserts)
+        return {
+            "write_behind": self.write_behind,
+            "queue_depth": depth,
+            "max_pending": self.max_pending,
+            "pool_waits": self._pool_waits,
+            "collapsed": self._collapsed,
+            "inserts_dropped": self._inserts_dropped,
+            "flushes": self._flushes,
+            "flush_errors": self._flush_errors,
+            "rows_flushed": self._rows_flushed,
+            "last_flush_seconds": self._last_flush_seconds,
+            "max_flush_seconds": self._max_flush_seconds,
+            "partitions": self._partitions,
+            "partitions_dropped": self._partitions_dropped,
+            "partition_maintenance_errors": self._maintenance_errors,
+        }
+
+    def _enqueue(self, request_id: str, row: PendingStatus) -> None:
+        with self._cond:
+            while len(self._pending) >= self.max_pending and request_id not in self._pending and not self._stopping:
+                # Backpressure: wait for the flusher instead of growing without bound.
+                self._cond.notify_all()
+                self._cond.wait(self.flush_interval)
+            previous = self._pending.get(request_id)
+            inserted = self._inserts.pop(request_id, None)
+            if previous is not None:
+                self._collapsed += 1
+            known = previous or inserted
+            if known is not None and row[4] is None:
+                # Keep the partition key an earlier update of this request knew.
+                row = (*row[:4], known[4])
+            self._pending[request_id] = row
+            if len(self._pending) + len(self._inserts) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and len(self._pending) + len(self._inserts) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._stopping:
+                    return
+                batch, self._pending = self._pending, {}
+                inserts, self._inserts = self._inserts, {}
+                self._cond.notify_all()
+
+            if not batch and not inserts:
+                continue
+            try:
+                self._write_buffers(batch, inserts)
+            except Exception as exc:
+                logger.error("Status flush of %d rows failed: %s", len(batch) + len(inserts), exc)
+                self._requeue(batch, inserts)
+                time.sleep(min(self.flush_interval * 2, 5.0))
+
+    def _write_buffers(self, batch: Dict[str, PendingStatus], inserts: Dict[str, PendingStatus]) -> None:
+        # Inserts first: an update of the same request must land on top of its inserted row, not under it.
+        if inserts:
+            self._write_batch(inserts, overwrite=False)
+        if batch:
+            self._write_batch(batch)
+
+    def _requeue(self, batch: Dict[str, PendingStatus], inserts: Dict[str, PendingStatus]) -> None:
+        with self._cond:
+            for request_id, row in batch.items():
+                # Keep anything newer that arrived while the flush was failing.
+                self._pending.setdefault(request_id, row)
+            for request_id, row in inserts.items():
+                if request_id not in self._pending:
+                    self._inserts.setdefault(request_id, row)
+
+    def _write_batch(self, batch: Dict[str, PendingStatus], overwrite: bool = True) -> None:
+        action = sql.SQL(
+            """DO UPDATE SET status = EXCLUDED.status,
+                              provider = EXCLUDED.provider,
+                              detail = EXCLUDED.detail,
+                              updated_at = EXCLUDED.updated_at"""
+            if overwrite
+            else "DO NOTHING"
+        )
+        if self.partitioned:
+            query = sql.SQL(
+                """
+                INSERT INTO {table} (request_id, status, provider, detail, updated_at, created_at)
+                VALUES %s
+                ON CONFLICT (request_id, created_at)
+                {action};
+                """
+            ).format(table=sql.Identifier(self.table), action=action)
+            rows = None
+        else:
+            query = sql.SQL(
+                """
+                INSERT INTO {table} (request_id, status, provider, detail, updated_at)
+                VALUES %s
+                ON CONFLICT (request_id)
+                {action};
+                """
+            ).format(table=sql.Identifier(self.table), action=action)
+            rows = [(request_id, *row[:4]) for request_id, row in batch.items()]
+
+        started = time.perf_counter()
+        try:
+            with self._get_connection() as conn:
+                with conn.cursor() as cur:
+                    if rows is None:
+                        rows = self._partitioned_rows(cur, batch)
+                    execute_values(cur, query.as_string(conn), rows, page_size=len(rows))
+        except Exception:
+            self._flush_errors += 1
+            raise
+        elapsed = time.perf_counter() - started
+
+        self._flushes += 1
+        self._rows_flushed += len(rows)
+        self._last_flush_seconds = elapsed
+        self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+        logger.debug("Flushed %d status rows in %.1fms", len(rows), elapsed * 1000)
+
+    def _partitioned_rows(self, cur: Any, batch: Dict[str, PendingStatus]) -> List[tuple]:
+        """Rows for the partitioned upsert; updates without ``created_at`` take the existing row's.
+
+        Falling back to the write time would create a second row for the
+        request (the key includes ``created_at``), so it is only used for
+        requests that have no row yet.
+        """
+        missing = [request_id for request_id, row in batch.items() if row[4] is None]
+        known: Dict[str, datetime] = {}
+        if missing:
+            cur.execute(
+                sql.SQL(
+                    "SELECT DISTINCT ON (request_id) request_id, created_at FROM {table} "
+                    "WHERE request_id = ANY(%s) ORDER BY request_id, updated_at DESC"
+                ).format(table=sql.Identifier(self.table)),
+                (missing,),
+            )
+            known = dict(cur.fetchall())
+        now = datetime.now(timezone.utc)
+        return [
+            (request_id, *row[:4], row[4] or known.get(request_id, now)) for request_id, row in batch.items()
+        ]
+
+
+class IdempotencyKeyStore:
+    """HTTP idempotency keys that were delivered, kept in their own table.
+
+    They are not notifications, so they stay out of the status table (which
+    the gateway and push service share and ``/statuses`` lists). Answers the
+    same ``get_status``/``get_statuses`` lookups as StatusStore so a
+    DeliveryIndex can sit on top, and borrows the StatusStore's connection
+    pool. Keys older than ``IDEMPOTENCY_KEY_TTL_DAYS`` are pruned (at most
+    hourly) as new ones are recorded.
+    """
+
+    PRUNE_INTERVAL = 3600.0
+
+    def __init__(self, status_store: StatusStore) -> None:
+        self.status_store = status_store
+        self.table = settings.idempotency_table
+        self.ttl_days = settings.idempotency_key_ttl_days
+        self._next_prune = 0.0
+        table = sql.Identifier(self.table)
+        with status_store._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL(
+                        """
+                        CREATE TABLE IF NOT EXISTS {table} (
+                            key TEXT PRIMARY KEY,
+                            delivered_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                        )
+                        """
+                    ).format(table=table)
+                )
+                cur.execute(
+                    sql.SQL("CREATE INDEX IF NOT EXISTS {name} ON {table} (delivered_at)").format(
+                        name=sql.Identifier(f"{self.table}_delivered_at_idx"), table=table
+                    )
+                )
+
+    def get_status(self, key: str) -> Optional[str]:
+        return self.get_statuses([key]).get(key)
+
+    def get_statuses(self, keys: List[str]) -> Dict[str, str]:
+        query = sql.SQL("SELECT key FROM {table} WHERE key = ANY(%s)").format(table=sql.Identifier(self.table))
+        with self.status_store._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (list(keys),))
+                return {row[0]: "delivered" for row in cur.fetchall()}
+
+    def mark_delivered(self, key: str) -> None:
+        table = sql.Identifier(self.table)
+        with self.status_store._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    sql.SQL(
+                        "INSERT INTO {table} (key) VALUES (%s) ON CONFLICT (key) DO UPDATE SET delivered_at = NOW()"
+                    ).format(table=table),
+                    (key,),
+                )
+                if self.ttl_days > 0 and time.monotonic() >= self._next_prune:
+                    self._next_prune = time.monotonic() + self.PRUNE_INTERVAL
+                    cur.execute(
+                        sql.SQL("DELETE FROM {table} WHERE delivered_at < %s").format(table=table),
+                        (datetime.now(timezone.utc) - timedelta(days=self.ttl_days),),
+                    )
@@ -0,0 +1,76 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import jinja2
+
+from app.config.settings import settings
+from app.observability import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledTemplateCache:
+    """Bounded LRU of compiled Jinja templates.
+
+    Entries are keyed by ``(namespace, key)``; when the caller has no stable
+    key (slug/locale/version) the SHA-1 of the source is used instead, so two
+    identical sources always share one compiled template.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max(1, max_size)
+        self._templates: "OrderedDict[Tuple[str, Hashable], jinja2.Template]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(
+        self,
+        namespace: str,
+        env: jinja2.Environment,
+        source: str,
+        key: Optional[Hashable] = None,
+    ) -> jinja2.Template:
+        if key is None:
+            key = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        cache_key = (namespace, key)
+
+        with self._lock:
+            template = self._templates.get(cache_key)
+            if template is not None:
+                self._hits += 1
+                self._templates.move_to_end(cache_key)
+                return template
+            self._misses += 1
+
+        template = env.from_string(source)
+
+        with self._lock:
+            self._templates[cache_key] = template
+            self._templates.move_to_end(cache_key)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+                self._evictions += 1
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._templates),
+                "max_size": self.max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+compiled_templates = CompiledTemplateCache(settings.compiled_template_cache_size)
+metrics.register_stats("compiled_templates", compiled_templates.stats)
@@ -0,0 +1,253 @@
+"""End-to-end consumer throughput benchmark against local stand-ins.
+
+Runs the real EmailConsumer pipeline (decode, dedup, template fetch, render,
+SMTP via the pooled EmailSender, status write, ack) with a fake SMTP relay,
+a fake template service, an in-memory broker channel and an in-memory status
+sink, and reports msgs/sec, end-to-end latency percentiles and a per-stage
+breakdown.
+
+    cd services/email_service
+    python -m benchmarks.consumer_throughput --messages 2000 --concurrency 32 --smtp-latency-ms 40
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from prometheus_client import REGISTRY
+
+from app.config.settings import settings
+from benchmarks.standins import (
+    FakeSMTPServer,
+    FakeTemplateService,
+    InMemoryChannel,
+    InMemoryStatusStore,
+    percentile,
+)
+
+STAGES = ("decode", "template_fetch", "render", "rate_limit", "smtp_send", "spool_write", "status_write", "ack")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("async", "blocking"), default="async")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32, help="max in-flight messages (async mode)")
+    parser.add_argument("--prefetch", type=int, default=64)
+    parser.add_argument("--rate", type=float, default=0.0, help="publish rate in msgs/sec; 0 publishes everything up front")
+    parser.add_argument("--body-kb", type=float, default=2.0, help="template body size")
+    parser.add_argument("--variables", type=int, default=5, help="extra variables per envelope")
+    parser.add_argument("--smtp-latency-ms", type=float, default=20.0)
+    parser.add_argument("--smtp-error-rate", type=float, default=0.0)
+    parser.add_argument("--smtp-drop-rate", type=float, default=0.0)
+    parser.add_argument("--smtp-pool-size", type=int, default=settings.smtp_pool_size)
+    parser.add_argument("--template-latency-ms", type=float, default=5.0)
+    parser.add_argument("--status-latency-ms", type=float, default=0.0)
+    parser.add_argument(
+        "--campaign-size", type=int, default=0, help="recipients per campaign envelope; 0 sends one envelope per message"
+    )
+    parser.add_argument("--domains", type=int, default=1, help="spread recipients over this many domains")
+    parser.add_argument("--domain-rate", type=float, default=0.0, help="per-domain msgs/sec; 0 disables rate limiting")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+def stage_snapshot() -> Dict[str, Dict[str, float]]:
+    snapshot = {stage: {"sum": 0.0, "count": 0.0} for stage in STAGES}
+    for family in REGISTRY.collect():
+        if family.name != "email_stage_duration_seconds":
+            continue
+        for sample in family.samples:
+            stage = sample.labels.get("stage")
+            if stage not in snapshot:
+                continue
+            if sample.name.endswith("_sum"):
+                snapshot[stage]["sum"] = sample.value
+            elif sample.name.endswith("_count"):
+                snapshot[stage]["count"] = sample.value
+    return snapshot
+
+
+def build_envelope(index: int, variables: int, domains: int = 1) -> bytes:
+    envelope = {
+        "request_id": str(uuid.uuid4()),
+        "correlation_id": f"bench-{index}",
+        "created_at": "2025-01-01T00:00:00Z",
+        "channel": "email",
+        "user": {"id": str(uuid.uuid4()), "email": f"user{index}@example{index % max(1, domains)}.com", "locale": "en"},
+        "template": {"slug": "bench_digest"},
+        "variables": {"name": f"User {index}", "period": "this week"},
+        "retry_count": 0,
+    }
+    for extra in range(variables):
+        envelope["variables"][f"var_{extra}"] = f"value-{extra}-{index}"
+    return json.dumps(envelope).encode()
+
+
+def build_campaign(index: int, size: int, variables: int, domains: int = 1) -> bytes:
+    envelope = {
+        "request_id": str(uuid.uuid4()),
+        "correlation_id": f"bench-campaign-{index}",
+        "created_at": "2025-01-01T00:00:00Z",
+        "channel": "email",
+        "template": {"slug": "bench_digest"},
+        "variables": {"name": "there", "period": "this week"},
+        "recipients": [
+            {
+                "request_id": str(uuid.uuid4()),
+                "email": f"user{index}-{n}@example{n % max(1, domains)}.com",
+                "variables": {f"var_{extra}": f"value-{extra}" for extra in range(variables)},
+            }
+            for n in range(size)
+        ],
+        "retry_count": 0,
+    }
+    return json.dumps(envelope).encode()
+
+
+def configure(smtp_port: int, template_url: str, args: argparse.Namespace) -> None:
+    settings.smtp_host = "127.0.0.1"
+    settings.smtp_port = smtp_port
+    settings.smtp_username = "bench"
+    settings.smtp_password = "bench"
+    settings.smtp_start_tls = False
+    settings.smtp_pool_size = args.smtp_pool_size
+    settings.template_service_url = template_url
+    settings.consumer_concurrency = args.concurrency
+    settings.consumer_prefetch = args.prefetch if args.mode == "async" else 1
+    settings.domain_default_rate = args.domain_rate
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.consumers.async_consumer import AsyncEmailConsumer
+    from app.consumers.base_consumer import EmailConsumer
+
+    smtp = FakeSMTPServer(
+        latency=args.smtp_latency_ms / 1000.0,
+        error_rate=args.smtp_error_rate,
+        drop_rate=args.smtp_drop_rate,
+    )
+    smtp_port = smtp.start()
+    templates = FakeTemplateService(body_size=int(args.body_kb * 1024), latency=args.template_latency_ms / 1000.0)
+    template_url = templates.start()
+    configure(smtp_port, template_url, args)
+
+    status_store = InMemoryStatusStore(latency=args.status_latency_ms / 1000.0)
+    if args.campaign_size:
+        # --messages counts recipients; shared variables keep bodies identical so RCPTs batch.
+        bodies = [
+            build_campaign(i, args.campaign_size, args.variables, args.domains)
+            for i in range(max(1, args.messages // args.campaign_size))
+        ]
+    else:
+        bodies = [build_envelope(i, args.variables, args.domains) for i in range(args.messages)]
+    loop = asyncio.get_running_loop()
+    before = stage_snapshot()
+
+    if args.mode == "async":
+        consumer = AsyncEmailConsumer(status_store=status_store)
+        consumer.loop = loop
+        consumer._slots = asyncio.Semaphore(consumer.max_in_flight)
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=consumer.max_in_flight))
+        channel = InMemoryChannel(consumer.prefetch, consumer._on_message)
+        consumer.channel = channel
+        await consumer.enable_confirms(channel)
+
+        started = time.perf_counter()
+        for body in bodies:
+            channel.publish(body)
+            if args.rate:
+                await asyncio.sleep(1.0 / args.rate)
+        await channel.wait_settled()
+        elapsed = time.perf_counter() - started
+        consumer._pump_task.cancel()
+    else:
+        consumer = EmailConsumer(status_store=status_store)
+        channel = InMemoryChannel(1, consumer.process_message)
+        consumer.channel = channel
+
+        def drive() -> None:
+            for body in bodies:
+                channel.publish(body)
+                if args.rate:
+                    time.sleep(1.0 / args.rate)
+
+        started = time.perf_counter()
+        await asyncio.to_thread(drive)
+        elapsed = time.perf_counter() - started
+
+    after = stage_snapshot()
+    await consumer.email_sender.close()
+    smtp.stop()
+    templates.stop()
+
+    stages = {}
+    for stage in STAGES:
+        count = after[stage]["count"] - before[stage]["count"]
+        total = after[stage]["sum"] - before[stage]["sum"]
+        stages[stage] = {"count": int(count), "mean_ms": (total / count * 1000.0) if count else 0.0}
+
+    latencies = channel.latencies
+    emails = len(bodies) * (args.campaign_size or 1)
+    return {
+        "mode": args.mode,
+        "messages": emails,
+        "concurrency": args.concurrency if args.mode == "async" else 1,
+        "body_kb": args.body_kb,
+        "elapsed_seconds": elapsed,
+        "msgs_per_sec": emails / elapsed if elapsed else 0.0,
+        "acked": channel.acked,
+        "nacked": channel.nacked,
+        "retried": sum(channel.published.values()),
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000.0,
+            "p99": percentile(latencies, 99) * 1000.0,
+            "max": max(latencies) * 1000.0 if latencies else 0.0,
+        },
+        "stages": stages,
+        "smtp": {
+            "sessions": smtp.sessions,
+            "messages": smtp.messages,
+            "recipients": smtp.recipients,
+            "rejected": smtp.rejected,
+        },
+        "smtp_pool": consumer.email_sender.smtp_pool.stats(),
+        "template_requests": templates.requests,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(
+        f"mode={report['mode']} messages={report['messages']} concurrency={report['concurrency']} "
+        f"body={report['body_kb']}KB"
+    )
+    print(f"  throughput   {report['msgs_per_sec']:10.1f} msgs/sec ({report['elapsed_seconds']:.2f}s)")
+    print(f"  acked/nacked {report['acked']}/{report['nacked']} (retries scheduled: {report['retried']})")
+    latency = report["latency_ms"]
+    print(f"  e2e latency  p50={latency['p50']:.1f}ms p99={latency['p99']:.1f}ms max={latency['max']:.1f}ms")
+    print("  stage          count     mean")
+    for stage, values in report["stages"].items():
+        print(f"  {stage:<14}{values['count']:>6} {values['mean_ms']:>8.2f}ms")
+    print(
+        f"  smtp sessions={report['smtp']['sessions']} transactions={report['smtp']['messages']} "
+        f"rcpts={report['smtp']['recipients']} reuses={report['smtp_pool']['reuses']} "
+        f"template requests={report['template_requests']}"
+    )
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
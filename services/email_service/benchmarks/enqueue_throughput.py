@@ -0,0 +1,168 @@
+"""HTTP enqueue benchmark: /send-email sending inline vs publishing to the queue.
+
+Drives the FastAPI app in-process (no network, no uvicorn) with
+``--requests`` POSTs to ``/send-email`` from ``--clients`` concurrent
+clients and reports requests per second and latency. ``send`` renders and
+delivers to a fake relay inside the request, as the default mode does.
+``enqueue-serial`` publishes over one channel and waits for each confirm
+before the next publish; ``enqueue`` is EMAIL_HTTP_SEND_MODE=enqueue as
+shipped, with confirms batched over ``--channels`` channels. The broker
+stand-in confirms in one batch every ``--sync-ms``, like RabbitMQ syncing
+persistent messages to disk; ``queued`` status rows go to an in-memory
+store. Client and app share one process, so req/s is bounded by the HTTP
+stack's CPU; ``publish/s`` is the enqueue path alone (envelope, validation,
+publish, confirm, status row) from ``--clients`` tasks.
+
+    cd services/email_service
+    python -m benchmarks.enqueue_throughput --requests 5000 --clients 64
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from app.config.settings import settings
+from app.models.envelope import decode_envelope
+from app.services.publisher import ConfirmChannel, EnvelopePublisher
+from benchmarks.standins import FakeConfirmChannel, FakeSMTPServer, InMemoryStatusStore, percentile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=64, help="concurrent HTTP clients")
+    parser.add_argument("--send-requests", type=int, default=500, help="requests for the (slow) send mode")
+    parser.add_argument("--smtp-latency-ms", type=float, default=20.0)
+    parser.add_argument("--smtp-pool-size", type=int, default=settings.smtp_pool_size)
+    parser.add_argument("--sync-ms", type=float, default=2.0, help="broker confirm batching interval")
+    parser.add_argument("--channels", type=int, default=settings.publisher_channels)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+def fake_publisher(channels: int, max_pending: int, sync_interval: float) -> EnvelopePublisher:
+    publisher = EnvelopePublisher("amqp://unused", settings.email_queue, channels=channels, max_pending=max_pending)
+    for number in range(channels):
+        raw = FakeConfirmChannel(sync_interval, channel_number=number + 1)
+        channel = ConfirmChannel(raw)
+        raw.confirm_delivery(channel.on_confirm)
+        publisher._channels.append(channel)
+    return publisher
+
+
+def payload(index: int) -> Dict[str, Any]:
+    return {
+        "recipient_email": f"user{index}@example.com",
+        "template_id": "welcome",
+        "subject": "Welcome {{ name }}",
+        "variables": {"name": f"User {index}", "verification_code": "123456"},
+    }
+
+
+async def publish_only(requests: int, clients: int) -> float:
+    from app.main import EmailRequest, _enqueue
+
+    email_requests = [EmailRequest(**payload(index)) for index in range(requests)]
+    remaining = iter(email_requests)
+
+    async def client() -> None:
+        for email_request in remaining:
+            await _enqueue("/send-email", email_request, None, None)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return requests / (time.perf_counter() - started)
+
+
+async def drive(app: Any, requests: int, clients: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    remaining = iter(range(requests))
+
+    async def client(http: httpx.AsyncClient) -> None:
+        for index in remaining:
+            started = time.perf_counter()
+            response = await http.post("/send-email", json=payload(index))
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "requests_per_sec": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000.0,
+        "p99_ms": percentile(latencies, 99) * 1000.0,
+        "statuses": statuses,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from app.main import _status_writes, app
+
+    smtp = FakeSMTPServer(latency=args.smtp_latency_ms / 1000.0)
+    settings.smtp_host = "127.0.0.1"
+    settings.smtp_port = smtp.start()
+    settings.smtp_username = "bench"
+    settings.smtp_password = "bench"
+    settings.smtp_start_tls = False
+    settings.smtp_pool_size = args.smtp_pool_size
+    rows = []
+    try:
+        settings.http_send_mode = "send"
+        rows.append({"mode": "send", **await drive(app, args.send_requests, args.clients)})
+        await app.state.email_sender.close()
+
+        settings.http_send_mode = "enqueue"
+        app.state.status_store = InMemoryStatusStore()
+        sync = args.sync_ms / 1000.0
+        for mode, publisher in (
+            ("enqueue-serial", fake_publisher(1, 1, sync)),
+            ("enqueue", fake_publisher(args.channels, settings.publisher_max_pending, sync)),
+        ):
+            app.state.envelope_publisher = publisher
+            row = await drive(app, args.requests, args.clients)
+            row["publish_per_sec"] = await publish_only(args.requests, args.clients)
+            if _status_writes:
+                await asyncio.wait(set(_status_writes))
+            # Everything acknowledged must have been published as a valid envelope, with a queued status row.
+            bodies = [body for channel in publisher._channels for body in channel.channel.bodies]
+            request_ids = [decode_envelope(body).request_id for body in bodies]
+            assert len(app.state.status_store.get_statuses(request_ids)) == len(bodies)
+            stats = publisher.stats()
+            row["published"] = len(bodies)
+            row["msgs_per_confirm"] = stats["confirmed"] / max(1, stats["confirm_frames"])
+            rows.append({"mode": mode, **row})
+    finally:
+        smtp.stop()
+    return rows
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(
+        f"{'mode':>15} {'requests':>8} {'req/s':>8} {'p50':>10} {'p99':>10} {'publish/s':>9} {'msgs/confirm':>12}  statuses"
+    )
+    for row in rows:
+        publish = f"{row['publish_per_sec']:.1f}" if "publish_per_sec" in row else "-"
+        per_confirm = f"{row['msgs_per_confirm']:.1f}" if "msgs_per_confirm" in row else "-"
+        print(
+            f"{row['mode']:>15} {row['requests']:>8} {row['requests_per_sec']:>8.1f} {row['p50_ms']:>8.1f}ms "
+            f"{row['p99_ms']:>8.1f}ms {publish:>9} {per_confirm:>12}  {row['statuses']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
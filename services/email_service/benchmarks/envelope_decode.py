@@ -0,0 +1,122 @@
+"""Envelope decode benchmark: typed decode + compiled schema vs json.loads + .get().
+
+The baseline is what the consumer used to do (parse into dicts, then chain
+``.get()`` lookups with no validation); the candidate is
+``decode_envelope``, which parses once, validates against
+shared/schemas/message-envelope.json and builds the slotted Envelope.
+
+    cd services/email_service
+    python -m benchmarks.envelope_decode --sizes 1,16,256
+"""
+import argparse
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from app.models import envelope as envelope_module
+from app.models.envelope import decode_envelope
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,16,256", help="comma-separated envelope sizes in KB")
+    parser.add_argument("--iterations", type=int, default=0, help="decodes per size; 0 picks one by size")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+def build_envelope(size_kb: float) -> bytes:
+    envelope: Dict[str, Any] = {
+        "request_id": str(uuid.uuid4()),
+        "correlation_id": "bench-correlation",
+        "created_at": "2025-01-01T00:00:00.123456789Z",
+        "channel": "email",
+        "user": {"id": str(uuid.uuid4()), "email": "user@example.com", "locale": "en", "push_tokens": None},
+        "template": {"slug": "bench_digest", "locale": "en", "version": 3},
+        "variables": {"name": "Ada", "period": "this week"},
+        "provider_overrides": {},
+        "retry_count": 0,
+    }
+    # Grow the payload the way real ones grow: many variables / long lists.
+    index = 0
+    while len(json.dumps(envelope)) < size_kb * 1024:
+        envelope["variables"][f"item_{index}"] = {"title": f"Item {index}", "url": f"https://example.com/{index}"}
+        index += 1
+    return json.dumps(envelope).encode()
+
+
+def baseline(body: bytes) -> Any:
+    envelope = json.loads(body)
+    user = envelope.get("user") or {}
+    template_info = envelope.get("template") or {}
+    return (
+        envelope.get("request_id"),
+        user.get("email"),
+        user.get("locale") or template_info.get("locale"),
+        template_info.get("slug"),
+        template_info.get("version"),
+        envelope.get("variables") or {},
+        envelope.get("retry_count") or 0,
+    )
+
+
+def typed(body: bytes) -> Any:
+    envelope = decode_envelope(body)
+    return (
+        envelope.request_id,
+        envelope.user.email,
+        envelope.user.locale or envelope.template.locale,
+        envelope.template.slug,
+        envelope.template.version,
+        envelope.variables,
+        envelope.retry_count,
+    )
+
+
+def measure(decode: Callable[[bytes], Any], body: bytes, iterations: int) -> float:
+    for _ in range(min(iterations, 100)):
+        decode(body)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        decode(body)
+    return (time.perf_counter() - started) / iterations
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    if envelope_module._validator is None:
+        raise SystemExit("message-envelope.json not found; set ENVELOPE_SCHEMA_DIR")
+    rows = []
+    for size in [float(value) for value in args.sizes.split(",") if value.strip()]:
+        body = build_envelope(size)
+        iterations = args.iterations or max(200, int(20000 / max(size, 1)))
+        base = measure(baseline, body, iterations)
+        candidate = measure(typed, body, iterations)
+        rows.append(
+            {
+                "size_kb": round(len(body) / 1024, 1),
+                "iterations": iterations,
+                "baseline_us": base * 1e6,
+                "typed_us": candidate * 1e6,
+                "overhead_pct": (candidate / base - 1) * 100 if base else 0.0,
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    args = parse_args()
+    rows = run(args)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'size':>9} {'json.loads+.get':>16} {'typed+schema':>13} {'overhead':>9}")
+    for row in rows:
+        print(
+            f"{row['size_kb']:>7.1f}KB {row['baseline_us']:>14.1f}us {row['typed_us']:>11.1f}us "
+            f"{row['overhead_pct']:>8.1f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Priority lane benchmark: transactional latency behind a bulk backlog.
+
+Publishes ``--bulk`` bulk envelopes up front, then trickles ``--transactional``
+envelopes in at ``--rate`` per second while the backlog drains, and reports
+per-lane latency (publish to ack). The ``single`` run publishes both streams
+to one queue, as with a single ``email_queue``; the ``lanes`` run gives them
+separate queues and lanes with the configured weight and latency budget.
+
+    cd services/email_service
+    python -m benchmarks.lane_latency --bulk 3000 --transactional 100 --rate 20
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List
+
+from app.config.settings import settings
+from benchmarks.consumer_throughput import build_envelope, configure
+from benchmarks.standins import FakeSMTPServer, FakeTemplateService, InMemoryChannel, InMemoryStatusStore, percentile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bulk", type=int, default=3000, help="bulk envelopes published up front")
+    parser.add_argument("--transactional", type=int, default=100, help="transactional envelopes published during the backlog")
+    parser.add_argument("--rate", type=float, default=20.0, help="transactional publish rate in msgs/sec")
+    parser.add_argument("--weight", type=float, default=8.0, help="transactional weight (bulk is 1)")
+    parser.add_argument("--budget", type=float, default=0.5, help="transactional latency budget in seconds; 0 disables")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--prefetch", type=int, default=64)
+    parser.add_argument("--smtp-latency-ms", type=float, default=20.0)
+    parser.add_argument("--smtp-pool-size", type=int, default=settings.smtp_pool_size)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+def summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000.0,
+        "p99_ms": percentile(latencies, 99) * 1000.0,
+        "max_ms": max(latencies) * 1000.0 if latencies else 0.0,
+    }
+
+
+async def run_once(layout: str, args: argparse.Namespace, smtp_port: int, template_url: str) -> Dict[str, Any]:
+    from app.consumers.async_consumer import AsyncEmailConsumer
+
+    # configure() reads the generic throughput flags; fill in the ones this benchmark does not expose.
+    args.mode, args.domain_rate = "async", 0.0
+    configure(smtp_port, template_url, args)
+    if layout == "lanes":
+        settings.email_lanes = "transactional=bench.transactional,bulk=bench.bulk"
+        settings.email_lane_weights = f"transactional={args.weight},bulk=1"
+        settings.email_lane_budgets = f"transactional={args.budget}"
+    else:
+        settings.email_lanes = ""
+
+    loop = asyncio.get_running_loop()
+    consumer = AsyncEmailConsumer(status_store=InMemoryStatusStore())
+    consumer.loop = loop
+    consumer._slots = asyncio.Semaphore(consumer.max_in_flight)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=consumer.max_in_flight))
+    channels = {}
+    for lane in consumer.lanes:
+        channels[lane.name] = InMemoryChannel(lane.prefetch, partial(consumer._on_message, lane=lane), queue=lane.queue)
+    # With one lane both streams share its queue, and the transactional mail waits behind the backlog.
+    transactional = channels.get("transactional") or channels[consumer.default_lane.name]
+    bulk = channels.get("bulk") or channels[consumer.default_lane.name]
+    consumer.channel = bulk
+    await consumer.enable_confirms(bulk)
+
+    started = time.perf_counter()
+    for index in range(args.bulk):
+        bulk.publish(build_envelope(index, 5), label="bulk")
+    for index in range(args.transactional):
+        await asyncio.sleep(1.0 / args.rate)
+        transactional.publish(build_envelope(args.bulk + index, 5), label="transactional")
+    for channel in channels.values():
+        await channel.wait_settled()
+    elapsed = time.perf_counter() - started
+    consumer._pump_task.cancel()
+    await consumer.email_sender.close()
+
+    latencies: Dict[str, List[float]] = {}
+    for channel in channels.values():
+        for label, values in channel.labelled.items():
+            latencies.setdefault(label, []).extend(values)
+    return {
+        "layout": layout,
+        "elapsed_seconds": elapsed,
+        "transactional": summary(latencies.get("transactional", [])),
+        "bulk": summary(latencies.get("bulk", [])),
+        "scheduler": consumer.scheduler.stats(),
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    smtp = FakeSMTPServer(latency=args.smtp_latency_ms / 1000.0)
+    smtp_port = smtp.start()
+    templates = FakeTemplateService()
+    template_url = templates.start()
+    try:
+        return [await run_once(layout, args, smtp_port, template_url) for layout in ("single", "lanes")]
+    finally:
+        smtp.stop()
+        templates.stop()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'layout':>8} {'lane':>14} {'count':>6} {'p50':>10} {'p99':>10} {'max':>10}")
+    for row in rows:
+        for lane in ("transactional", "bulk"):
+            values = row[lane]
+            print(
+                f"{row['layout']:>8} {lane:>14} {values['count']:>6} {values['p50_ms']:>8.1f}ms "
+                f"{values['p99_ms']:>8.1f}ms {values['max_ms']:>8.1f}ms"
+            )
+        print(f"{'':>8} {'total':>14} {row['elapsed_seconds']:>6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Relay degradation benchmark: fixed SMTP concurrency vs adaptive limit and circuit breaker.
+
+Publishes ``--messages`` envelopes at ``--rate`` per second to a fake relay
+that only works on ``--relay-capacity`` messages at once (the rest queue, so
+latency grows with concurrency). From ``--outage-start`` to
+``--outage-end`` seconds into the run the relay answers every message with
+a 451. For each setup it reports how many deliveries failed into the retry
+queues, end-to-end latency, how long the relay took per message (its own
+queueing included), the lowest SMTP limit seen and how often the circuit
+opened.
+
+    cd services/email_service
+    python -m benchmarks.relay_degradation --messages 3000 --rate 150
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from app.config.settings import settings
+from benchmarks.consumer_throughput import build_envelope, configure
+from benchmarks.standins import FakeSMTPServer, FakeTemplateService, InMemoryChannel, InMemoryStatusStore, percentile
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--rate", type=float, default=150.0, help="publish rate in msgs/sec")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--prefetch", type=int, default=64)
+    parser.add_argument("--smtp-latency-ms", type=float, default=20.0, help="relay time per message")
+    parser.add_argument("--relay-capacity", type=int, default=4, help="messages the relay works on at once")
+    parser.add_argument("--smtp-pool-size", type=int, default=settings.smtp_pool_size)
+    parser.add_argument("--outage-start", type=float, default=5.0, help="seconds into the run; negative disables")
+    parser.add_argument("--outage-end", type=float, default=10.0)
+    parser.add_argument("--breaker-open-seconds", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+async def outage(smtp: FakeSMTPServer, start: float, end: float) -> None:
+    if start < 0:
+        return
+    await asyncio.sleep(start)
+    smtp.error_rate = 1.0
+    await asyncio.sleep(max(0.0, end - start))
+    smtp.error_rate = 0.0
+
+
+async def watch_limit(consumer: Any, seen: List[int]) -> None:
+    pool = consumer.email_sender.smtp_pool
+    while True:
+        seen.append(pool.stats()["limit"])
+        await asyncio.sleep(0.1)
+
+
+async def run_once(setup: str, args: argparse.Namespace, template_url: str) -> Dict[str, Any]:
+    from app.consumers.async_consumer import AsyncEmailConsumer
+
+    smtp = FakeSMTPServer(latency=args.smtp_latency_ms / 1000.0, capacity=args.relay_capacity)
+    smtp_port = smtp.start()
+    # configure() reads the generic throughput flags; fill in the ones this benchmark does not expose.
+    args.mode, args.domain_rate = "async", 0.0
+    configure(smtp_port, template_url, args)
+    settings.email_lanes = ""
+    settings.smtp_adaptive_concurrency = setup == "adaptive"
+    settings.smtp_breaker_enabled = setup == "adaptive"
+    settings.smtp_breaker_open_seconds = args.breaker_open_seconds
+
+    loop = asyncio.get_running_loop()
+    consumer = AsyncEmailConsumer(status_store=InMemoryStatusStore())
+    consumer.loop = loop
+    consumer._slots = asyncio.Semaphore(consumer.max_in_flight)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=consumer.max_in_flight))
+    channel = InMemoryChannel(consumer.prefetch, consumer._on_message)
+    consumer.channel = channel
+    await consumer.enable_confirms(channel)
+
+    limits: List[int] = []
+    watchers = [
+        loop.create_task(outage(smtp, args.outage_start, args.outage_end)),
+        loop.create_task(watch_limit(consumer, limits)),
+    ]
+    started = time.perf_counter()
+    for index in range(args.messages):
+        channel.publish(build_envelope(index, 5))
+        await asyncio.sleep(1.0 / args.rate)
+    await channel.wait_settled()
+    elapsed = time.perf_counter() - started
+    for task in watchers + [consumer._pump_task]:
+        task.cancel()
+    await consumer.email_sender.close()
+    smtp.stop()
+
+    transactions = smtp.messages + smtp.rejected
+    breaker = consumer.email_sender.breaker
+    return {
+        "setup": setup,
+        "elapsed_seconds": elapsed,
+        "delivered": smtp.messages,
+        "rejected_by_relay": smtp.rejected,
+        "retried": sum(channel.published.values()),
+        "p50_ms": percentile(channel.latencies, 50) * 1000.0,
+        "p99_ms": percentile(channel.latencies, 99) * 1000.0,
+        "relay_ms_per_message": smtp.message_seconds / transactions * 1000.0 if transactions else 0.0,
+        "min_limit": min(limits) if limits else 0,
+        "circuit_trips": breaker.stats()["trips"] if breaker is not None else 0,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    templates = FakeTemplateService()
+    template_url = templates.start()
+    try:
+        return [await run_once(setup, args, template_url) for setup in ("fixed", "adaptive")]
+    finally:
+        templates.stop()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(
+        f"{'setup':>9} {'delivered':>9} {'relay 451':>9} {'retried':>8} {'p50':>9} {'p99':>10} "
+        f"{'relay time':>10} {'min limit':>9} {'trips':>5}"
+    )
+    for row in rows:
+        print(
+            f"{row['setup']:>9} {row['delivered']:>9} {row['rejected_by_relay']:>9} {row['retried']:>8} "
+            f"{row['p50_ms']:>7.1f}ms {row['p99_ms']:>8.1f}ms {row['relay_ms_per_message']:>8.1f}ms "
+            f"{row['min_limit']:>9} {row['circuit_trips']:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Render offload benchmark: event-loop stalls with in-process vs process-pool rendering.
+
+Runs the async consumer over ``--messages`` envelopes whose template is a
+order-summary table of ``--rows`` rows (a loop-heavy template, about
+7ms per render at the default size). A probe task on the consumer's loop wakes every
+``--probe-ms``; how late it wakes up is the time the loop was blocked.
+``inline`` renders on the loop as today; ``offload`` uses a RenderPool with
+``--workers`` processes (the template qualifies by its measured cost after
+the first render).
+
+    cd services/email_service
+    python -m benchmarks.render_offload --messages 1000 --rows 400 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from app.config.settings import settings
+from app.services.render_pool import RenderPool
+from benchmarks.consumer_throughput import build_envelope, configure
+from benchmarks.standins import FakeSMTPServer, FakeTemplateService, InMemoryChannel, InMemoryStatusStore, percentile
+
+DIGEST = """<table>
+{%- for row in range(ROWS) %}
+{%- set qty = (row * 7) % 13 + 1 %}{%- set price = ((row * 37) % 1000) / 100 %}
+<tr><td>{{ "%05d"|format(row) }}</td><td>{{ name|title }} / {{ period|upper|truncate(12) }}</td><td>{{ qty }}</td>
+<td>{{ "%.2f"|format(price) }}</td><td>{{ "%.2f"|format(qty * price) }}</td>
+<td>{{ ["new", "shipped", "returned"][row % 3]|capitalize }}</td></tr>
+{%- endfor %}
+</table>
+"""
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rows", type=int, default=400, help="digest rows rendered per message")
+    parser.add_argument("--workers", type=int, default=4, help="render processes for the offload run")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--prefetch", type=int, default=64)
+    parser.add_argument("--smtp-latency-ms", type=float, default=20.0)
+    parser.add_argument("--smtp-pool-size", type=int, default=settings.smtp_pool_size)
+    parser.add_argument("--probe-ms", type=float, default=5.0, help="probe interval on the event loop")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+async def probe(interval: float, lags: List[float]) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def run_once(mode: str, args: argparse.Namespace, smtp_port: int, template_url: str) -> Dict[str, Any]:
+    from app.consumers.async_consumer import AsyncEmailConsumer
+
+    # configure() reads the generic throughput flags; fill in the ones this benchmark does not expose.
+    args.mode, args.domain_rate = "async", 0.0
+    configure(smtp_port, template_url, args)
+    settings.email_lanes = ""
+
+    loop = asyncio.get_running_loop()
+    consumer = AsyncEmailConsumer(status_store=InMemoryStatusStore())
+    pool = None
+    if mode == "offload":
+        pool = consumer.render_pool = RenderPool(args.workers, timeout=30.0)
+        # Spawn and warm the workers outside the measurement.
+        await asyncio.gather(*(pool.render("consumer", "{{ x }}", {"x": 1}, "warmup") for _ in range(args.workers)))
+    consumer.loop = loop
+    consumer._slots = asyncio.Semaphore(consumer.max_in_flight)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=consumer.max_in_flight))
+    channel = InMemoryChannel(consumer.prefetch, consumer._on_message)
+    consumer.channel = channel
+    await consumer.enable_confirms(channel)
+
+    lags: List[float] = []
+    prober = loop.create_task(probe(args.probe_ms / 1000.0, lags))
+    started = time.perf_counter()
+    for index in range(args.messages):
+        channel.publish(build_envelope(index, 0))
+    await channel.wait_settled()
+    elapsed = time.perf_counter() - started
+    prober.cancel()
+    consumer._pump_task.cancel()
+    await consumer.email_sender.close()
+    if pool is not None:
+        pool.close()
+
+    return {
+        "mode": mode,
+        "msgs_per_sec": args.messages / elapsed,
+        "p50_ms": percentile(channel.latencies, 50) * 1000.0,
+        "p99_ms": percentile(channel.latencies, 99) * 1000.0,
+        "stall_p99_ms": percentile(lags, 99) * 1000.0,
+        "stall_max_ms": max(lags) * 1000.0 if lags else 0.0,
+        "stalled_seconds": sum(lags),
+        "offloaded": pool.stats()["offloaded"] if pool is not None else 0,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    smtp = FakeSMTPServer(latency=args.smtp_latency_ms / 1000.0)
+    smtp_port = smtp.start()
+    templates = FakeTemplateService(body=DIGEST.replace("ROWS", str(args.rows)))
+    template_url = templates.start()
+    try:
+        return [await run_once(mode, args, smtp_port, template_url) for mode in ("inline", "offload")]
+    finally:
+        smtp.stop()
+        templates.stop()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.WARNING)
+    args = parse_args()
+    rows = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'mode':>8} {'msgs/s':>8} {'p50':>10} {'p99':>10} {'stall p99':>10} {'stall max':>10} {'stalled':>8}")
+    for row in rows:
+        print(
+            f"{row['mode']:>8} {row['msgs_per_sec']:>8.1f} {row['p50_ms']:>8.1f}ms {row['p99_ms']:>8.1f}ms "
+            f"{row['stall_p99_ms']:>8.1f}ms {row['stall_max_ms']:>8.1f}ms {row['stalled_seconds']:>7.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
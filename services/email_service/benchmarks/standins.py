@@ -0,0 +1,449 @@
+"""In-process stand-ins for the email service's dependencies.
+
+Everything here runs locally so the real EmailConsumer / EmailSender code
+paths can be benchmarked on a laptop without SMTP, RabbitMQ, Postgres or the
+template service.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class FakeSMTPServer:
+    """Minimal ESMTP server with configurable per-message latency and errors.
+
+    Accepts any AUTH, answers ``error_rate`` of the messages with a 451 and
+    drops ``drop_rate`` of the sessions right after a message, which is what
+    relays do when they enforce per-session limits. With ``capacity`` only
+    that many messages are processed at once and the rest queue, so latency
+    grows with client concurrency like on a saturated relay. ``latency`` and
+    ``error_rate`` may be changed while it runs.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: int = 7,
+        capacity: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.capacity = capacity
+        self.port = 0
+        self.sessions = 0
+        self.messages = 0
+        self.recipients = 0
+        self.rejected = 0
+        self.message_seconds = 0.0
+        self._random = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._sessions: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._busy: Optional[asyncio.Semaphore] = None
+
+    def start(self, host: str = "127.0.0.1") -> int:
+        """Serve from a dedicated thread and event loop, like a separate relay would."""
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def serve() -> None:
+            if self.capacity:
+                self._busy = asyncio.Semaphore(self.capacity)
+            self._server = await asyncio.start_server(self._handle, host, 0)
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+
+        def run() -> None:
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-smtp", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.port
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    async def _shutdown(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+        # Close sessions the client left open so their handlers finish cleanly.
+        for writer in self._sessions.values():
+            writer.close()
+        if self._sessions:
+            await asyncio.gather(*self._sessions, return_exceptions=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.sessions += 1
+        task = asyncio.current_task()
+        self._sessions[task] = writer
+        writer.write(b"220 fake-smtp ESMTP ready\r\n")
+        in_data = False
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if in_data:
+                    if line != b".\r\n":
+                        continue
+                    in_data = False
+                    received = time.perf_counter()
+                    if self._busy is not None:
+                        async with self._busy:
+                            await asyncio.sleep(self.latency)
+                    elif self.latency:
+                        await asyncio.sleep(self.latency)
+                    self.message_seconds += time.perf_counter() - received
+                    if self._random.random() < self.error_rate:
+                        self.rejected += 1
+                        writer.write(b"451 4.3.0 temporary failure\r\n")
+                    else:
+                        self.messages += 1
+                        writer.write(b"250 2.0.0 queued\r\n")
+                    await writer.drain()
+                    if self._random.random() < self.drop_rate:
+                        break
+                    continue
+
+                command = line[:4].upper()
+                if command in (b"EHLO", b"HELO"):
+                    writer.write(b"250-fake-smtp\r\n250-PIPELINING\r\n250 AUTH PLAIN LOGIN\r\n")
+                elif command == b"AUTH":
+                    writer.write(b"235 2.7.0 authenticated\r\n")
+                elif command == b"RCPT":
+                    self.recipients += 1
+                    writer.write(b"250 2.1.5 ok\r\n")
+                elif command == b"DATA":
+                    writer.write(b"354 end data with <CR><LF>.<CR><LF>\r\n")
+                    in_data = True
+                elif command == b"QUIT":
+                    writer.write(b"221 2.0.0 bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"250 2.0.0 ok\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._sessions.pop(task, None)
+            writer.close()
+
+
+class FakeTemplateService:
+    """Threaded HTTP server answering ``GET /api/v1/templates/<slug>/active``.
+
+    Serves ``body`` as the template body when given, else ``body_size`` bytes of simple paragraphs.
+    """
+
+    def __init__(self, body_size: int = 2048, latency: float = 0.0, body: Optional[str] = None) -> None:
+        self.latency = latency
+        self.requests = 0
+        if body is None:
+            paragraph = "<p>Hello {{ name }}, here is your update for {{ period }}.</p>\n"
+            body = paragraph * max(1, body_size // len(paragraph))
+        self.payload = json.dumps(
+            {
+                "success": True,
+                "data": {"id": "bench-v1", "subject": "Update for {{ name }}", "body": body},
+            }
+        ).encode()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.url = ""
+
+    def start(self) -> str:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:  # noqa: N802 - http.server API
+                service.requests += 1
+                if service.latency:
+                    time.sleep(service.latency)
+                if "missing" in self.path:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(service.payload)))
+                self.end_headers()
+                self.wfile.write(service.payload)
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/api"
+        return self.url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class InMemoryStatusStore:
+    """Drop-in for StatusStore that keeps statuses in a dict."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.statuses: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def update_status(
+        self,
+        request_id: str,
+        status: str,
+        provider: str,
+        detail: Optional[str] = None,
+        created_at: Optional[str] = None,
+    ) -> None:
+        if not request_id:
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.statuses[request_id] = (status, detail)
+            self.writes += 1
+
+    def update_statuses(
+        self, updates: List[Tuple[str, str, str, Optional[str]]], created_at: Optional[str] = None
+    ) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            for request_id, status, provider, detail in updates:
+                self.statuses[request_id] = (status, detail)
+            self.writes += len(updates)
+
+    def add_statuses(
+        self, updates: List[Tuple[str, str, str, Optional[str]]], created_at: Optional[str] = None
+    ) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            for request_id, status, provider, detail in updates:
+                if request_id not in self.statuses:
+                    self.statuses[request_id] = (status, detail)
+                    self.writes += 1
+
+    def get_statuses(self, request_ids: List[str]) -> Dict[str, str]:
+        with self._lock:
+            return {rid: self.statuses[rid][0] for rid in request_ids if rid in self.statuses}
+
+    def get_status(self, request_id: str) -> Optional[str]:
+        with self._lock:
+            entry = self.statuses.get(request_id)
+        return entry[0] if entry else None
+
+    def ping(self) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"write_behind": False, "queue_depth": 0, "rows_flushed": self.writes}
+
+
+class _Method:
+    __slots__ = ("delivery_tag", "routing_key", "redelivered")
+
+    def __init__(self, delivery_tag: int, routing_key: str) -> None:
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+        self.redelivered = False
+
+
+class _Properties:
+    __slots__ = ("headers", "timestamp", "priority")
+
+    def __init__(self, headers: Optional[Dict[str, Any]] = None) -> None:
+        self.headers = headers or {}
+        self.timestamp = int(time.time())
+        self.priority = None
+
+
+class InMemoryChannel:
+    """Broker shim that honours prefetch and records settle latency.
+
+    ``publish`` enqueues a body; deliveries are pushed to ``on_message``
+    (pika's callback signature) while fewer than ``prefetch`` are unacked.
+    Latencies are also kept per ``label`` given to ``publish``.
+    """
+
+    def __init__(self, prefetch: int, on_message: Callable[..., None], queue: str = "email_queue") -> None:
+        self.prefetch = prefetch
+        self.on_message = on_message
+        self.queue = queue
+        self.is_closed = False
+        self.is_closing = False
+        self.is_open = True
+        self.consumer_tags: List[str] = []
+        self.acked = 0
+        self.nacked = 0
+        self.published: Dict[str, int] = {}
+        self.latencies: List[float] = []
+        self.labelled: Dict[str, List[float]] = {}
+        self._pending: Deque[Tuple[bytes, float, Dict[str, Any], str]] = deque()
+        self._unacked: Dict[int, Tuple[float, str]] = {}
+        self._next_tag = 1
+        self._settled = asyncio.Event()
+        self._expected = 0
+        self._pumping = False
+        self._on_confirm: Optional[Callable[[Any], None]] = None
+        self._publish_tag = 0
+
+    def publish(self, body: bytes, headers: Optional[Dict[str, Any]] = None, label: str = "") -> None:
+        self._pending.append((body, time.perf_counter(), headers or {}, label))
+        self._expected += 1
+        self._pump()
+
+    def basic_publish(
+        self, exchange: str, routing_key: str, body: bytes, properties: Any = None, mandatory: bool = False
+    ) -> None:
+        # Retries land in delay queues that the benchmark never drains; just count and confirm them.
+        self.published[routing_key] = self.published.get(routing_key, 0) + 1
+        self._publish_tag += 1
+        if self._on_confirm is not None:
+            from pika.spec import Basic
+
+            frame = _ConfirmFrame(Basic.Ack(delivery_tag=self._publish_tag, multiple=False))
+            asyncio.get_running_loop().call_soon(self._on_confirm, frame)
+
+    def confirm_delivery(self, ack_nack_callback: Callable[[Any], None], callback: Optional[Callable] = None) -> None:
+        self._on_confirm = ack_nack_callback
+        if callback is not None:
+            callback(None)
+
+    def add_on_return_callback(self, callback: Callable[..., None]) -> None:
+        pass
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self.acked += 1
+        self._settle(delivery_tag)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True) -> None:
+        self.nacked += 1
+        self._settle(delivery_tag)
+
+    async def wait_settled(self) -> None:
+        while self.acked + self.nacked < self._expected:
+            self._settled.clear()
+            await self._settled.wait()
+
+    def _settle(self, delivery_tag: int) -> None:
+        unacked = self._unacked.pop(delivery_tag, None)
+        if unacked is not None:
+            published_at, label = unacked
+            latency = time.perf_counter() - published_at
+            self.latencies.append(latency)
+            self.labelled.setdefault(label, []).append(latency)
+        self._settled.set()
+        self._pump()
+
+    def _pump(self) -> None:
+        # Synchronous consumers settle from inside on_message; don't recurse.
+        if self._pumping:
+            return
+        self._pumping = True
+        try:
+            while self._pending and len(self._unacked) < self.prefetch:
+                body, published_at, headers, label = self._pending.popleft()
+                tag = self._next_tag
+                self._next_tag += 1
+                self._unacked[tag] = (published_at, label)
+                self.on_message(self, _Method(tag, self.queue), _Properties(headers), body)
+        finally:
+            self._pumping = False
+
+
+class _ConfirmFrame:
+    __slots__ = ("method",)
+
+    def __init__(self, method: Any) -> None:
+        self.method = method
+
+
+class FakeConfirmChannel:
+    """Publisher-side broker shim in confirm mode.
+
+    Like a broker that syncs persistent messages to disk in batches, it
+    confirms everything published since the last sync with one ``multiple``
+    ack every ``sync_interval`` (to pika's ``ack_nack_callback``). A
+    publisher that waits for each confirm before publishing again gets one
+    message per sync.
+    """
+
+    def __init__(self, sync_interval: float = 0.002, channel_number: int = 1) -> None:
+        self.sync_interval = sync_interval
+        self.channel_number = channel_number
+        self.is_open = True
+        self.is_closed = False
+        self.published = 0
+        self.syncs = 0
+        self.bodies: List[bytes] = []
+        self._on_confirm: Optional[Callable[[Any], None]] = None
+        self._sync_scheduled = False
+
+    def confirm_delivery(self, ack_nack_callback: Callable[[Any], None], callback: Optional[Callable] = None) -> None:
+        self._on_confirm = ack_nack_callback
+        if callback is not None:
+            callback(None)
+
+    def add_on_return_callback(self, callback: Callable[..., None]) -> None:
+        pass
+
+    def add_on_close_callback(self, callback: Callable[..., None]) -> None:
+        pass
+
+    def basic_publish(
+        self, exchange: str, routing_key: str, body: bytes, properties: Any = None, mandatory: bool = False
+    ) -> None:
+        self.published += 1
+        self.bodies.append(body)
+        if not self._sync_scheduled:
+            self._sync_scheduled = True
+            asyncio.get_running_loop().call_later(self.sync_interval, self._sync)
+
+    def _sync(self) -> None:
+        from pika.spec import Basic
+
+        self._sync_scheduled = False
+        self.syncs += 1
+        self._on_confirm(_ConfirmFrame(Basic.Ack(delivery_tag=self.published, multiple=True)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
@@ -0,0 +1,196 @@
+"""Status upsert benchmark: plain vs time-partitioned notification_statuses.
+
+Fills a scratch table per layout with ``--rows`` statuses whose
+``created_at`` is spread over ``--days`` days, then times
+``StatusStore._write_batch`` (the write-behind flush) on batches that mix
+updates of existing rows with inserts of new ones. Needs a real Postgres
+(12+) in ``STATUS_DATABASE_URL``; the scratch tables are dropped afterwards
+unless ``--keep`` is given.
+
+    cd services/email_service
+    python -m benchmarks.status_upsert --rows 20000000 --days 90
+    python -m benchmarks.status_upsert --rows 20000000 --migrate --json
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import psycopg2
+from psycopg2 import sql
+
+from app.config.settings import settings
+from app.services.status_store import PendingStatus, StatusStore
+
+FILL_CHUNK = 1_000_000
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20_000_000, help="rows to preload per layout")
+    parser.add_argument("--days", type=int, default=90, help="spread created_at over this many days")
+    parser.add_argument("--interval", default="day", help="partition interval for the partitioned layout")
+    parser.add_argument("--batches", type=int, default=500, help="timed upsert batches per layout")
+    parser.add_argument("--batch-size", type=int, default=200, help="rows per upsert batch")
+    parser.add_argument("--update-ratio", type=float, default=0.7, help="share of each batch that hits existing rows")
+    parser.add_argument("--layouts", default="plain,partitioned", help="comma-separated: plain, partitioned")
+    parser.add_argument("--migrate", action="store_true", help="also time migrating the filled plain table")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch tables")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+class Dataset:
+    """Deterministic ids and creation times, so timed updates hit rows the fill created."""
+
+    def __init__(self, rows: int, days: int) -> None:
+        self.rows = rows
+        self.end = datetime.now(timezone.utc).replace(microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.step_us = max(1, int(days * 86400 * 1_000_000 // max(rows, 1)))
+
+    def created_at(self, index: int) -> datetime:
+        return self.start + timedelta(microseconds=index * self.step_us)
+
+
+def open_store(table: str, interval: str) -> StatusStore:
+    settings.status_table = table
+    settings.status_partition_interval = interval
+    settings.status_write_mode = "direct"
+    settings.status_retention_days = 0
+    return StatusStore()
+
+
+def drop_tables(*tables: str) -> None:
+    conn = psycopg2.connect(settings.status_database_url)
+    try:
+        with conn, conn.cursor() as cur:
+            for table in tables:
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {table} CASCADE").format(table=sql.Identifier(table)))
+    finally:
+        conn.close()
+
+
+def fill(store: StatusStore, data: Dataset) -> float:
+    query = sql.SQL(
+        """
+        INSERT INTO {table} (request_id, status, provider, detail, updated_at{created_column})
+        SELECT 'bench-' || g, 'delivered', 'smtp', NULL, ts{created_value}
+        FROM (
+            SELECT g, %s::timestamptz + (g * %s) * interval '1 microsecond' AS ts
+            FROM generate_series(%s, %s) AS g
+        ) AS series
+        """
+    ).format(
+        table=sql.Identifier(store.table),
+        created_column=sql.SQL(", created_at" if store.partitioned else ""),
+        created_value=sql.SQL(", ts" if store.partitioned else ""),
+    )
+    started = time.perf_counter()
+    for low in range(0, data.rows, FILL_CHUNK):
+        high = min(low + FILL_CHUNK, data.rows) - 1
+        with store._get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (data.start, data.step_us, low, high))
+        print(f"  {store.table}: {high + 1:,}/{data.rows:,} rows", flush=True)
+    with store._get_connection() as conn:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("VACUUM ANALYZE {table}").format(table=sql.Identifier(store.table)))
+        conn.autocommit = False
+    return time.perf_counter() - started
+
+
+def table_bytes(store: StatusStore) -> int:
+    with store._get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) FROM pg_partition_tree(%s::regclass)",
+                (store.table,),
+            )
+            return int(cur.fetchone()[0])
+
+
+def measure(store: StatusStore, data: Dataset, args: argparse.Namespace, rng: random.Random) -> List[float]:
+    latencies = []
+    fresh = 0
+    for _ in range(args.batches):
+        now = datetime.now(timezone.utc)
+        batch: Dict[str, PendingStatus] = {}
+        while len(batch) < args.batch_size:
+            if rng.random() < args.update_ratio:
+                index = rng.randrange(data.rows)
+                batch[f"bench-{index}"] = ("failed", "smtp", "bench update", now, data.created_at(index))
+            else:
+                fresh += 1
+                batch[f"bench-new-{fresh}"] = ("delivered", "smtp", None, now, now)
+        started = time.perf_counter()
+        store._write_batch(batch)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def summarize(layout: str, latencies: List[float], batch_size: int) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    return {
+        "layout": layout,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "rows_per_sec": batch_size * len(ordered) / sum(ordered),
+    }
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    data = Dataset(args.rows, args.days)
+    rng = random.Random(7)
+    rows = []
+    for layout in [value.strip() for value in args.layouts.split(",") if value.strip()]:
+        table = f"bench_statuses_{layout}"
+        interval = args.interval if layout == "partitioned" else ""
+        drop_tables(table, f"{table}_legacy")
+        store = open_store(table, interval)
+        if store.partitioned:
+            store.maintain_partitions(since=data.start)
+        try:
+            fill_seconds = fill(store, data)
+            row = summarize(layout, measure(store, data, args, rng), args.batch_size)
+            row.update(rows_loaded=args.rows, fill_seconds=fill_seconds, table_mb=table_bytes(store) / 2**20)
+            row["partitions"] = store.stats()["partitions"]
+            rows.append(row)
+        finally:
+            store.close()
+
+        if args.migrate and layout == "plain":
+            settings.status_partition_interval = args.interval
+            started = time.perf_counter()
+            migrated = StatusStore()
+            rows[-1]["migrate_seconds"] = time.perf_counter() - started
+            migrated.close()
+
+        if not args.keep:
+            drop_tables(table, f"{table}_legacy")
+    return rows
+
+
+def main() -> None:
+    args = parse_args()
+    rows = run(args)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'layout':>12} {'rows':>12} {'p50':>9} {'p99':>9} {'mean':>9} {'rows/s':>9} {'size':>9} {'parts':>6}")
+    for row in rows:
+        print(
+            f"{row['layout']:>12} {row['rows_loaded']:>12,} {row['p50_ms']:>7.2f}ms {row['p99_ms']:>7.2f}ms "
+            f"{row['mean_ms']:>7.2f}ms {row['rows_per_sec']:>9.0f} {row['table_mb']:>7.0f}MB {row['partitions']:>6}"
+        )
+        if "migrate_seconds" in row:
+            print(f"{'':>12} migration to {row['layout']} -> partitioned took {row['migrate_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import pytest
+
+from app.config.settings import settings
+from app.email_sender import EmailSender
+from app.services import concurrency
+from app.services.concurrency import CLOSED, HALF_OPEN, OPEN, AdaptiveLimit, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(concurrency.time, "monotonic", clock)
+    return clock
+
+
+def test_limit_starts_at_the_minimum(clock: FakeClock) -> None:
+    assert AdaptiveLimit(16, min_limit=2).value == 2
+
+
+def test_limit_grows_while_latency_holds_and_slots_are_used(clock: FakeClock) -> None:
+    limit = AdaptiveLimit(16, smoothing=1.0)
+    values = []
+    for _ in range(5):
+        limit.observe(0.01, ok=True, in_flight=limit.value)
+        values.append(limit.value)
+
+    assert values == sorted(values)
+    assert values[-1] > 4
+
+
+def test_limit_does_not_grow_when_mostly_idle(clock: FakeClock) -> None:
+    limit = AdaptiveLimit(16, min_limit=4, smoothing=1.0)
+    for _ in range(10):
+        limit.observe(0.01, ok=True, in_flight=1)
+    assert limit.value == 4
+
+
+def test_limit_never_exceeds_the_maximum(clock: FakeClock) -> None:
+    limit = AdaptiveLimit(8, smoothing=1.0)
+    for _ in range(50):
+        limit.observe(0.01, ok=True, in_flight=limit.value)
+    assert limit.value == 8
+
+
+def test_limit_shrinks_when_latency_climbs_past_tolerance(clock: FakeClock) -> None:
+    limit = AdaptiveLimit(16, tolerance=2.0, smoothing=1.0)
+    for _ in range(20):
+        limit.observe(0.01, ok=True, in_flight=limit.value)
+    grown = limit.value
+
+    for _ in range(60):
+        limit.observe(0.2, ok=True, in_flight=limit.value)
+
+    assert limit.value < grown
+    assert limit.value == 1
+
+
+def test_failure_backs_off_once_per_burst(clock: FakeClock) -> None:
+    limit = AdaptiveLimit(16, backoff=0.5, smoothing=1.0)
+    for _ in range(20):
+        limit.observe(0.01, ok=True, in_flight=limit.value)
+    assert limit.value == 16
+
+    limit.observe(0.01, ok=False, in_flight=16)
+    assert limit.value == 8
+    # The rest of the burst lands inside the hold period.
+    limit.observe(0.01, ok=False, in_flight=16)
+    assert limit.value == 8
+
+    clock.now += 1.0
+    limit.observe(0.01, ok=False, in_flight=16)
+    assert limit.value == 4
+    assert limit.stats()["decreases"] == 2
+    assert limit.stats()["errors"] == 3
+
+
+def test_failures_never_go_below_the_minimum(clock: FakeClock) -> None:
+    limit = AdaptiveLimit(16, min_limit=2, backoff=0.1)
+    for _ in range(10):
+        clock.now += 1.0
+        limit.observe(0.01, ok=False, in_flight=2)
+    assert limit.value == 2
+
+
+def trip(breaker: CircuitBreaker, failures: int) -> None:
+    for _ in range(failures):
+        breaker.record(False)
+
+
+def test_breaker_stays_closed_below_min_requests(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(min_requests=10)
+    trip(breaker, 9)
+    assert breaker.state == CLOSED
+    assert breaker.acquire() == 0.0
+
+
+def test_breaker_stays_closed_below_failure_rate(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=10, window=20)
+    for _ in range(20):
+        breaker.record(True)
+        breaker.record(True)
+        breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_opens_at_failure_rate_and_holds_callers(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(failure_rate=0.5, min_requests=4, window=10, open_seconds=10.0)
+    breaker.record(True)
+    breaker.record(True)
+    trip(breaker, 2)
+
+    assert breaker.state == OPEN
+    assert breaker.acquire() == pytest.approx(10.0)
+    clock.now += 4.0
+    assert breaker.acquire() == pytest.approx(6.0)
+    assert breaker.stats()["trips"] == 1
+
+
+def test_breaker_ignores_results_of_sends_started_before_it_opened(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(min_requests=2, open_seconds=10.0)
+    trip(breaker, 2)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert breaker.stats()["trips"] == 1
+
+
+def test_half_open_lets_one_trial_through_at_a_time(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(min_requests=2, open_seconds=10.0)
+    trip(breaker, 2)
+    clock.now += 10.0
+
+    assert breaker.acquire() == 0.0
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire() > 0
+    breaker.record(True)
+    assert breaker.acquire() == 0.0
+    assert breaker.stats()["probes"] == 2
+
+
+def test_half_open_closes_after_enough_successful_probes(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(min_requests=2, open_seconds=10.0, probes=3)
+    trip(breaker, 2)
+    clock.now += 10.0
+
+    for _ in range(3):
+        assert breaker.acquire() == 0.0
+        breaker.record(True)
+
+    assert breaker.state == CLOSED
+    # A fresh window: one failure right after recovery does not reopen it.
+    breaker.record(False)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens_for_twice_as_long_up_to_the_cap(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(min_requests=2, open_seconds=10.0, max_open_seconds=30.0)
+    trip(breaker, 2)
+
+    waits = []
+    for _ in range(3):
+        clock.now += breaker.acquire()
+        assert breaker.acquire() == 0.0
+        breaker.record(False)
+        assert breaker.state == OPEN
+        waits.append(breaker.acquire())
+
+    assert waits == [pytest.approx(20.0), pytest.approx(30.0), pytest.approx(30.0)]
+
+
+def test_successful_recovery_resets_the_open_period(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(min_requests=2, open_seconds=10.0, probes=1)
+    trip(breaker, 2)
+    clock.now += 10.0
+    breaker.acquire()
+    breaker.record(False)
+    clock.now += 20.0
+    breaker.acquire()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+
+    trip(breaker, 2)
+    assert breaker.acquire() == pytest.approx(10.0)
+
+
+def test_abandoned_trial_does_not_block_recovery(clock: FakeClock) -> None:
+    breaker = CircuitBreaker(min_requests=2, open_seconds=10.0)
+    trip(breaker, 2)
+    clock.now += 10.0
+    assert breaker.acquire() == 0.0
+
+    # The trial never reached the relay, so nothing is recorded for it.
+    clock.now += 10.0
+    assert breaker.acquire() == 0.0
+    assert breaker.state == HALF_OPEN
+
+
+def test_routed_relays_get_their_own_breaker(clock: FakeClock, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "smtp_breaker_enabled", True)
+    monkeypatch.setattr(settings, "smtp_breaker_min_requests", 2)
+    monkeypatch.setattr(settings, "smtp_domain_routes", "gmail.com=relay-a:587,yahoo.com=relay-b:587")
+    sender = EmailSender()
+    routed = sender.pool_for("user@gmail.com")
+
+    assert routed is not sender.smtp_pool
+    assert routed.breaker is not None and routed.breaker is not sender.breaker
+    trip(routed.breaker, 2)
+
+    assert sender.relay_wait("user@gmail.com") > 0
+    assert sender.relay_wait("user@yahoo.com") == 0.0
+    assert sender.breaker.state == CLOSED
+    # The default relay's breaker is left to the consumer, which pauses instead of deferring.
+    trip(sender.breaker, 2)
+    assert sender.relay_wait("user@example.com") == 0.0
@@ -0,0 +1,212 @@
+import json
+import uuid
+
+import pytest
+
+from app.models.envelope import CampaignEnvelope, Envelope, EnvelopeError, compile_schema, decode_envelope
+
+REQUEST_ID = "5d6c9852-ed1f-4ba9-a35b-44db68d89b58"
+
+
+def message(**changes):
+    data = {
+        "request_id": REQUEST_ID,
+        "correlation_id": "corr-1",
+        "created_at": "2024-05-01T12:00:00Z",
+        "channel": "email",
+        "user": {"id": str(uuid.uuid4()), "email": "ada@example.com", "locale": "en"},
+        "template": {"slug": "welcome", "version": 2},
+        "variables": {"name": "Ada"},
+        "retry_count": 0,
+    }
+    data.update(changes)
+    return data
+
+
+def campaign(**changes):
+    data = {
+        "request_id": REQUEST_ID,
+        "correlation_id": "corr-1",
+        "created_at": "2024-05-01T12:00:00Z",
+        "channel": "email",
+        "template": {"slug": "newsletter"},
+        "variables": {"issue": 12},
+        "recipients": [
+            {"request_id": str(uuid.uuid4()), "email": "ada@example.com", "variables": {"name": "Ada"}},
+            {"request_id": str(uuid.uuid4()), "email": "alan@example.com", "locale": "en-GB"},
+        ],
+        "retry_count": 0,
+    }
+    data.update(changes)
+    return data
+
+
+def encode(data) -> bytes:
+    return json.dumps(data).encode()
+
+
+def decode_error(data) -> EnvelopeError:
+    with pytest.raises(EnvelopeError) as info:
+        decode_envelope(encode(data))
+    return info.value
+
+
+def test_decodes_a_message():
+    envelope = decode_envelope(encode(message()))
+    assert isinstance(envelope, Envelope)
+    assert envelope.request_id == REQUEST_ID
+    assert envelope.user.email == "ada@example.com"
+    assert envelope.user.locale == "en"
+    assert envelope.template.slug == "welcome"
+    assert envelope.template.version == 2
+    assert envelope.variables == {"name": "Ada"}
+    assert envelope.retry_count == 0
+
+
+@pytest.mark.parametrize(
+    "created_at",
+    [
+        # Go's time.Time marshals with nanoseconds and a Z or numeric offset.
+        "2024-05-01T12:00:00.123456789Z",
+        "2024-05-01T12:00:00.1234567+05:30",
+        "2024-05-01T12:00:00Z",
+        "2024-05-01T12:00:00.5-07:00",
+    ],
+)
+def test_accepts_go_time_strings(created_at):
+    assert decode_envelope(encode(message(created_at=created_at))).created_at == created_at
+
+
+def test_rejects_a_bad_created_at():
+    error = decode_error(message(created_at="yesterday"))
+    assert error.path == ".created_at"
+
+
+@pytest.mark.parametrize("field", ["request_id", "created_at", "user", "template", "variables", "retry_count"])
+def test_missing_required_field(field):
+    data = message()
+    del data[field]
+    error = decode_error(data)
+    assert error.path == ""
+    assert repr(field) in error.message
+
+
+def test_missing_nested_required_field_has_a_path():
+    error = decode_error(message(user={"id": str(uuid.uuid4())}))
+    assert error.path == ".user"
+    assert "'email'" in error.message
+
+
+def test_optional_fields_may_be_null():
+    data = message(provider_overrides=None, template={"slug": "welcome", "locale": None, "version": None})
+    envelope = decode_envelope(encode(data))
+    assert envelope.provider_overrides == {}
+    assert envelope.template.locale is None
+
+
+def test_required_fields_may_not_be_null():
+    error = decode_error(message(variables=None))
+    assert error.path == ".variables"
+    assert "expected object" in error.message
+
+
+def test_bool_is_not_an_integer():
+    error = decode_error(message(retry_count=True))
+    assert error.path == ".retry_count"
+    assert "got bool" in error.message
+
+
+def test_integer_minimum():
+    error = decode_error(message(retry_count=-1))
+    assert error.path == ".retry_count"
+
+
+def test_enum_and_formats():
+    assert decode_error(message(channel="sms")).path == ".channel"
+    assert decode_error(message(request_id="not-a-uuid")).path == ".request_id"
+    assert decode_error(message(user={"id": str(uuid.uuid4()), "email": "nobody"})).path == ".user.email"
+
+
+def test_error_path_through_arrays():
+    user = {"id": str(uuid.uuid4()), "email": "ada@example.com", "push_tokens": [{"token": "t", "platform": "tv"}]}
+    error = decode_error(message(user=user))
+    assert error.path == ".user.push_tokens[0].platform"
+    assert str(error).startswith("$.user.push_tokens[0].platform: ")
+
+
+def test_error_keeps_the_request_id():
+    assert decode_error(message(channel="sms")).request_id == REQUEST_ID
+    data = message(channel="sms", request_id=42)
+    with pytest.raises(EnvelopeError) as info:
+        decode_envelope(encode(data))
+    assert info.value.request_id is None
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"\xff\xfe", b"[1, 2]", b'"text"'])
+def test_rejects_non_objects(body):
+    with pytest.raises(EnvelopeError):
+        decode_envelope(body)
+
+
+def test_decodes_a_campaign():
+    envelope = decode_envelope(encode(campaign()))
+    assert isinstance(envelope, CampaignEnvelope)
+    assert [recipient.email for recipient in envelope.recipients] == ["ada@example.com", "alan@example.com"]
+    assert envelope.recipients[0].variables == {"name": "Ada"}
+    assert envelope.recipients[1].locale == "en-GB"
+    assert envelope.variables == {"issue": 12}
+
+
+def test_campaign_recipient_errors_have_a_path():
+    data = campaign()
+    data["recipients"][1]["email"] = "nobody"
+    assert decode_error(data).path == ".recipients[1].email"
+    data = campaign()
+    del data["recipients"][0]["request_id"]
+    assert decode_error(data).path == ".recipients[0]"
+
+
+def test_campaign_without_recipients_is_valid():
+    assert decode_envelope(encode(campaign(recipients=[]))).recipients == []
+
+
+def test_to_dict_applies_changes_without_touching_raw():
+    envelope = decode_envelope(encode(message()))
+    retry = envelope.to_dict(retry_count=1)
+    assert retry["retry_count"] == 1
+    assert envelope.raw["retry_count"] == 0
+
+
+def test_compile_schema_union_types_and_additional_properties():
+    check = compile_schema(
+        {
+            "type": "object",
+            "properties": {"count": {"type": ["integer", "null"]}, "flag": {"type": ["boolean", "integer"]}},
+            "additionalProperties": {"type": "string"},
+        }
+    )
+    check({"count": None, "flag": True, "extra": "x"})
+    check({"count": 3, "flag": 1})
+    with pytest.raises(EnvelopeError) as info:
+        check({"extra": 1})
+    assert info.value.path == ".extra"
+    with pytest.raises(EnvelopeError):
+        check({"count": 1.5})
+
+
+def test_compile_schema_closed_objects():
+    check = compile_schema({"type": "object", "properties": {"a": {"type": "string"}}, "additionalProperties": False})
+    check({"a": "x"})
+    with pytest.raises(EnvelopeError) as info:
+        check({"a": "x", "b": 1})
+    assert "'b'" in info.value.message
+
+
+def test_compile_schema_number_accepts_ints_but_not_bools():
+    check = compile_schema({"type": "number", "minimum": 0})
+    check(1)
+    check(0.5)
+    with pytest.raises(EnvelopeError):
+        check(False)
+    with pytest.raises(EnvelopeError):
+        check(-0.5)
@@ -0,0 +1,132 @@
+from collections import Counter
+
+import pytest
+
+from app.consumers import lanes as lanes_module
+from app.consumers.lanes import Lane, LaneScheduler, PendingDelivery
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(lanes_module.time, "monotonic", clock)
+    return clock
+
+
+def fill(scheduler: LaneScheduler, lane: Lane, count: int) -> None:
+    for tag in range(count):
+        scheduler.push(PendingDelivery(lane, None, tag, b""))
+
+
+def drain(scheduler: LaneScheduler, count: int) -> Counter:
+    return Counter(scheduler.pop().lane.name for _ in range(count))
+
+
+@pytest.mark.parametrize("weights", [(1, 1), (3, 1), (4, 1), (2, 3)])
+def test_backlogged_lanes_share_pops_by_weight(clock: FakeClock, weights: tuple) -> None:
+    high = Lane("transactional", "q.high", weight=weights[0])
+    low = Lane("bulk", "q.low", weight=weights[1])
+    scheduler = LaneScheduler([high, low])
+    fill(scheduler, high, 1000)
+    fill(scheduler, low, 1000)
+
+    rounds = sum(weights) * 50
+    counts = drain(scheduler, rounds)
+
+    assert counts["transactional"] == pytest.approx(rounds * weights[0] / sum(weights), abs=1)
+    assert counts["bulk"] == pytest.approx(rounds * weights[1] / sum(weights), abs=1)
+
+
+def test_low_weight_lane_is_not_starved(clock: FakeClock) -> None:
+    high = Lane("transactional", "q.high", weight=100)
+    low = Lane("bulk", "q.low", weight=1)
+    scheduler = LaneScheduler([high, low])
+    fill(scheduler, high, 500)
+    fill(scheduler, low, 5)
+
+    assert drain(scheduler, 202)["bulk"] >= 2
+
+
+def test_empty_scheduler_pops_none(clock: FakeClock) -> None:
+    scheduler = LaneScheduler([Lane("standard", "q")])
+    assert scheduler.pop() is None
+    assert len(scheduler) == 0
+
+
+def test_empty_lane_is_skipped(clock: FakeClock) -> None:
+    high = Lane("transactional", "q.high", weight=10)
+    low = Lane("bulk", "q.low", weight=1)
+    scheduler = LaneScheduler([high, low])
+    fill(scheduler, low, 3)
+
+    assert [scheduler.pop().lane.name for _ in range(3)] == ["bulk"] * 3
+    assert scheduler.pop() is None
+
+
+def test_idle_lane_does_not_bank_credit(clock: FakeClock) -> None:
+    high = Lane("transactional", "q.high", weight=1)
+    low = Lane("bulk", "q.low", weight=1)
+    scheduler = LaneScheduler([high, low])
+    fill(scheduler, low, 200)
+    drain(scheduler, 100)
+
+    # Idle while bulk ran 100 deliveries; it rejoins at the current virtual time, not 100 ahead.
+    fill(scheduler, high, 100)
+    counts = drain(scheduler, 20)
+
+    assert counts["transactional"] == pytest.approx(10, abs=1)
+
+
+def test_budget_expedites_the_oldest_delivery(clock: FakeClock) -> None:
+    high = Lane("transactional", "q.high", weight=1, budget=2.0)
+    low = Lane("bulk", "q.low", weight=1)
+    scheduler = LaneScheduler([high, low])
+    fill(scheduler, high, 3)
+    fill(scheduler, low, 50)
+    # Within budget the lanes alternate by weight.
+    assert [scheduler.pop().lane.name for _ in range(2)] == ["transactional", "bulk"]
+
+    clock.now += 1.0  # half the budget
+    assert [scheduler.pop().lane.name for _ in range(2)] == ["transactional", "transactional"]
+    assert scheduler.stats()["transactional_expedited"] == 2
+
+
+def test_budget_jumps_follow_lane_priority(clock: FakeClock) -> None:
+    first = Lane("transactional", "q.first", weight=1, budget=2.0)
+    second = Lane("notifications", "q.second", weight=1, budget=2.0)
+    scheduler = LaneScheduler([first, second])
+    fill(scheduler, second, 1)
+    fill(scheduler, first, 1)
+    clock.now += 5.0
+
+    assert [scheduler.pop().lane.name for _ in range(2)] == ["transactional", "notifications"]
+
+
+def test_lane_without_budget_is_never_expedited(clock: FakeClock) -> None:
+    low = Lane("bulk", "q.low", weight=1)
+    scheduler = LaneScheduler([low])
+    fill(scheduler, low, 1)
+    clock.now += 3600.0
+
+    scheduler.pop()
+    assert scheduler.stats()["bulk_expedited"] == 0
+
+
+def test_clear_returns_buffered_deliveries(clock: FakeClock) -> None:
+    high = Lane("transactional", "q.high")
+    low = Lane("bulk", "q.low")
+    scheduler = LaneScheduler([high, low])
+    fill(scheduler, high, 2)
+    fill(scheduler, low, 3)
+
+    assert len(scheduler.clear()) == 5
+    assert len(scheduler) == 0
+    assert scheduler.pop() is None
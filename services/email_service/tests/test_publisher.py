@@ -0,0 +1,283 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import pika
+import pytest
+from pika.spec import Basic
+
+from app import main
+from app.services.publisher import ConfirmChannel, EnvelopePublisher, PublishError
+
+
+class FakeChannel:
+    def __init__(self) -> None:
+        self.published: List[str] = []
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties: Any, mandatory: bool) -> None:
+        assert mandatory
+        self.published.append(properties.message_id)
+
+
+class Frame:
+    def __init__(self, method: Any) -> None:
+        self.method = method
+
+
+def ack(tag: int, multiple: bool = False) -> Frame:
+    return Frame(Basic.Ack(delivery_tag=tag, multiple=multiple))
+
+
+def nack(tag: int, multiple: bool = False) -> Frame:
+    return Frame(Basic.Nack(delivery_tag=tag, multiple=multiple))
+
+
+@pytest.fixture
+def loop() -> Any:
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def publish(channel: ConfirmChannel, loop: asyncio.AbstractEventLoop, count: int) -> List[asyncio.Future]:
+    futures = []
+    for index in range(count):
+        future = loop.create_future()
+        channel.publish("email_queue", b"{}", pika.BasicProperties(message_id=f"m{index + 1}"), future)
+        futures.append(future)
+    return futures
+
+
+def test_tags_follow_publish_order(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    publish(channel, loop, 3)
+    assert list(channel.pending) == [1, 2, 3]
+    assert channel.channel.published == ["m1", "m2", "m3"]
+
+
+def test_single_ack_settles_only_its_message(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 3)
+
+    channel.on_confirm(ack(2))
+
+    assert [future.done() for future in futures] == [False, True, False]
+    assert futures[1].result() is None
+    assert list(channel.pending) == [1, 3]
+
+
+def test_multiple_ack_settles_everything_up_to_its_tag(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 5)
+
+    channel.on_confirm(ack(3, multiple=True))
+
+    assert [future.done() for future in futures] == [True, True, True, False, False]
+    assert all(future.result() is None for future in futures[:3])
+    assert list(channel.pending) == [4, 5]
+    assert channel.confirm_frames == 1
+
+
+def test_multiple_ack_skips_messages_already_settled(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 4)
+
+    channel.on_confirm(ack(2))
+    channel.on_confirm(ack(4, multiple=True))
+
+    assert all(future.done() and future.result() is None for future in futures)
+    assert not channel.pending
+    assert channel.confirm_frames == 2
+
+
+def test_multiple_nack_fails_every_message_it_covers(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 3)
+
+    channel.on_confirm(nack(2, multiple=True))
+
+    for future in futures[:2]:
+        with pytest.raises(PublishError, match="rejected"):
+            future.result()
+    assert not futures[2].done()
+
+
+def test_returned_message_fails_although_acked(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 2)
+
+    channel.on_return(channel.channel, None, pika.BasicProperties(message_id="m1"), b"{}")
+    channel.on_confirm(ack(2, multiple=True))
+
+    with pytest.raises(PublishError, match="no queue"):
+        futures[0].result()
+    assert futures[1].result() is None
+
+
+def test_confirm_after_caller_timed_out_is_dropped(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 2)
+    futures[0].cancel()
+
+    channel.on_confirm(ack(2, multiple=True))
+
+    assert futures[0].cancelled()
+    assert futures[1].result() is None
+    assert not channel.pending
+
+
+def test_unknown_tag_is_ignored(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 1)
+
+    channel.on_confirm(ack(7))
+
+    assert not futures[0].done()
+    assert list(channel.pending) == [1]
+
+
+def test_fail_pending_fails_every_unconfirmed_message(loop: asyncio.AbstractEventLoop) -> None:
+    channel = ConfirmChannel(FakeChannel())
+    futures = publish(channel, loop, 3)
+    channel.on_confirm(ack(1))
+
+    channel.fail_pending("channel closed")
+
+    assert futures[0].result() is None
+    for future in futures[1:]:
+        with pytest.raises(PublishError, match="channel closed"):
+            future.result()
+    assert not channel.pending
+
+
+class OpenableChannel(FakeChannel):
+    def __init__(self, is_open: bool = True) -> None:
+        super().__init__()
+        self.is_open = is_open
+
+
+def publisher_with(*channels: OpenableChannel) -> EnvelopePublisher:
+    publisher = EnvelopePublisher("amqp://unused", "email_queue", channels=2, confirm_timeout=0.1)
+    publisher._channels = [ConfirmChannel(channel) for channel in channels]
+    opens = []
+
+    async def failing_open() -> None:
+        opens.append(1)
+        raise PublishError("could not connect")
+
+    publisher._open = failing_open
+    publisher.opens = opens
+    return publisher
+
+
+def test_failed_top_up_still_uses_the_open_channel() -> None:
+    survivor = OpenableChannel()
+    publisher = publisher_with(survivor, OpenableChannel(is_open=False))
+
+    async def pick() -> Any:
+        channel = await publisher._channel()
+        await publisher._top_up_task
+        return channel
+
+    assert asyncio.run(pick()).channel is survivor
+    assert publisher.opens == [1]
+
+
+def test_no_open_channel_fails_the_publish() -> None:
+    publisher = publisher_with(OpenableChannel(is_open=False))
+
+    with pytest.raises(PublishError, match="could not connect"):
+        asyncio.run(publisher._channel())
+    # Failing fast for a moment instead of redialling per request.
+    with pytest.raises(PublishError, match="not retrying yet"):
+        asyncio.run(publisher._channel())
+    assert publisher.opens == [1]
+
+
+class FakePublisher:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+
+    async def publish(self, body: bytes, message_id: str, correlation_id: str) -> None:
+        if self.fail:
+            raise PublishError("broker down")
+
+
+class FakeStatusStore:
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.error = error
+        self.rows: Dict[str, str] = {}
+        self.created_at: List[Optional[str]] = []
+
+    def add_statuses(self, updates: List[Tuple[str, str, str, Optional[str]]], created_at: Optional[str] = None) -> None:
+        if self.error is not None:
+            raise self.error
+        self.created_at.append(created_at)
+        for request_id, status, provider, detail in updates:
+            self.rows.setdefault(request_id, status)
+
+
+@pytest.fixture
+def store(monkeypatch: pytest.MonkeyPatch) -> FakeStatusStore:
+    store = FakeStatusStore()
+    monkeypatch.setattr(main.app.state, "envelope_publisher", FakePublisher(), raising=False)
+    monkeypatch.setattr(main.app.state, "status_store", store, raising=False)
+    return store
+
+
+def email_request() -> main.EmailRequest:
+    return main.EmailRequest(recipient_email="user@example.com", template_id="welcome", subject="Hi", variables={})
+
+
+async def settled(call: Any) -> Any:
+    """Await an enqueue call, then the queued-status writes it left running."""
+    result = await call
+    if main._status_writes:
+        await asyncio.wait(set(main._status_writes))
+    return result
+
+
+def test_enqueue_writes_a_queued_status(store: FakeStatusStore) -> None:
+    code, response = asyncio.run(settled(main._enqueue("/send-email", email_request(), None, None)))
+
+    assert code == 202
+    assert store.rows == {response.request_id: "queued"}
+
+
+def test_enqueue_answers_before_the_status_write(store: FakeStatusStore) -> None:
+    async def call() -> Tuple[int, Any]:
+        result = await main._enqueue("/send-email", email_request(), None, None)
+        # The row is still being written when the reply is ready.
+        assert main._status_writes and store.rows == {}
+        return result
+
+    code, _ = asyncio.run(settled(call()))
+    assert code == 202
+
+
+def test_failed_status_write_still_queues(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main.app.state, "envelope_publisher", FakePublisher(), raising=False)
+    monkeypatch.setattr(main.app.state, "status_store", FakeStatusStore(error=TimeoutError("pool")), raising=False)
+
+    code, response = asyncio.run(settled(main._enqueue("/send-email", email_request(), None, None)))
+
+    assert code == 202 and response.success
+
+
+def test_unconfirmed_enqueue_writes_no_status(store: FakeStatusStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main.app.state, "envelope_publisher", FakePublisher(fail=True))
+
+    code, _ = asyncio.run(settled(main._enqueue("/send-email", email_request(), None, None)))
+
+    assert code == 503
+    assert store.rows == {}
+
+
+def test_batch_writes_queued_statuses_together(store: FakeStatusStore) -> None:
+    batch = main.BatchEmailRequest(emails=[email_request() for _ in range(3)])
+
+    response = asyncio.run(settled(main._enqueue_batch(batch, None)))
+
+    assert response.status_code == 202
+    assert len(store.rows) == 3 and set(store.rows.values()) == {"queued"}
+    # One write, with the created_at (partition key) every envelope carries.
+    assert len(store.created_at) == 1
@@ -0,0 +1,96 @@
+import asyncio
+
+import aiosmtplib
+import httpx
+import psycopg2
+import pytest
+
+from app.clients.template_client import TemplateNotFoundError
+from app.consumers.retry import PERMANENT, TRANSIENT, PermanentDeliveryError, RetryPolicy, classify
+
+
+def http_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "http://templates/welcome")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def refused(*codes: int) -> aiosmtplib.SMTPRecipientsRefused:
+    return aiosmtplib.SMTPRecipientsRefused(
+        [aiosmtplib.SMTPRecipientRefused(code, "refused", f"user{code}@example.com") for code in codes]
+    )
+
+
+@pytest.mark.parametrize(
+    "exc, expected",
+    [
+        (PermanentDeliveryError("bad envelope"), PERMANENT),
+        (TemplateNotFoundError("welcome"), PERMANENT),
+        (ValueError("bad variable"), PERMANENT),
+        (KeyError("name"), PERMANENT),
+        (aiosmtplib.SMTPDataError(451, "try later"), TRANSIENT),
+        (aiosmtplib.SMTPDataError(554, "rejected"), PERMANENT),
+        (aiosmtplib.SMTPAuthenticationError(535, "bad credentials"), TRANSIENT),
+        (refused(550, 553), PERMANENT),
+        (refused(550, 450), TRANSIENT),
+        (aiosmtplib.SMTPServerDisconnected("gone"), TRANSIENT),
+        (http_error(404), PERMANENT),
+        (http_error(429), TRANSIENT),
+        (http_error(408), TRANSIENT),
+        (http_error(503), TRANSIENT),
+        (httpx.ConnectError("refused"), TRANSIENT),
+        (psycopg2.OperationalError("server closed the connection"), TRANSIENT),
+        (asyncio.TimeoutError(), TRANSIENT),
+        (ConnectionResetError(), TRANSIENT),
+        (RuntimeError("unknown"), TRANSIENT),
+    ],
+)
+def test_classify(exc, expected):
+    assert classify(exc) == expected
+
+
+def test_delays_grow_and_are_capped():
+    policy = RetryPolicy("email.queue", max_retries=5, base_delay=5, multiplier=3, max_delay=60)
+    assert [tier.delay for tier in policy.tiers] == [5, 15, 45, 60, 60]
+    assert [tier.queue for tier in policy.tiers[:2]] == ["email.queue.retry.5000ms", "email.queue.retry.15000ms"]
+
+
+def test_capped_delays_share_a_queue():
+    policy = RetryPolicy("email.queue", max_retries=5, base_delay=5, multiplier=3, max_delay=60)
+    assert [tier.queue for tier in policy.queues] == [
+        "email.queue.retry.5000ms",
+        "email.queue.retry.15000ms",
+        "email.queue.retry.45000ms",
+        "email.queue.retry.60000ms",
+    ]
+
+
+def test_tier_dead_letters_back_to_its_work_queue():
+    tier = RetryPolicy("email.bulk", max_retries=1, base_delay=2).tiers[0]
+    assert tier.arguments == {
+        "x-message-ttl": 2000,
+        "x-dead-letter-exchange": "",
+        "x-dead-letter-routing-key": "email.bulk",
+    }
+
+
+def test_tier_for_stops_after_max_retries():
+    policy = RetryPolicy("email.queue", max_retries=3, base_delay=1, multiplier=2, max_delay=60)
+    assert [policy.tier_for(count).delay for count in range(3)] == [1, 2, 4]
+    assert policy.tier_for(3) is None
+    assert policy.tier_for(-1) is None
+
+
+def test_tier_for_delay_picks_the_shortest_queue_that_waits_long_enough():
+    policy = RetryPolicy("email.queue", max_retries=3, base_delay=1, multiplier=2, max_delay=60)
+    assert policy.tier_for_delay(0).delay == 1
+    assert policy.tier_for_delay(1.5).delay == 2
+    assert policy.tier_for_delay(4).delay == 4
+    # Longer than any queue: the longest one.
+    assert policy.tier_for_delay(100).delay == 4
+
+
+def test_no_retries_configured():
+    policy = RetryPolicy("email.queue", max_retries=0)
+    assert policy.tiers == []
+    assert policy.tier_for(0) is None
+    assert policy.tier_for_delay(1) is None
@@ -0,0 +1,165 @@
+import os
+
+import pytest
+
+from app.services.spool import HEADER, Spool, SpoolFull, adopt_orphaned_spools, open_spool
+
+
+def record(index: int, size: int = 0):
+    return {"request_id": f"req-{index}", "body": "x" * size}
+
+
+def read_ids(spool: Spool, limit: int = 100):
+    return [item["request_id"] for _, item in spool.read(limit)]
+
+
+def segments(directory):
+    return sorted(path.name for path in directory.glob("*.seg"))
+
+
+def test_append_read_commit(tmp_path):
+    spool = Spool(tmp_path)
+    for index in range(3):
+        spool.append(record(index))
+    assert spool.stats()["pending_records"] == 3
+
+    batch = spool.read(2)
+    assert [item["request_id"] for _, item in batch] == ["req-0", "req-1"]
+    # Reading does not move the cursor.
+    assert read_ids(spool) == ["req-0", "req-1", "req-2"]
+
+    spool.commit(batch[0][0])
+    assert read_ids(spool) == ["req-1", "req-2"]
+    assert spool.stats()["pending_records"] == 2
+    spool.close()
+
+
+def test_commit_counts_every_record_it_passes(tmp_path):
+    spool = Spool(tmp_path)
+    for index in range(5):
+        spool.append(record(index))
+    batch = spool.read(5)
+    spool.commit(batch[3][0])
+    assert spool.stats()["pending_records"] == 1
+    assert spool.stats()["replayed"] == 4
+    # Committing an older position again changes nothing.
+    spool.commit(batch[1][0])
+    assert spool.stats()["pending_records"] == 1
+    spool.close()
+
+
+def test_full_spool_rejects_appends(tmp_path):
+    spool = Spool(tmp_path, max_bytes=200)
+    spool.append(record(0, 100))
+    with pytest.raises(SpoolFull):
+        spool.append(record(1, 100))
+    assert spool.stats()["rejected_full"] == 1
+    spool.close()
+
+
+def test_replayed_segments_are_deleted(tmp_path):
+    spool = Spool(tmp_path, segment_bytes=200)
+    for index in range(6):
+        spool.append(record(index, 100))
+    assert len(segments(tmp_path)) > 3
+    for position, _ in spool.read(100):
+        spool.commit(position)
+    # Only the active segment is left.
+    assert len(segments(tmp_path)) == 1
+    assert spool.stats()["bytes"] == 0
+    assert spool.stats()["pending_records"] == 0
+    spool.close()
+
+
+def test_reopen_resumes_after_the_cursor(tmp_path):
+    spool = Spool(tmp_path)
+    for index in range(4):
+        spool.append(record(index))
+    batch = spool.read(2)
+    spool.commit(batch[1][0])
+    spool.close()
+
+    reopened = Spool(tmp_path)
+    assert reopened.stats()["pending_records"] == 2
+    assert read_ids(reopened) == ["req-2", "req-3"]
+    reopened.append(record(4))
+    assert read_ids(reopened) == ["req-2", "req-3", "req-4"]
+    reopened.close()
+
+
+def test_torn_tail_is_truncated_on_open(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(record(0))
+    spool.append(record(1))
+    spool.close()
+    last = sorted(tmp_path.glob("*.seg"))[-1]
+    with open(last, "ab") as handle:
+        handle.write(HEADER.pack(1000, 0) + b"{\"request_id\"")
+
+    reopened = Spool(tmp_path)
+    assert read_ids(reopened) == ["req-0", "req-1"]
+    assert reopened.stats()["pending_records"] == 2
+    reopened.close()
+
+
+def test_corrupt_record_skips_the_rest_of_its_segment(tmp_path):
+    spool = Spool(tmp_path)
+    for index in range(3):
+        spool.append(record(index))
+    spool.close()
+    reopened = Spool(tmp_path)
+    reopened.append(record(3))
+    # Flip a byte inside the second record's payload of the (no longer active) first segment.
+    segment = sorted(path for path in tmp_path.glob("*.seg") if path.stat().st_size)[0]
+    data = bytearray(segment.read_bytes())
+    first_length, _ = HEADER.unpack_from(data, 0)
+    data[HEADER.size + first_length + HEADER.size + 2] ^= 0xFF
+    segment.write_bytes(bytes(data))
+
+    batch = reopened.read(100)
+    assert [item["request_id"] for _, item in batch] == ["req-0"]
+    reopened.commit(batch[0][0])
+    # Nothing outstanding before the bad record: the segment is dropped and replay moves on.
+    assert read_ids(reopened) == []
+    assert read_ids(reopened) == ["req-3"]
+    assert reopened.stats()["corrupt_records"] == 1
+    assert reopened.stats()["pending_records"] == 1
+    reopened.close()
+
+
+def test_slots_are_exclusive(tmp_path):
+    first = open_spool(str(tmp_path))
+    second = open_spool(str(tmp_path))
+    assert first.directory.name == "slot-0"
+    assert second.directory.name == "slot-1"
+    first.close()
+    again = open_spool(str(tmp_path))
+    assert again.directory.name == "slot-0"
+    second.close()
+    again.close()
+
+
+def test_orphaned_slots_with_records_are_adopted(tmp_path):
+    own = open_spool(str(tmp_path))
+    orphan = open_spool(str(tmp_path))
+    empty = open_spool(str(tmp_path))
+    orphan.append(record(0))
+    orphan.close()
+    empty.close()
+
+    adopted = adopt_orphaned_spools(str(tmp_path))
+    assert [spool.directory.name for spool in adopted] == ["slot-1"]
+    assert read_ids(adopted[0]) == ["req-0"]
+    # Adopted slots stay locked until they are closed.
+    assert open_spool(str(tmp_path)).directory.name == "slot-2"
+    for spool in adopted:
+        spool.close()
+    own.close()
+
+
+def test_read_only_returns_synced_records(tmp_path):
+    spool = Spool(tmp_path)
+    spool.append(record(0))
+    os.write(spool._fd, b"\x00" * 3)
+    assert read_ids(spool) == ["req-0"]
+    spool.close()
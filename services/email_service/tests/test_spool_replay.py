@@ -0,0 +1,121 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import aiosmtplib
+import psycopg2
+import pytest
+
+from app.consumers.spool_replay import SpoolReplayer
+from app.services.spool import Spool
+
+
+class FakeStatusStore:
+    def __init__(self, lookup_error: Optional[Exception] = None) -> None:
+        self.lookup_error = lookup_error
+        self.statuses: Dict[str, str] = {}
+
+    def get_status(self, request_id: str) -> Optional[str]:
+        if self.lookup_error is not None:
+            raise self.lookup_error
+        return self.statuses.get(request_id)
+
+    def update_status(self, request_id, status, provider, detail=None, created_at=None) -> None:
+        self.statuses[request_id] = status
+
+
+class FakeSender:
+    def __init__(self, error: Optional[Exception] = None) -> None:
+        self.error = error
+        self.sent: List[str] = []
+
+    async def send_raw_email(self, to_email: str, subject: str, body: str, raise_on_error: bool = False) -> bool:
+        if self.error is not None:
+            raise self.error
+        self.sent.append(to_email)
+        return True
+
+
+def spooled(index: int = 0) -> dict:
+    return {
+        "request_id": f"req-{index}",
+        "to": f"user{index}@example.com",
+        "subject": "Hi",
+        "body": "Hello",
+        "spooled_at": time.time(),
+    }
+
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(tmp_path)
+    yield spool
+    spool.close()
+
+
+def replay(replayer: SpoolReplayer, sender: FakeSender, record: dict) -> bool:
+    return asyncio.run(replayer._replay(sender, record))
+
+
+def test_delivered_record_is_skipped(spool):
+    store = FakeStatusStore()
+    store.statuses["req-0"] = "delivered"
+    replayer = SpoolReplayer(spool, store)
+    sender = FakeSender()
+
+    assert replay(replayer, sender, spooled()) is True
+    assert sender.sent == []
+    assert replayer.stats()["skipped_duplicates"] == 1
+
+
+def test_status_lookup_failure_sends_anyway(spool):
+    store = FakeStatusStore(lookup_error=psycopg2.OperationalError("connection refused"))
+    replayer = SpoolReplayer(spool, store)
+    sender = FakeSender()
+
+    assert replay(replayer, sender, spooled()) is True
+    assert sender.sent == ["user0@example.com"]
+    assert replayer.stats()["delivered"] == 1
+
+
+def test_relay_outage_keeps_the_record_at_the_head(spool):
+    replayer = SpoolReplayer(spool, FakeStatusStore())
+
+    assert replay(replayer, FakeSender(aiosmtplib.SMTPConnectError("refused")), spooled()) is False
+    assert replayer.stats()["relay_failures"] == 1
+    assert spool.stats()["pending_records"] == 0
+
+
+def test_deferred_message_moves_to_the_tail(spool):
+    replayer = SpoolReplayer(spool, FakeStatusStore())
+
+    assert replay(replayer, FakeSender(aiosmtplib.SMTPDataError(451, "try later")), spooled()) is True
+    assert replayer.stats()["requeued"] == 1
+    assert spool.stats()["pending_records"] == 1
+
+
+def test_greylisted_recipient_moves_to_the_tail(spool):
+    replayer = SpoolReplayer(spool, FakeStatusStore())
+    refused = aiosmtplib.SMTPRecipientsRefused(
+        [aiosmtplib.SMTPRecipientRefused(450, "greylisted", "user0@example.com")]
+    )
+
+    assert replay(replayer, FakeSender(refused), spooled()) is True
+    stats = replayer.stats()
+    assert stats["requeued"] == 1
+    assert stats["relay_failures"] == 0
+    requeued = [item for _, item in spool.read(10)]
+    assert [item["request_id"] for item in requeued] == ["req-0"]
+    assert requeued[0]["attempts"] == 1
+
+
+def test_rejected_recipient_is_marked_failed(spool):
+    store = FakeStatusStore()
+    replayer = SpoolReplayer(spool, store)
+    refused = aiosmtplib.SMTPRecipientsRefused(
+        [aiosmtplib.SMTPRecipientRefused(550, "no such user", "user0@example.com")]
+    )
+
+    assert replay(replayer, FakeSender(refused), spooled()) is True
+    assert store.statuses["req-0"] == "failed"
+    assert replayer.stats()["requeued"] == 0
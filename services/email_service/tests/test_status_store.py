@@ -0,0 +1,73 @@
+import threading
+from typing import Any, List, Tuple
+
+import pytest
+
+from app.services.status_store import StatusStore
+
+
+class BufferedStore(StatusStore):
+    """A write-behind StatusStore without Postgres; flushed batches are recorded."""
+
+    def __init__(self, max_pending: int = 100) -> None:
+        self.write_behind = True
+        self.batch_size = 50
+        self.max_pending = max_pending
+        self.flush_interval = 1.0
+        self._pending = {}
+        self._inserts = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._collapsed = 0
+        self._inserts_dropped = 0
+        self.writes: List[Tuple[List[str], bool]] = []
+
+    def _write_batch(self, batch: Any, overwrite: bool = True) -> None:
+        self.writes.append(([f"{request_id}={row[0]}" for request_id, row in batch.items()], overwrite))
+
+
+@pytest.fixture
+def store() -> BufferedStore:
+    return BufferedStore()
+
+
+def test_added_rows_are_buffered_and_readable(store: BufferedStore) -> None:
+    store.add_statuses([("req-1", "queued", "email", None)], "2026-01-01T00:00:00+00:00")
+
+    assert store.writes == []
+    assert store.get_status("req-1") == "queued"
+    assert store.get_statuses(["req-1"]) == {"req-1": "queued"}
+
+
+def test_inserts_flush_before_updates_and_do_not_overwrite(store: BufferedStore) -> None:
+    store.add_statuses([("req-1", "queued", "email", None)])
+    store.update_status("req-2", "delivered", "email")
+
+    store.flush()
+
+    assert store.writes == [(["req-1=queued"], False), (["req-2=delivered"], True)]
+
+
+def test_update_replaces_a_buffered_insert_and_keeps_its_partition_key(store: BufferedStore) -> None:
+    store.add_statuses([("req-1", "queued", "email", None)], "2026-01-01T00:00:00+00:00")
+    store.update_status("req-1", "delivered", "email")
+
+    assert store.get_status("req-1") == "delivered"
+    assert store._pending["req-1"][4] is not None
+    store.flush()
+    assert store.writes == [(["req-1=delivered"], True)]
+
+
+def test_insert_does_not_shadow_a_buffered_update(store: BufferedStore) -> None:
+    store.update_status("req-1", "delivered", "email")
+    store.add_statuses([("req-1", "queued", "email", None)])
+
+    assert store.get_status("req-1") == "delivered"
+
+
+def test_full_buffer_drops_inserts_without_waiting() -> None:
+    store = BufferedStore(max_pending=2)
+    store.add_statuses([(f"req-{index}", "queued", "email", None) for index in range(3)])
+
+    assert len(store._inserts) == 2
+    assert store._inserts_dropped == 1
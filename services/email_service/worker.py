@@ -0,0 +1,9 @@
+import logging
+import sys
+
+from app.config.settings import settings
+from app.consumers.supervisor import ConsumerSupervisor
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s supervisor %(levelname)s %(name)s: %(message)s")
+    sys.exit(ConsumerSupervisor(settings.worker_processes).run())